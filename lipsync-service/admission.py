@@ -0,0 +1,136 @@
+"""Admission control for /speak and /lipsync: a bounded priority queue in front of rendering.
+
+At most RENDER_CONCURRENCY requests render at once (TTS through mux); the
+rest wait in one queue, interactive requests ahead of pre-renders and FIFO
+within a class. Instead of letting a burst pile up until everything times
+out, requests are turned away early, with a Retry-After estimated from the
+queue depth and recent render times:
+
+- pre-render: 429 once PRERENDER_QUEUE_LIMIT requests are already waiting,
+  so background work backs off first
+- interactive: 503 once RENDER_QUEUE_LIMIT requests are waiting
+- either: 503 after waiting RENDER_QUEUE_TIMEOUT seconds without a slot
+
+Time spent waiting is recorded as the "queue" stage (see timing.py), and the
+queue depth, active renders and rejections are exported on /metrics.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+import metrics
+import timing
+
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", "2"))
+RENDER_QUEUE_LIMIT = int(os.getenv("RENDER_QUEUE_LIMIT", "16"))
+PRERENDER_QUEUE_LIMIT = int(os.getenv("PRERENDER_QUEUE_LIMIT", "4"))
+RENDER_QUEUE_TIMEOUT = float(os.getenv("RENDER_QUEUE_TIMEOUT", "30"))
+MAX_RETRY_AFTER = 120
+
+PRIORITIES = {"interactive": 0, "prerender": 1}
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing; the handler answers status_code with Retry-After."""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class AdmissionQueue:
+    """Slots for concurrent renders, handed to waiters in (priority, arrival) order.
+
+    Only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, concurrency: int = RENDER_CONCURRENCY, queue_limit: int = RENDER_QUEUE_LIMIT,
+                 prerender_limit: int = PRERENDER_QUEUE_LIMIT, timeout: float = RENDER_QUEUE_TIMEOUT):
+        self.concurrency = max(concurrency, 1)
+        self.queue_limit = queue_limit
+        self.prerender_limit = prerender_limit
+        self.timeout = timeout
+        self.active = 0
+        self._heap: list[tuple[int, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._waiting = {name: 0 for name in PRIORITIES}
+        self._render_seconds = None  # moving average of slot hold time
+
+    @property
+    def depth(self) -> int:
+        return sum(self._waiting.values())
+
+    def retry_after(self) -> int:
+        """Seconds until the queue as it stands should have drained."""
+        per_render = self._render_seconds or 5.0
+        seconds = per_render * (self.depth + 1) / self.concurrency
+        return min(max(math.ceil(seconds), 1), MAX_RETRY_AFTER)
+
+    def _reject(self, priority: str, status_code: int, detail: str):
+        metrics.rejected.inc((priority, str(status_code)))
+        raise Overloaded(status_code, self.retry_after(), detail)
+
+    def _publish(self):
+        for name, n in self._waiting.items():
+            metrics.queue_depth.set((name,), n)
+        metrics.renders_active.set((), self.active)
+
+    async def _acquire(self, priority: str):
+        if self.active < self.concurrency and not self.depth:
+            self.active += 1
+            return
+        if priority == "prerender" and self.depth >= self.prerender_limit:
+            self._reject(priority, 429, f"Pre-render queue full ({self.depth} waiting)")
+        if self.depth >= self.queue_limit:
+            self._reject(priority, 503, f"Render queue full ({self.depth} waiting)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (PRIORITIES[priority], next(self._seq), priority, waiter))
+        self._waiting[priority] += 1
+        self._publish()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # the slot arrived just as the request gave up
+            else:
+                waiter.cancel()
+                self._waiting[priority] -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(priority, 503, f"No render slot within {self.timeout:g}s")
+            raise
+        finally:
+            self._publish()
+
+    def _release(self):
+        # Hand the slot straight to the next live waiter; timed-out ones are skipped
+        while self._heap:
+            _, _, priority, waiter = heapq.heappop(self._heap)
+            if not waiter.done():
+                self._waiting[priority] -= 1
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        """Hold a render slot for the body; raises Overloaded instead of queueing
+        past the limits."""
+        with timing.stage("queue"):
+            await self._acquire(priority)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - t0
+            self._render_seconds = held if self._render_seconds is None else 0.8 * self._render_seconds + 0.2 * held
+            self._release()
+            self._publish()
+
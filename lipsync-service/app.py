@@ -1,37 +1,96 @@
+import json
+import multiprocessing as mp
 import os
 import subprocess
 import sys
 import tempfile
 import shutil
+import threading
+import time
 import uuid
 
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
 import torch
 
 # Add Wav2Lip to Python path so we can import its modules directly
-W2L = "/app/Wav2Lip"
+W2L = os.getenv("WAV2LIP_DIR", "/app/Wav2Lip")
 sys.path.insert(0, W2L)
 
 import audio
-import face_detection
 from models import Wav2Lip as Wav2LipModel
 
-import google.auth
-import google.auth.transport.requests
-import requests as http_requests
+import google.auth.exceptions
+import httpx
 from fastapi import FastAPI, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-
-CHK = "/models/wav2lip_gan.pth"
-FACE = "/app/geoff.png"
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from admission import PRIORITIES, AdmissionQueue, Overloaded
+from audio_decode import decode_audio, encode_wav
+from avatars import Avatar, AvatarRegistry
+from cpu_inference import build_backend, check_parity, configure_threads, example_inputs
+from pipeline import FrameEncoder, chunk_mel, mel_features
+from quality import FULL, QUALITIES, KeyframeExpander, RenderQuality, choose, scale_frame
+from segment_cache import SegmentCache, concat_segments, split_sentences
+from startup_artifacts import load_state_dict
+from tts import create_tts
+import metrics
+import timing
+
+# WAV2LIP_CHECKPOINT=random builds an untrained model (benchmarks, no weights needed)
+CHK = os.getenv("WAV2LIP_CHECKPOINT", "/models/wav2lip_gan.pth")
+FACE = os.getenv("FACE_IMAGE", "/app/geoff.png")
 IMG_SIZE = 96
 MEL_STEP_SIZE = 16
 FPS = 25.0
 PADS = [0, 10, 0, 0]  # top, bottom, left, right
 WAV2LIP_BATCH_SIZE = 128
 
+# Pre-serialized model weights and cached face detections (see startup_artifacts.py)
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "/models/artifacts")
+
+# Extra coaching personas: AVATAR_DIR/<id>.png, selected per request by id.
+# Up to AVATAR_CACHE_SIZE avatars keep their precomputed inputs on the device.
+AVATAR_DIR = os.getenv("AVATAR_DIR", "/app/avatars")
+DEFAULT_AVATAR = "geoff"
+AVATAR_CACHE_SIZE = int(os.getenv("AVATAR_CACHE_SIZE", "8"))
+
+TTS_VOICE = {"languageCode": "en-US", "name": "en-US-Neural2-D"}
+TTS_AUDIO_CONFIG = {
+    "audioEncoding": "LINEAR16",
+    "speakingRate": 0.92,
+    "pitch": -1.5,
+    "volumeGainDb": 2.0,
+}
+# "serial" renders each clip start to finish on the request thread; "pipelined"
+# runs mel in a process pool and compositing/encoding beside inference
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "serial")
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", str(WAV2LIP_BATCH_SIZE)))
+PIPELINE_QUEUE_DEPTH = int(os.getenv("PIPELINE_QUEUE_DEPTH", "4"))  # batches in flight to the encoder
+
+# CPU-only deployments: inference backend and intra-op threads (see cpu_inference.py).
+# Pipelined mode leaves a core per mel worker and one for the writer thread +
+# ffmpeg, so they overlap inference instead of contending with its threads.
+CPU_BACKEND = os.getenv("CPU_BACKEND", "eager")
+_reserved_cores = PIPELINE_WORKERS + 1 if PIPELINE_MODE == "pipelined" else 0
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", str(max((os.cpu_count() or 1) - _reserved_cores, 1))))
+
+# "google" (Cloud TTS) or "stub" (offline tone generator for local testing)
+TTS_BACKEND = os.getenv("TTS_BACKEND", "google")
+TTS_MAX_CONNECTIONS = int(os.getenv("TTS_MAX_CONNECTIONS", "8"))
+
+# Rendered sentence segments for /speak {"mode": "segments"}
+SEGMENT_CACHE_DIR = os.getenv("SEGMENT_CACHE_DIR", "/tmp/geoff-segments")
+SEGMENT_CACHE_MAX_ENTRIES = int(os.getenv("SEGMENT_CACHE_MAX_ENTRIES", "2000"))
+
+# Attach a Server-Timing header (per-stage ms) to /speak and /lipsync responses
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
 app = FastAPI(title="Geoff Lipsync Service")
 
 app.add_middleware(
@@ -39,202 +98,507 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Overlay-Box", "X-Overlay-Scale", "X-Segments-Cached", "X-Render-Quality", "Server-Timing", "Retry-After"],
 )
 
-# --- Persistent state loaded once at startup ---
+# --- Persistent state, loaded once in the background after the server starts ---
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
 print(f"[startup] Using {device} for inference")
 
-# Load Wav2Lip model into GPU memory — this persists across requests
-print(f"[startup] Loading Wav2Lip model from {CHK}...")
-_checkpoint = torch.load(CHK) if device == "cuda" else torch.load(CHK, map_location="cpu")
-_model = Wav2LipModel()
-_model.load_state_dict({k.replace("module.", ""): v for k, v in _checkpoint["state_dict"].items()})
-_model = _model.to(device).eval()
-del _checkpoint
-print("[startup] Wav2Lip model loaded and ready")
-
-# Pre-detect face in geoff.png — this never changes so do it once
-print(f"[startup] Running face detection on {FACE}...")
-_face_frame = cv2.imread(FACE)
-_detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False, device=device)
-_det_results = _detector.get_detections_for_batch(np.array([_face_frame]))
-if _det_results[0] is None:
-    raise RuntimeError("Face not detected in geoff.png!")
-rect = _det_results[0]
-pady1, pady2, padx1, padx2 = PADS
-_face_coords = (
-    max(0, rect[1] - pady1),
-    min(_face_frame.shape[0], rect[3] + pady2),
-    max(0, rect[0] - padx1),
-    min(_face_frame.shape[1], rect[2] + padx2),
-)
-del _detector
-print(f"[startup] Face detected at coords {_face_coords}")
-print("[startup] Ready to serve requests")
-
-# Cache credentials for TTS calls
-_credentials = None
+_model = None
+_infer = None
+_cpu_backend = None
+_avatars = None
+
+# /health reports this while the model loads; handlers return 503 until ready
+_startup = {"status": "starting", "error": None, "seconds": None}
+_ready = threading.Event()
+
+
+def _load_model():
+    """Load Wav2Lip into device memory and pick the CPU backend if needed."""
+    global _model, _infer, _cpu_backend
+    model = Wav2LipModel()
+    if CHK == "random":
+        print("[startup] Using randomly initialized Wav2Lip weights")
+    else:
+        print(f"[startup] Loading Wav2Lip model from {CHK}...")
+        state, from_artifact = load_state_dict(CHK, ARTIFACT_DIR)
+        # assign=True keeps the memory-mapped tensors instead of copying into fresh ones
+        model.load_state_dict(state, assign=True)
+        del state
+        print(f"[startup] Wav2Lip model loaded ({'artifact' if from_artifact else 'checkpoint'})")
+    _model = model.to(device).eval()
+
+    # On CPU, swap in the optimized backend — but only once it matches eager output
+    _infer = _model
+    if device == "cpu":
+        configure_threads(TORCH_NUM_THREADS)
+        _cpu_backend = CPU_BACKEND
+        try:
+            _infer = build_backend(_model, CPU_BACKEND, WAV2LIP_BATCH_SIZE, TORCH_NUM_THREADS,
+                                   checkpoint_path=None if CHK == "random" else CHK, artifact_dir=ARTIFACT_DIR)
+            if CPU_BACKEND != "eager":
+                diff = check_parity(_model, _infer, CPU_BACKEND)
+                print(f"[startup] {CPU_BACKEND} backend matches eager (mean abs diff {diff:.2e})")
+        except Exception as e:
+            print(f"[startup] WARNING: {CPU_BACKEND} backend unavailable ({e}); falling back to eager")
+            _cpu_backend = "eager"
+            _infer = build_backend(_model, "eager", WAV2LIP_BATCH_SIZE, TORCH_NUM_THREADS)
+        print(f"[startup] CPU inference: {_cpu_backend} backend, {TORCH_NUM_THREADS} threads")
+
+
+def _detect_face(frame: np.ndarray, path: str) -> tuple:
+    """Run the face detector once; only needed when no face artifact exists."""
+    import face_detection
+
+    print(f"[avatars] Running face detection on {path}...")
+    detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, flip_input=False, device=device)
+    det_results = detector.get_detections_for_batch(np.array([frame]))
+    if det_results[0] is None:
+        raise RuntimeError(f"Face not detected in {path}!")
+    rect = det_results[0]
+    pady1, pady2, padx1, padx2 = PADS
+    return (
+        max(0, rect[1] - pady1),
+        min(frame.shape[0], rect[3] + pady2),
+        max(0, rect[0] - padx1),
+        min(frame.shape[1], rect[2] + padx2),
+    )
 
 
-def get_tts_audio(text: str) -> bytes:
-    """Call Google Cloud TTS using Application Default Credentials."""
-    global _credentials
-    if _credentials is None:
-        _credentials, _ = google.auth.default(
-            scopes=["https://www.googleapis.com/auth/cloud-platform"]
-        )
-    auth_req = google.auth.transport.requests.Request()
-    _credentials.refresh(auth_req)
-
-    resp = http_requests.post(
-        "https://texttospeech.googleapis.com/v1/text:synthesize",
-        headers={
-            "Authorization": f"Bearer {_credentials.token}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "input": {"text": text},
-            "voice": {"languageCode": "en-US", "name": "en-US-Neural2-D"},
-            "audioConfig": {
-                "audioEncoding": "LINEAR16",
-                "speakingRate": 0.92,
-                "pitch": -1.5,
-                "volumeGainDb": 2.0,
-            },
-        },
-        timeout=15,
+def _create_avatars():
+    global _avatars
+    _avatars = AvatarRegistry(
+        AVATAR_DIR, DEFAULT_AVATAR, FACE, ARTIFACT_DIR, PADS, IMG_SIZE, device,
+        _detect_face, AVATAR_CACHE_SIZE,
     )
-    resp.raise_for_status()
-    import base64
-    return base64.b64decode(resp.json()["audioContent"])
-
-
-def run_wav2lip_inprocess(audio_path: str, out_path: str):
-    """Run Wav2Lip inference using the pre-loaded model and cached face detection."""
-    # Convert audio to wav if needed
-    wav_path = audio_path
-    if not audio_path.endswith(".wav"):
-        wav_path = audio_path.rsplit(".", 1)[0] + ".wav"
-        subprocess.check_call(
-            ["ffmpeg", "-y", "-i", audio_path, "-strict", "-2", wav_path],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+    print(f"[startup] Avatars: {', '.join(_avatars.ids())}")
+
+
+def _warmup():
+    """Load everything, then push one batch through the model so the first request is warm."""
+    t0 = time.monotonic()
+    try:
+        _startup["status"] = "loading_model"
+        _load_model()
+        _startup["status"] = "loading_avatar"
+        _create_avatars()
+        _avatars.get(DEFAULT_AVATAR)
+        _startup["status"] = "warming_up"
+        with torch.no_grad():
+            mel, img = example_inputs(1)
+            _infer(mel.to(device), img.to(device))
+        if PIPELINE_MODE == "pipelined":
+            # Spawn the mel workers now rather than on the first request
+            silence = encode_wav(np.zeros(16000, dtype=np.float32), 16000)
+            _mel_pool().submit(mel_features, silence, FPS, MEL_STEP_SIZE).result()
+    except Exception as e:
+        _startup["status"] = "failed"
+        _startup["error"] = str(e)
+        print(f"[startup] FAILED: {e}")
+        return
+    _startup["seconds"] = round(time.monotonic() - t0, 2)
+    _startup["status"] = "ready"
+    _ready.set()
+    print(f"[startup] Ready to serve requests ({_startup['seconds']}s)")
+
+
+def _require_ready():
+    if not _ready.is_set():
+        status = _startup["status"]
+        code = 500 if status == "failed" else 503
+        raise HTTPException(
+            status_code=code,
+            detail=f"Service {status}" + (f": {_startup['error']}" if _startup["error"] else ""),
+            headers={"Retry-After": "5"} if code == 503 else None,
         )
 
-    # Load audio and compute mel spectrogram
-    wav = audio.load_wav(wav_path, 16000)
-    mel = audio.melspectrogram(wav)
-
-    if np.isnan(mel.reshape(-1)).sum() > 0:
-        raise ValueError("Mel contains nan!")
-
-    # Chunk mel spectrogram by frame rate
-    mel_chunks = []
-    mel_idx_multiplier = 80.0 / FPS
-    i = 0
-    while True:
-        start_idx = int(i * mel_idx_multiplier)
-        if start_idx + MEL_STEP_SIZE > len(mel[0]):
-            mel_chunks.append(mel[:, len(mel[0]) - MEL_STEP_SIZE:])
-            break
-        mel_chunks.append(mel[:, start_idx: start_idx + MEL_STEP_SIZE])
-        i += 1
-
-    # Static image: one frame repeated
-    full_frames = [_face_frame.copy()]
-    y1, y2, x1, x2 = _face_coords
-    face_crop = _face_frame[y1:y2, x1:x2]
-
-    # Build batches
-    frame_h, frame_w = _face_frame.shape[:2]
-    tmp_avi = out_path.rsplit(".", 1)[0] + ".avi"
-    out_video = cv2.VideoWriter(tmp_avi, cv2.VideoWriter_fourcc(*"DIVX"), FPS, (frame_w, frame_h))
 
-    img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+_segments = SegmentCache(SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_ENTRIES)
+print(f"[startup] Segment cache at {SEGMENT_CACHE_DIR} (max {SEGMENT_CACHE_MAX_ENTRIES} segments)")
 
-    for m in mel_chunks:
-        face = cv2.resize(face_crop, (IMG_SIZE, IMG_SIZE))
-        img_batch.append(face)
-        mel_batch.append(m)
-        frame_batch.append(_face_frame.copy())
-        coords_batch.append(_face_coords)
+_tts = create_tts(TTS_BACKEND, TTS_VOICE, TTS_AUDIO_CONFIG, max_connections=TTS_MAX_CONNECTIONS)
+print(f"[startup] TTS backend: {TTS_BACKEND}")
 
-        if len(img_batch) >= WAV2LIP_BATCH_SIZE:
-            _process_batch(img_batch, mel_batch, frame_batch, coords_batch, out_video)
-            img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+# Inference runs in the threadpool so TTS and uploads for other requests keep
+# flowing; the model itself still serves one clip at a time.
+_inference_lock = threading.Lock()
+_mel_executor = None  # process pool for PIPELINE_MODE=pipelined, created on first use
+print(f"[startup] Pipeline mode: {PIPELINE_MODE}")
 
-    if len(img_batch) > 0:
-        _process_batch(img_batch, mel_batch, frame_batch, coords_batch, out_video)
+# Bounded, prioritized queue in front of /speak and /lipsync (see admission.py)
+_admission = AdmissionQueue()
+print(f"[startup] Admission: {_admission.concurrency} concurrent renders, "
+      f"{_admission.queue_limit} queued ({_admission.prerender_limit} for pre-render)")
 
-    out_video.release()
 
-    # Mux audio + video with ffmpeg
-    subprocess.check_call(
-        ["ffmpeg", "-y", "-i", wav_path, "-i", tmp_avi, "-strict", "-2", "-q:v", "1", out_path],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+def _frame_buffer(avatar: Avatar, region_only: bool, scale: float = 1.0) -> tuple[np.ndarray, tuple]:
+    """Preallocated output frame and where the predicted face is pasted into it.
+
+    Only the face box ever changes, so every output frame is composited into
+    one buffer instead of a fresh copy of the frame. In region mode the buffer
+    is just the (even-sized) overlay box around the face. scale < 1 shrinks
+    both (fast quality).
+    """
+    y1, y2, x1, x2 = avatar.coords
+    if region_only:
+        ry1, ry2, rx1, rx2 = avatar.overlay_box
+        return scale_frame(avatar.frame[ry1:ry2, rx1:rx2].copy(), (y1 - ry1, y2 - ry1, x1 - rx1, x2 - rx1), scale)
+    return scale_frame(avatar.frame.copy(), avatar.coords, scale)
+
+
+def _expander(quality: RenderQuality, frames: int) -> KeyframeExpander | None:
+    if quality.stride == 1:
+        return None
+    return KeyframeExpander(quality.stride, frames, quality.blend)
+
+
+def run_wav2lip_inprocess(audio_bytes: bytes, out_path: str, region_only: bool = False,
+                          avatar: Avatar | None = None, quality: RenderQuality = FULL):
+    """Run Wav2Lip inference using the pre-loaded model and cached face detection.
+
+    Audio is decoded and resampled in memory; only the final mux touches ffmpeg.
+    With region_only, the output video covers just the overlay box around the
+    face (see /background and the X-Overlay-Box header) instead of the full frame.
+    """
+    avatar = avatar or _avatars.get(DEFAULT_AVATAR)
+    with timing.stage("decode"):
+        decoded = decode_audio(audio_bytes)
+    with timing.stage("mel"):
+        mel = audio.melspectrogram(decoded.wav)
+
+        if np.isnan(mel.reshape(-1)).sum() > 0:
+            raise ValueError("Mel contains nan!")
+
+        # Chunk mel spectrogram by frame rate
+        mel_chunks = chunk_mel(mel, FPS, MEL_STEP_SIZE)
+
+    frame_buf, paste_at = _frame_buffer(avatar, region_only, quality.scale)
+    frame_h, frame_w = frame_buf.shape[:2]
+    tmp_avi = out_path.rsplit(".", 1)[0] + ".avi"
+    out_video = cv2.VideoWriter(tmp_avi, cv2.VideoWriter_fourcc(*"DIVX"), FPS, (frame_w, frame_h))
+
+    # Fast quality: the model sees every stride-th frame, the rest are filled in
+    expander = _expander(quality, len(mel_chunks))
+    keyframes = mel_chunks[::quality.stride]
+    for start in range(0, len(keyframes), WAV2LIP_BATCH_SIZE):
+        mel_batch = keyframes[start: start + WAV2LIP_BATCH_SIZE]
+        _process_batch(avatar.img_tensor, mel_batch, frame_buf, paste_at, out_video, expander)
+    if expander:
+        with timing.stage("interpolate"):
+            tail = expander.finish()
+        _write_frames(tail, frame_buf, paste_at, out_video)
+
+    with timing.stage("encode"):
+        out_video.release()
+
+    # Mux audio + video with ffmpeg, feeding the audio over stdin
+    with timing.stage("mux"):
+        subprocess.run(
+            ["ffmpeg", "-y", "-i", "pipe:0", "-i", tmp_avi, "-strict", "-2", "-q:v", "1", out_path],
+            input=decoded.mux_bytes,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
     os.remove(tmp_avi)
 
 
-def _process_batch(img_batch, mel_batch, frame_batch, coords_batch, out_video):
-    """Run model inference on a batch and write frames to video."""
-    img_arr = np.asarray(img_batch)
-    mel_arr = np.asarray(mel_batch)
+def _predict(face_tensor, mel_batch: np.ndarray) -> np.ndarray:
+    """Run the model on a batch; returns (B, 96, 96, 3) predicted faces in [0, 255].
+
+    face_tensor is the avatar's precomputed (1, 6, 96, 96) input already on the
+    device; it is broadcast across the batch without copying.
+    """
+    with timing.stage("batch"):
+        mel_tensor = torch.from_numpy(np.ascontiguousarray(mel_batch[:, None])).to(device)
+        img_tensor = face_tensor.expand(len(mel_batch), -1, -1, -1)
+
+    # The device -> host copy is the sync point, so it belongs to inference
+    with timing.stage("inference"), torch.no_grad():
+        pred = _infer(mel_tensor, img_tensor)
+        return pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.0
+
+
+def _process_batch(face_tensor, mel_batch, frame_buf, coords, out_video, expander=None):
+    """Run model inference on a batch and write frames to video.
+
+    With an expander, the batch holds keyframes and the frames completed by
+    them are written instead.
+    """
+    pred = _predict(face_tensor, mel_batch)
+    if expander:
+        with timing.stage("interpolate"):
+            pred = expander.feed(pred)
+    _write_frames(pred, frame_buf, coords, out_video)
+
+
+def _write_frames(pred, frame_buf, coords, out_video):
+    """Paste each prediction into frame_buf at coords and write it immediately;
+    the writer encodes synchronously, so the buffer can be reused per frame."""
+    y1, y2, x1, x2 = coords
+    composite = encode = 0.0
+    for p in pred:
+        t0 = time.perf_counter()
+        frame_buf[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+        t1 = time.perf_counter()
+        out_video.write(frame_buf)
+        composite += t1 - t0
+        encode += time.perf_counter() - t1
+
+    times = timing.current()
+    if times is not None:
+        times.add("composite", composite)
+        times.add("encode", encode)
+
+
+def _mel_pool() -> ProcessPoolExecutor:
+    global _mel_executor
+    if _mel_executor is None:
+        # spawn, not fork: the parent holds CUDA/torch thread state
+        _mel_executor = ProcessPoolExecutor(max_workers=PIPELINE_WORKERS, mp_context=mp.get_context("spawn"))
+    return _mel_executor
+
+
+def run_wav2lip_pipelined(audio_bytes: bytes, out_path: str, region_only: bool = False,
+                          avatar: Avatar | None = None, quality: RenderQuality = FULL):
+    """Pipelined variant of run_wav2lip_inprocess (PIPELINE_MODE=pipelined).
+
+    Mel features come from the process pool before the model is taken, the
+    model lock is held only for inference, and compositing plus encoding run
+    on the FrameEncoder's writer thread and ffmpeg process — overlapping both
+    this clip's next batch and the next clip's inference.
+    """
+    avatar = avatar or _avatars.get(DEFAULT_AVATAR)
+    # decode and mel happen together in the worker; recorded as one "mel" stage
+    with timing.stage("mel"):
+        mel_chunks, mux_bytes = _mel_pool().submit(mel_features, audio_bytes, FPS, MEL_STEP_SIZE).result()
+
+    frame_buf, paste_at = _frame_buffer(avatar, region_only, quality.scale)
+    encoder = FrameEncoder(out_path, frame_buf, paste_at, FPS, mux_bytes, PIPELINE_QUEUE_DEPTH,
+                           times=timing.current())
+    expander = _expander(quality, len(mel_chunks))
+    keyframes = mel_chunks[::quality.stride]
+    try:
+        with _inference_lock:
+            for start in range(0, len(keyframes), PIPELINE_BATCH_SIZE):
+                pred = _predict(avatar.img_tensor, keyframes[start: start + PIPELINE_BATCH_SIZE])
+                if expander:
+                    with timing.stage("interpolate"):
+                        pred = expander.feed(pred)
+                encoder.put(pred)
+        if expander:
+            with timing.stage("interpolate"):
+                encoder.put(expander.finish())
+    except BaseException:
+        encoder.close(abort=True)
+        raise
+    # Whatever ffmpeg still has to do after the last frame is the mux tail
+    with timing.stage("mux"):
+        encoder.close()
+
+
+def _render(audio_bytes: bytes, out_path: str, region_only: bool, avatar: Avatar,
+            quality: RenderQuality = FULL):
+    if PIPELINE_MODE == "pipelined":
+        run_wav2lip_pipelined(audio_bytes, out_path, region_only=region_only, avatar=avatar, quality=quality)
+    else:
+        with _inference_lock:
+            run_wav2lip_inprocess(audio_bytes, out_path, region_only=region_only, avatar=avatar, quality=quality)
+
+
+async def render_speech(text: str, out_path: str, avatar: Avatar, region_only: bool = False,
+                        quality: RenderQuality = FULL):
+    """TTS + Wav2Lip for one piece of text, written to out_path."""
+    with timing.stage("tts"):
+        wav_bytes = await _tts.synthesize(text)
+    await run_in_threadpool(_render, wav_bytes, out_path, region_only, avatar, quality)
+
+
+async def render_segments(text: str, work: str, out_path: str, avatar: Avatar,
+                          region_only: bool = False, quality: RenderQuality = FULL) -> tuple[int, int]:
+    """Render text sentence by sentence, reusing cached segments, and splice them.
+
+    Only sentences missing from the segment cache go through TTS and Wav2Lip;
+    their TTS calls are issued concurrently. Returns (cached, total) segment counts.
+    """
+    sentences = split_sentences(text)
+    # Anything that changes the rendered pixels or audio must be part of the key
+    key_parts = (
+        TTS_VOICE["name"],
+        json.dumps(TTS_AUDIO_CONFIG, sort_keys=True),
+        avatar.digest,
+        "region" if region_only else "full",
+        quality.name,
+    )
+    keys = [_segments.key(sentence, *key_parts) for sentence in sentences]
+    # Every segment is spliced from work: hits are linked in, misses rendered there
+    paths = [os.path.join(work, f"{i:03d}-{key}.mp4") for i, key in enumerate(keys)]
+    misses = []
+    for i, key in enumerate(keys):
+        if not await run_in_threadpool(_segments.checkout, key, paths[i]):
+            misses.append(i)
+
+    with timing.stage("tts"):
+        audio_clips = await _tts.synthesize_many([sentences[i] for i in misses])
+    for i, wav_bytes in zip(misses, audio_clips):
+        await run_in_threadpool(_render, wav_bytes, paths[i], region_only, avatar, quality)
+        await run_in_threadpool(_segments.put, keys[i], paths[i])
+
+    if len(paths) == 1:
+        await run_in_threadpool(shutil.copyfile, paths[0], out_path)
+    else:
+        await run_in_threadpool(concat_segments, paths, out_path)
+    return len(paths) - len(misses), len(paths)
+
+
+def _overlay_headers(avatar: Avatar, quality: RenderQuality) -> dict:
+    y1, y2, x1, x2 = avatar.overlay_box
+    headers = {"X-Overlay-Box": f"{x1},{y1},{x2 - x1},{y2 - y1}"}
+    if quality.scale != 1.0:
+        headers["X-Overlay-Scale"] = f"{quality.scale:g}"
+    return headers
+
+
+def _get_avatar(avatar_id: str | None) -> Avatar:
+    try:
+        return _avatars.get(avatar_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown avatar '{avatar_id}'") from None
+
 
-    img_masked = img_arr.copy()
-    img_masked[:, IMG_SIZE // 2:] = 0
+def _parse_output(output: str) -> bool:
+    """Validate the output mode; returns True for region-only rendering."""
+    if output not in ("full", "region"):
+        raise HTTPException(status_code=400, detail=f"Unknown output '{output}'")
+    return output == "region"
 
-    img_input = np.concatenate((img_masked, img_arr), axis=3) / 255.0
-    mel_input = mel_arr.reshape(len(mel_arr), mel_arr.shape[1], mel_arr.shape[2], 1)
 
-    img_tensor = torch.FloatTensor(np.transpose(img_input, (0, 3, 1, 2))).to(device)
-    mel_tensor = torch.FloatTensor(np.transpose(mel_input, (0, 3, 1, 2))).to(device)
+def _parse_priority(priority: str) -> str:
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority '{priority}'")
+    return priority
 
-    with torch.no_grad():
-        pred = _model(mel_tensor, img_tensor)
 
-    pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.0
+def _parse_quality(quality: str) -> str:
+    if quality not in QUALITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown quality '{quality}'")
+    return quality
 
-    for p, f, c in zip(pred, frame_batch, coords_batch):
-        y1, y2, x1, x2 = c
-        p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
-        f[y1:y2, x1:x2] = p
-        out_video.write(f)
+
+@app.exception_handler(Overloaded)
+async def _overloaded(request, e: Overloaded):
+    return JSONResponse({"detail": e.detail}, status_code=e.status_code,
+                        headers={"Retry-After": str(e.retry_after)})
+
+
+@app.on_event("startup")
+async def _start_warmup():
+    # Load in the background so /health answers immediately on a cold start
+    threading.Thread(target=_warmup, name="warmup", daemon=True).start()
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "model_loaded": True, "device": device}
+    return {
+        "status": "ok" if _ready.is_set() else _startup["status"],
+        "model_loaded": _ready.is_set(),
+        "device": device,
+        "cpu_backend": _cpu_backend,
+        "startup_seconds": _startup["seconds"],
+        "avatars_loaded": _avatars.loaded_ids() if _avatars else [],
+        "renders_active": _admission.active,
+        "renders_queued": _admission.depth,
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage and per-request latency histograms in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/avatars")
+async def avatars():
+    """Avatar ids accepted by /speak, /lipsync and /background."""
+    _require_ready()
+    return {"default": DEFAULT_AVATAR, "avatars": _avatars.ids()}
+
+
+@app.get("/background")
+async def background(avatar: str = DEFAULT_AVATAR):
+    """Static full-frame background for clients compositing region-only output.
+
+    Region videos carry an X-Overlay-Box header (x,y,width,height) giving where
+    to draw them over this image. It never changes, so clients fetch it once.
+    Scaled-down renders (quality=fast) add X-Overlay-Scale: the video is that
+    fraction of the box (rounded to even pixels) and is stretched to fill it.
+    """
+    _require_ready()
+    av = await run_in_threadpool(_get_avatar, avatar)
+    return Response(
+        content=av.background_png,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
 
 
 @app.post("/speak")
 async def speak(body: dict):
-    """Text in, MP4 video out. Calls Cloud TTS internally."""
+    """Text in, MP4 video out. Calls Cloud TTS internally.
+
+    Pass "mode": "segments" to render sentence by sentence through the
+    segment cache; recurring sentences are spliced in without re-rendering.
+    Pass "output": "region" to get only the face-region video (see /background),
+    and "avatar" to pick a persona other than Geoff (see /avatars).
+    Pass "priority": "prerender" for clips nobody is waiting on yet; they queue
+    behind interactive requests and are the first turned away (429) under load.
+    Pass "quality": "fast" for a quicker, lighter render, or "auto" to get fast
+    only while other requests are queued (see quality.py).
+    """
     text = body.get("text", "").strip()
     if not text:
         raise HTTPException(status_code=400, detail="Missing 'text' field")
+    mode = body.get("mode", "full")
+    if mode not in ("full", "segments"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}'")
+    region_only = _parse_output(body.get("output", "full"))
+    priority = _parse_priority(body.get("priority", "interactive"))
+    requested = _parse_quality(body.get("quality", "full"))
+    _require_ready()
+    avatar = await run_in_threadpool(_get_avatar, body.get("avatar"))
+
+    timing.start()
+    async with _admission.slot(priority):
+        return await _speak(text, mode, region_only, avatar, choose(requested, _admission.depth))
+
 
+async def _speak(text: str, mode: str, region_only: bool, avatar: Avatar, quality: RenderQuality) -> Response:
     work = tempfile.mkdtemp(dir="/tmp")
     uid = str(uuid.uuid4())
-    aud_path = os.path.join(work, "tts.wav")
     out_path = os.path.join(work, f"{uid}.mp4")
 
     try:
-        wav_bytes = get_tts_audio(text)
-        with open(aud_path, "wb") as f:
-            f.write(wav_bytes)
-
-        run_wav2lip_inprocess(aud_path, out_path)
+        headers = _overlay_headers(avatar, quality) if region_only else {}
+        headers["X-Render-Quality"] = quality.name
+        if mode == "segments":
+            hits, total = await render_segments(text, work, out_path, avatar, region_only=region_only,
+                                                quality=quality)
+            headers["X-Segments-Cached"] = f"{hits}/{total}"
+        else:
+            await render_speech(text, out_path, avatar, region_only=region_only, quality=quality)
 
         with open(out_path, "rb") as f:
             video_bytes = f.read()
+        times = timing.finish("speak")
+        if SERVER_TIMING:
+            headers["Server-Timing"] = metrics.server_timing(times)
 
-        return Response(content=video_bytes, media_type="video/mp4")
+        return Response(content=video_bytes, media_type="video/mp4", headers=headers)
 
-    except http_requests.exceptions.RequestException as e:
+    except (httpx.HTTPError, google.auth.exceptions.GoogleAuthError) as e:
         raise HTTPException(status_code=502, detail=f"TTS API error: {e}") from e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inference failed: {e}") from e
@@ -243,23 +607,43 @@ async def speak(body: dict):
 
 
 @app.post("/lipsync")
-async def lipsync(audio: UploadFile):
-    """Audio file in, MP4 video out. Uses baked-in geoff.png."""
+async def lipsync(audio: UploadFile, output: str = "full", avatar: str = DEFAULT_AVATAR,
+                  priority: str = "interactive", quality: str = "full"):
+    """Audio file in, MP4 video out. Uses baked-in geoff.png unless ?avatar= names another.
+
+    With ?output=region, only the face-region video is returned (see /background).
+    ?priority=prerender queues behind interactive requests, and ?quality=fast|auto
+    trades fidelity for speed (see /speak).
+    """
+    region_only = _parse_output(output)
+    priority = _parse_priority(priority)
+    requested = _parse_quality(quality)
+    _require_ready()
+    av = await run_in_threadpool(_get_avatar, avatar)
+
+    timing.start()
+    async with _admission.slot(priority):
+        return await _lipsync(audio, region_only, av, choose(requested, _admission.depth))
+
+
+async def _lipsync(audio: UploadFile, region_only: bool, av: Avatar, quality: RenderQuality) -> Response:
     work = tempfile.mkdtemp(dir="/tmp")
     uid = str(uuid.uuid4())
-    aud_path = os.path.join(work, audio.filename or "audio.wav")
     out_path = os.path.join(work, f"{uid}.mp4")
 
     try:
-        with open(aud_path, "wb") as f:
-            f.write(await audio.read())
-
-        run_wav2lip_inprocess(aud_path, out_path)
+        audio_bytes = await audio.read()
+        await run_in_threadpool(_render, audio_bytes, out_path, region_only, av, quality)
 
         with open(out_path, "rb") as f:
             video_bytes = f.read()
+        times = timing.finish("lipsync")
 
-        return Response(content=video_bytes, media_type="video/mp4")
+        headers = _overlay_headers(av, quality) if region_only else {}
+        headers["X-Render-Quality"] = quality.name
+        if SERVER_TIMING:
+            headers["Server-Timing"] = metrics.server_timing(times)
+        return Response(content=video_bytes, media_type="video/mp4", headers=headers)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inference failed: {e}") from e
@@ -267,6 +651,20 @@ async def lipsync(audio: UploadFile):
         shutil.rmtree(work, ignore_errors=True)
 
 
+@app.on_event("shutdown")
+async def _shutdown():
+    await _tts.aclose()
+    if _mel_executor is not None:
+        _mel_executor.shutdown(cancel_futures=True)
+
+
 if __name__ == "__main__":
+    if "--prepare-artifacts" in sys.argv:
+        # Build-time: write the model and face artifacts into the image
+        _load_model()
+        _create_avatars()
+        _avatars.prepare_all()
+        sys.exit(0)
+
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8080)
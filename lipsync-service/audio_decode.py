@@ -0,0 +1,71 @@
+"""In-memory audio decoding for Wav2Lip: encoded bytes -> 16 kHz mono float32.
+
+Matches what Wav2Lip's audio.load_wav (librosa.load) produces — channel
+average, then soxr high-quality resampling — without writing the upload to
+disk or shelling out for the formats libsndfile reads natively (WAV/LINEAR16,
+FLAC, OGG/Vorbis, MP3).
+"""
+
+import io
+import subprocess
+import tempfile
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+TARGET_SR = 16000
+
+
+class DecodedAudio:
+    """Decoded samples plus the bytes to hand ffmpeg when muxing the final MP4."""
+
+    __slots__ = ("wav", "sample_rate", "mux_bytes")
+
+    def __init__(self, wav: np.ndarray, sample_rate: int, mux_bytes: bytes):
+        self.wav = wav
+        self.sample_rate = sample_rate
+        self.mux_bytes = mux_bytes
+
+    @property
+    def duration(self) -> float:
+        return len(self.wav) / self.sample_rate
+
+
+def decode_audio(data: bytes, sr: int = TARGET_SR) -> DecodedAudio:
+    """Decode encoded audio bytes to mono float32 at `sr`."""
+    try:
+        samples, file_sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except (RuntimeError, sf.SoundFileError):
+        # AAC/M4A, WebM/Opus and friends: let ffmpeg decode straight to PCM
+        wav = _ffmpeg_decode(data, sr)
+        return DecodedAudio(wav, sr, encode_wav(wav, sr))
+
+    wav = samples.mean(axis=1)
+    if file_sr != sr:
+        wav = soxr.resample(wav, file_sr, sr, quality="HQ")
+    # The original bytes are already in a format ffmpeg reads from a pipe
+    return DecodedAudio(np.ascontiguousarray(wav, dtype=np.float32), sr, data)
+
+
+def encode_wav(wav: np.ndarray, sr: int) -> bytes:
+    """Encode float samples as 16-bit PCM WAV bytes."""
+    buf = io.BytesIO()
+    sf.write(buf, wav, sr, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def _ffmpeg_decode(data: bytes, sr: int) -> np.ndarray:
+    cmd = ["ffmpeg", "-i", "pipe:0", "-f", "f32le", "-ac", "1", "-ar", str(sr), "pipe:1"]
+    try:
+        out = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    except subprocess.CalledProcessError:
+        # MP4/M4A with the moov atom at the end can't be demuxed from a pipe
+        with tempfile.NamedTemporaryFile(suffix=".m4a") as f:
+            f.write(data)
+            f.flush()
+            cmd[2] = f.name
+            out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    if not out:
+        raise ValueError("Could not decode audio")
+    return np.frombuffer(out, dtype=np.float32).copy()
@@ -0,0 +1,168 @@
+"""Avatar registry: several coaching personas served from one process.
+
+Each avatar is an image in AVATAR_DIR (id = file stem), plus the default
+Geoff image. On first use an avatar's face box comes from its persisted
+artifact (or one face detection), and everything per-request rendering needs
+is precomputed once: the 96x96 model input tensor already masked, normalized
+and resident on the inference device, the even-sized overlay box, and the
+PNG background for region-only clients. Loaded avatars live in a bounded LRU
+so device memory stays flat however many personas exist on disk.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import torch
+
+from startup_artifacts import load_face_coords
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def _even_span(lo: int, hi: int, limit: int) -> tuple[int, int]:
+    """Grow [lo, hi) by one pixel if needed so its length is even (H.264 4:2:0 needs it).
+
+    Stays within [0, limit); only a span covering all of an odd limit shrinks.
+    """
+    if (hi - lo) % 2:
+        if hi < limit:
+            hi += 1
+        elif lo > 0:
+            lo -= 1
+        else:
+            hi -= 1  # spans the whole odd-sized image: shrink instead
+    return lo, hi
+
+
+class Avatar:
+    """One persona image with its precomputed face geometry and model input."""
+
+    __slots__ = ("id", "path", "digest", "frame", "coords", "overlay_box", "img_tensor", "_background_png")
+
+    def __init__(self, avatar_id: str, path: str, coords: tuple, img_size: int, device: str):
+        self.id = avatar_id
+        self.path = path
+        self.frame = cv2.imread(path)
+        if self.frame is None:
+            raise ValueError(f"Could not read avatar image {path}")
+        with open(path, "rb") as f:
+            self.digest = hashlib.sha256(f.read()).hexdigest()
+        self.coords = coords
+
+        # Region-only output: the face box grown to even dimensions
+        y1, y2, x1, x2 = coords
+        self.overlay_box = (
+            *_even_span(y1, y2, self.frame.shape[0]),
+            *_even_span(x1, x2, self.frame.shape[1]),
+        )
+
+        # Wav2Lip face input: lower half masked, stacked with the full face,
+        # scaled to [0, 1], NCHW. Identical for every frame of every clip.
+        face = cv2.resize(self.frame[y1:y2, x1:x2], (img_size, img_size))
+        masked = face.copy()
+        masked[img_size // 2:] = 0
+        img = np.concatenate((masked, face), axis=2).astype(np.float32) / 255.0
+        self.img_tensor = torch.from_numpy(img.transpose(2, 0, 1)[None].copy()).to(device)
+        self._background_png = None
+
+    @property
+    def background_png(self) -> bytes:
+        """Static full frame for region-only clients, encoded on first request."""
+        if self._background_png is None:
+            self._background_png = cv2.imencode(".png", self.frame)[1].tobytes()
+        return self._background_png
+
+
+class AvatarRegistry:
+    """Maps avatar ids to images; loads them lazily into a bounded LRU."""
+
+    def __init__(self, avatar_dir: str, default_id: str, default_path: str, artifact_dir: str,
+                 pads: list[int], img_size: int, device: str, detect, max_loaded: int):
+        self.avatar_dir = avatar_dir
+        self.default_id = default_id
+        self.artifact_dir = artifact_dir
+        self.pads = pads
+        self.img_size = img_size
+        self.device = device
+        self.max_loaded = max_loaded
+        self._detect = detect  # (frame, path) -> (y1, y2, x1, x2)
+        self._paths = {default_id: default_path}
+        self._loaded: OrderedDict[str, Avatar] = OrderedDict()
+        self._lock = threading.Lock()  # guards _paths, _loaded and _loading; never held while loading
+        self._loading: dict[str, threading.Lock] = {}
+        self._scan()
+
+    def _scan(self):
+        if not os.path.isdir(self.avatar_dir):
+            return
+        for name in sorted(os.listdir(self.avatar_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in IMAGE_EXTENSIONS and stem not in self._paths:
+                self._paths[stem] = os.path.join(self.avatar_dir, name)
+
+    def ids(self) -> list[str]:
+        self._scan()
+        return sorted(self._paths)
+
+    def loaded_ids(self) -> list[str]:
+        return list(self._loaded)
+
+    def get(self, avatar_id: str | None = None) -> Avatar:
+        """Return a loaded avatar, most-recently-used; KeyError for unknown ids.
+
+        Loading (possibly a face detection) happens outside the registry lock,
+        under a per-avatar lock, so only callers of that avatar wait on it.
+        """
+        avatar_id = avatar_id or self.default_id
+        with self._lock:
+            avatar = self._hit(avatar_id)
+            if avatar is not None:
+                return avatar
+            if avatar_id not in self._paths:
+                self._scan()  # pick up avatars added since startup
+            if avatar_id not in self._paths:
+                raise KeyError(avatar_id)
+            path = self._paths[avatar_id]
+            loading = self._loading.setdefault(avatar_id, threading.Lock())
+
+        with loading:
+            with self._lock:
+                avatar = self._hit(avatar_id)  # loaded while we waited
+            if avatar is not None:
+                return avatar
+            try:
+                avatar = self._load(avatar_id, path)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(avatar_id, None)
+                raise
+            with self._lock:
+                self._loaded[avatar_id] = avatar
+                self._loading.pop(avatar_id, None)
+                while len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+            return avatar
+
+    def _hit(self, avatar_id: str) -> Avatar | None:
+        avatar = self._loaded.get(avatar_id)
+        if avatar is not None:
+            self._loaded.move_to_end(avatar_id)
+        return avatar
+
+    def _load(self, avatar_id: str, path: str) -> Avatar:
+        coords, from_artifact = load_face_coords(
+            path, self.pads, self.artifact_dir,
+            lambda: self._detect(cv2.imread(path), path),
+        )
+        print(f"[avatars] {avatar_id}: face at {coords} ({'artifact' if from_artifact else 'detected'})")
+        return Avatar(avatar_id, path, coords, self.img_size, self.device)
+
+    def prepare_all(self):
+        """Compute and persist face artifacts for every avatar on disk (build time)."""
+        for avatar_id in self.ids():
+            path = self._paths[avatar_id]
+            load_face_coords(path, self.pads, self.artifact_dir, lambda p=path: self._detect(cv2.imread(p), p))
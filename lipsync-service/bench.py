@@ -0,0 +1,202 @@
+"""Lipsync throughput benchmark and offline load generator.
+
+Runs the real render pipeline against the stub TTS and a randomly initialized
+Wav2Lip model, so no checkpoint, credentials or network are needed. Reports
+per-stage timings (tts, decode, mel, batch, inference, composite, encode,
+mux), latency percentiles and clips/s for each concurrency x clip length.
+
+    python3 bench.py                                  # direct renders, 1 worker, 4s clips
+    python3 bench.py --target speak --concurrency 1,2,4 --clip-seconds 4,12
+    python3 bench.py --target lipsync --pipeline pipelined --json bench.json
+    python3 bench.py --quality fast                   # keyframes + blending, smaller output
+
+Targets: "render" calls the render function directly; "speak" and "lipsync"
+go through the FastAPI endpoints in-process (httpx ASGI transport). Needs the
+Wav2Lip source (WAV2LIP_DIR, default /app/Wav2Lip) and ffmpeg on PATH.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_work = tempfile.mkdtemp(prefix="lipsync-bench-")
+
+
+def _configure_env(args):
+    # Everything offline and throwaway; must happen before app is imported
+    os.environ["TTS_BACKEND"] = "stub"
+    os.environ["PIPELINE_MODE"] = args.pipeline
+    os.environ.setdefault("WAV2LIP_CHECKPOINT", "random")
+    os.environ.setdefault("ARTIFACT_DIR", os.path.join(_work, "artifacts"))
+    os.environ.setdefault("SEGMENT_CACHE_DIR", os.path.join(_work, "segments"))
+    os.environ.setdefault("AVATAR_DIR", os.path.join(_work, "avatars"))
+    if "FACE_IMAGE" not in os.environ and not os.path.exists("/app/geoff.png"):
+        os.environ["FACE_IMAGE"] = os.path.join(_here, "geoff.png")
+
+
+def _seed_face_artifact(app, face_box: str | None):
+    """Persist a fixed face box so the benchmark never needs the face detector weights."""
+    import cv2
+    from startup_artifacts import load_face_coords
+
+    def box():
+        if face_box:
+            return tuple(int(v) for v in face_box.split(","))
+        h, w = cv2.imread(app.FACE).shape[:2]
+        return (h // 4, h // 2, w // 4, 3 * w // 4)
+
+    load_face_coords(app.FACE, app.PADS, app.ARTIFACT_DIR, box)
+
+
+def _text_for(seconds: float) -> str:
+    from tts import StubTTS
+
+    sentence = "Let's talk about the hard braking on your shift today. "
+    chars = int(seconds / StubTTS.SECONDS_PER_CHAR)
+    return (sentence * (chars // len(sentence) + 1))[:chars].strip() + "."
+
+
+def _percentiles(values: list[float]) -> dict:
+    arr = np.asarray(values)
+    return {f"p{q}": round(float(np.percentile(arr, q)), 4) for q in (50, 95, 99)}
+
+
+def _summarize(target, concurrency, clip_seconds, wall, samples) -> dict:
+    stage_means = {}
+    for name in ("queue", "tts", "decode", "mel", "batch", "inference", "interpolate", "composite", "encode", "mux"):
+        vals = [s.get(name, 0.0) for s in samples]
+        if any(vals):
+            stage_means[name] = round(sum(vals) / len(vals), 4)
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "clip_seconds": clip_seconds,
+        "clips": len(samples),
+        "wall_seconds": round(wall, 3),
+        "clips_per_second": round(len(samples) / wall, 3) if wall else None,
+        "latency": _percentiles([s.total for s in samples]),
+        "stage_mean_seconds": stage_means,
+    }
+
+
+def _run_render(app, timing, audio_bytes: bytes, clips: int, concurrency: int,
+                quality: str = "full") -> tuple[float, list]:
+    from quality import choose
+
+    avatar = app._avatars.get(app.DEFAULT_AVATAR)
+    preset = choose(quality, 0)
+
+    def one(i):
+        out_path = os.path.join(_work, f"render-{i}-{time.monotonic_ns()}.mp4")
+        times = timing.start()
+        app._render(audio_bytes, out_path, False, avatar, preset)
+        timing.finish("render", times)
+        os.remove(out_path)
+        return times
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(clips)))
+    return time.perf_counter() - t0, samples
+
+
+async def _run_http(app, timing, target: str, text: str, audio_bytes: bytes, clips: int, concurrency: int,
+                    quality: str = "full"):
+    import httpx
+
+    samples = []
+
+    def collect(kind, times):
+        samples.append(times)
+
+    timing.observers.append(collect)
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one():
+            async with sem:
+                if target == "speak":
+                    resp = await client.post("/speak", json={"text": text, "quality": quality})
+                else:
+                    resp = await client.post("/lipsync", params={"quality": quality},
+                                             files={"audio": ("bench.wav", audio_bytes, "audio/wav")})
+                resp.raise_for_status()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(clips)))
+        wall = time.perf_counter() - t0
+    timing.observers.remove(collect)
+    return wall, samples
+
+
+def _print_row(r: dict):
+    lat = r["latency"]
+    stages = " ".join(f"{k}={v:.3f}" for k, v in r["stage_mean_seconds"].items())
+    print(
+        f"{r['target']:>8} c={r['concurrency']:<3} clip={r['clip_seconds']:>5.1f}s n={r['clips']:<4}"
+        f" {r['clips_per_second']:>7.3f} clips/s  p50={lat['p50']:.3f} p95={lat['p95']:.3f} p99={lat['p99']:.3f}"
+        f"  | {stages}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("render", "speak", "lipsync"), default="render")
+    parser.add_argument("--pipeline", choices=("serial", "pipelined"), default="serial")
+    parser.add_argument("--concurrency", default="1", help="comma-separated, e.g. 1,2,4")
+    parser.add_argument("--clip-seconds", default="4", help="comma-separated clip lengths")
+    parser.add_argument("--quality", choices=("full", "fast", "auto"), default="full")
+    parser.add_argument("--clips", type=int, default=10, help="clips per configuration")
+    parser.add_argument("--face-box", help="y1,y2,x1,x2 to use instead of a centred default")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    _configure_env(args)
+    sys.path.insert(0, _here)
+    import app
+    import timing
+    from tts import StubTTS
+
+    _seed_face_artifact(app, args.face_box)
+    app._warmup()
+    if app._startup["status"] != "ready":
+        sys.exit(f"warmup failed: {app._startup['error']}")
+
+    results = []
+    for clip_seconds in (float(v) for v in args.clip_seconds.split(",")):
+        text = _text_for(clip_seconds)
+        audio_bytes = asyncio.run(StubTTS().synthesize(text))
+        for concurrency in (int(v) for v in args.concurrency.split(",")):
+            if args.target == "render":
+                _run_render(app, timing, audio_bytes, 1, 1, args.quality)  # untimed warm clip
+                wall, samples = _run_render(app, timing, audio_bytes, args.clips, concurrency, args.quality)
+            else:
+                asyncio.run(_run_http(app, timing, args.target, text, audio_bytes, 1, 1, args.quality))
+                wall, samples = asyncio.run(
+                    _run_http(app, timing, args.target, text, audio_bytes, args.clips, concurrency, args.quality)
+                )
+            row = _summarize(args.target, concurrency, clip_seconds, wall, samples)
+            row["pipeline"] = args.pipeline
+            row["quality"] = args.quality
+            row["device"] = app.device
+            results.append(row)
+            _print_row(row)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if app._mel_executor is not None:
+        app._mel_executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""CPU-optimized Wav2Lip inference backends, selected at startup with CPU_BACKEND.
+
+  eager        plain PyTorch float32 (the reference), channels-last layout
+  torchscript  traced, frozen and optimized-for-inference TorchScript graph
+  onnx         ONNX Runtime float32 session (requires onnxruntime)
+  onnx-int8    ONNX Runtime with dynamically quantized int8 weights
+
+Wav2Lip is built entirely from Conv2d/ConvTranspose2d layers, which PyTorch's
+dynamic quantization does not cover, so int8 goes through ONNX Runtime's
+quantizer (ConvInteger) instead.
+
+Every non-eager backend is checked against the eager model on random inputs
+before it is used (check_parity); if it drifts past tolerance the service
+falls back to eager rather than serving bad frames.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+from startup_artifacts import onnx_artifact
+
+BACKENDS = ("eager", "torchscript", "onnx", "onnx-int8")
+
+# Mean absolute difference allowed on the [0, 1] output image, per backend
+PARITY_TOLERANCE = {
+    "eager": 1e-6,
+    "torchscript": 1e-4,
+    "onnx": 1e-4,
+    "onnx-int8": 2e-2,
+}
+
+IMG_SIZE = 96
+MEL_SHAPE = (80, 16)
+
+
+def configure_threads(num_threads: int):
+    """Pin intra-op parallelism; inter-op is kept small since batches are sequential."""
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(min(2, num_threads))
+    except RuntimeError:
+        pass  # already set — only allowed before the first parallel op
+
+
+def example_inputs(batch_size: int, seed: int = 0) -> tuple[torch.Tensor, torch.Tensor]:
+    """Random (mel, face) inputs with Wav2Lip's shapes and value ranges."""
+    gen = torch.Generator().manual_seed(seed)
+    mel = torch.randn(batch_size, 1, *MEL_SHAPE, generator=gen)
+    img = torch.rand(batch_size, 6, IMG_SIZE, IMG_SIZE, generator=gen)
+    return mel, img
+
+
+class _Eager:
+    def __init__(self, model: torch.nn.Module):
+        self.model = model.to(memory_format=torch.channels_last)
+
+    def __call__(self, mel: torch.Tensor, img: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.model(mel, img.contiguous(memory_format=torch.channels_last))
+
+
+class _TorchScript:
+    def __init__(self, model: torch.nn.Module, batch_size: int):
+        model = model.to(memory_format=torch.channels_last)
+        mel, img = example_inputs(batch_size)
+        with torch.inference_mode():
+            traced = torch.jit.trace(model, (mel, img.contiguous(memory_format=torch.channels_last)))
+        self.module = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+    def __call__(self, mel: torch.Tensor, img: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.module(mel, img.contiguous(memory_format=torch.channels_last))
+
+
+class _OnnxRuntime:
+    def __init__(self, model: torch.nn.Module, batch_size: int, num_threads: int, quantize: bool, artifact):
+        import onnxruntime as ort
+
+        def export(out_path: str):
+            mel, img = example_inputs(batch_size)
+            torch.onnx.export(
+                model, (mel, img), out_path,
+                input_names=["mel", "face"], output_names=["pred"],
+                dynamic_axes={"mel": {0: "batch"}, "face": {0: "batch"}, "pred": {0: "batch"}},
+                opset_version=18,
+                external_data=False,  # one self-contained file, so the artifact can be renamed into place
+            )
+
+        path = artifact("wav2lip.onnx", export)
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            fp32_path = path
+            path = artifact("wav2lip.int8.onnx",
+                            lambda out_path: quantize_dynamic(fp32_path, out_path, weight_type=QuantType.QUInt8))
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = num_threads
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+
+    def __call__(self, mel: torch.Tensor, img: torch.Tensor) -> torch.Tensor:
+        (pred,) = self.session.run(None, {
+            "mel": np.ascontiguousarray(mel.numpy(), dtype=np.float32),
+            "face": np.ascontiguousarray(img.numpy(), dtype=np.float32),
+        })
+        return torch.from_numpy(pred)
+
+
+def build_backend(model: torch.nn.Module, backend: str, batch_size: int, num_threads: int,
+                  checkpoint_path: str | None = None, artifact_dir: str | None = None):
+    """Wrap an eval-mode CPU Wav2Lip model as a callable (mel, face) -> pred.
+
+    ONNX exports are reused from artifact_dir when the model was loaded from
+    checkpoint_path (see startup_artifacts.onnx_artifact); random weights, or
+    an unwritable artifact_dir, export into a private temp directory instead.
+    """
+    if backend == "eager":
+        return _Eager(model)
+    if backend == "torchscript":
+        return _TorchScript(model, batch_size)
+    if backend in ("onnx", "onnx-int8"):
+        scratch = []
+
+        def artifact(name: str, write) -> str:
+            if checkpoint_path and artifact_dir:
+                try:
+                    return onnx_artifact(checkpoint_path, artifact_dir, name, write)
+                except OSError as e:
+                    print(f"[startup] Could not persist {name} artifact: {e}")
+            if not scratch:
+                scratch.append(tempfile.mkdtemp(prefix="wav2lip-onnx-"))
+            path = os.path.join(scratch[0], name)
+            write(path)
+            return path
+
+        return _OnnxRuntime(model, batch_size, num_threads, backend == "onnx-int8", artifact)
+    raise ValueError(f"Unknown CPU backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+
+
+def check_parity(reference, candidate, backend: str, batch_size: int = 4) -> float:
+    """Compare a backend against the eager reference; raises ValueError past tolerance.
+
+    Returns the mean absolute difference of the predicted images.
+    """
+    mel, img = example_inputs(batch_size, seed=1)
+    with torch.inference_mode():
+        expected = reference(mel, img).float()
+    actual = candidate(mel, img).float()
+    if actual.shape != expected.shape:
+        raise ValueError(f"{backend} output shape {tuple(actual.shape)} != eager {tuple(expected.shape)}")
+    diff = (actual - expected).abs().mean().item()
+    if diff > PARITY_TOLERANCE[backend]:
+        raise ValueError(f"{backend} drifts from eager: mean abs diff {diff:.2e} > {PARITY_TOLERANCE[backend]:.0e}")
+    return diff
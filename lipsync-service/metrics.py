@@ -0,0 +1,141 @@
+"""Prometheus metrics for the render pipeline, fed by timing.py.
+
+Every finished /speak or /lipsync request contributes its per-stage seconds
+to `lipsync_stage_seconds{endpoint,stage}` and its wall time to
+`lipsync_request_seconds{endpoint}`. Histograms are fixed-bucket and
+lock-protected, so observing costs a bisect and a few additions; rendering
+the text exposition only happens when /metrics is scraped.
+
+The admission queue (admission.py) sets `lipsync_queue_depth{priority}` and
+`lipsync_renders_active` as requests come and go, and counts turned-away
+requests in `lipsync_rejected_total{priority,status}`.
+"""
+
+import bisect
+import threading
+
+import timing
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+REQUEST_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{n}="{v}"' for n, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Current value per tuple of label values."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._series: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, labels: tuple, value: float):
+        with self._lock:
+            self._series[labels] = value
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            snapshot = dict(self._series)
+        for labels, value in sorted(snapshot.items()):
+            base = ",".join(f'{n}="{v}"' for n, v in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value:g}" if base else f"{self.name} {value:g}")
+        return lines
+
+
+class Counter(Gauge):
+    """Running total per tuple of label values; only inc() it."""
+
+    kind = "counter"
+
+
+stage_seconds = Histogram(
+    "lipsync_stage_seconds", "Seconds spent in each render stage per request.",
+    ("endpoint", "stage"), STAGE_BUCKETS,
+)
+request_seconds = Histogram(
+    "lipsync_request_seconds", "Wall time of successful render requests.",
+    ("endpoint",), REQUEST_BUCKETS,
+)
+
+queue_depth = Gauge(
+    "lipsync_queue_depth", "Render requests waiting for a slot.", ("priority",),
+)
+renders_active = Gauge(
+    "lipsync_renders_active", "Render requests holding a slot.", (),
+)
+rejected = Counter(
+    "lipsync_rejected_total", "Render requests turned away by admission control.",
+    ("priority", "status"),
+)
+
+
+def _observe(kind: str, times: timing.StageTimes):
+    for name, seconds in times.items():
+        stage_seconds.observe((kind, name), seconds)
+    request_seconds.observe((kind,), times.total)
+
+
+timing.observers.append(_observe)
+
+
+def render() -> str:
+    """Prometheus text exposition (format 0.0.4) of all metrics."""
+    lines = stage_seconds.render() + request_seconds.render()
+    for metric in (queue_depth, renders_active, rejected):
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(times: timing.StageTimes) -> str:
+    """Server-Timing header value, stages in pipeline order, durations in ms."""
+    parts = [f"{name};dur={times[name] * 1000:.1f}" for name in timing.STAGES if name in times]
+    if times.total is not None:
+        parts.append(f"total;dur={times.total * 1000:.1f}")
+    return ", ".join(parts)
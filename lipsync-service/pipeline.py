@@ -0,0 +1,159 @@
+"""Pipelined lipsync rendering: CPU stages run beside model inference.
+
+PIPELINE_MODE=pipelined splits a clip into three overlapping stages:
+
+1. Audio decode + mel + chunking run in a worker process (mel_features), so
+   the next request's features are ready while the current one holds the model.
+2. Model inference runs on the request thread, in batches as large as serial
+   mode's, with TORCH_NUM_THREADS leaving cores free for stages 1 and 3.
+3. A writer thread composites each predicted batch into the frame buffer and
+   streams raw frames to an ffmpeg subprocess that encodes and muxes in one
+   pass. A bounded queue between 2 and 3 keeps memory flat and applies
+   backpressure if encoding falls behind.
+
+This module is imported by spawned worker processes, so it must stay free of
+service state (no model, no FastAPI app).
+"""
+
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Worker processes start fresh, so they need the Wav2Lip path too
+W2L = os.getenv("WAV2LIP_DIR", "/app/Wav2Lip")
+if W2L not in sys.path:
+    sys.path.insert(0, W2L)
+
+import audio  # noqa: E402  (Wav2Lip's audio module)
+
+from audio_decode import decode_audio  # noqa: E402
+
+_SENTINEL = None
+
+
+def chunk_mel(mel: np.ndarray, fps: float, step: int) -> np.ndarray:
+    """Slice a (80, T) mel spectrogram into one (80, step) window per video frame."""
+    mel_idx_multiplier = 80.0 / fps
+    n_mel = mel.shape[1]
+    starts = []
+    i = 0
+    while True:
+        start_idx = int(i * mel_idx_multiplier)
+        if start_idx + step > n_mel:
+            starts.append(n_mel - step)
+            break
+        starts.append(start_idx)
+        i += 1
+    return np.stack([mel[:, s: s + step] for s in starts]).astype(np.float32)
+
+
+def mel_features(audio_bytes: bytes, fps: float, step: int) -> tuple[np.ndarray, bytes]:
+    """Worker entry point: encoded audio -> (per-frame mel chunks, bytes for muxing)."""
+    decoded = decode_audio(audio_bytes)
+    mel = audio.melspectrogram(decoded.wav)
+    if np.isnan(mel).any():
+        raise ValueError("Mel contains nan!")
+    return chunk_mel(mel, fps, step), decoded.mux_bytes
+
+
+class FrameEncoder:
+    """Composites predicted faces into a frame buffer and streams them to ffmpeg.
+
+    ffmpeg reads raw BGR frames on stdin and the audio on a second pipe, and
+    writes the final H.264/AAC MP4 directly — no intermediate AVI, no separate
+    mux pass.
+    """
+
+    def __init__(self, out_path: str, frame_buf: np.ndarray, paste_at: tuple, fps: float,
+                 audio_bytes: bytes, depth: int, times=None):
+        self.frame_buf = frame_buf
+        self.times = times  # timing.StageTimes of the request, if it is being timed
+        self.paste_at = paste_at
+        self.error: BaseException | None = None
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+
+        height, width = frame_buf.shape[:2]
+        audio_r, audio_w = os.pipe()
+        try:
+            self._proc = subprocess.Popen(
+                ["ffmpeg", "-y",
+                 "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+                 "-i", f"pipe:{audio_r}",
+                 "-pix_fmt", "yuv420p", "-strict", "-2", out_path],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(audio_r,),
+            )
+        finally:
+            os.close(audio_r)
+
+        # ffmpeg opens its inputs in turn, so audio must be fed concurrently with frames
+        self._audio_thread = threading.Thread(target=self._feed_audio, args=(audio_w, audio_bytes), daemon=True)
+        self._writer = threading.Thread(target=self._write_frames, daemon=True)
+        self._audio_thread.start()
+        self._writer.start()
+
+    @staticmethod
+    def _feed_audio(fd: int, data: bytes):
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; surfaced by its return code
+
+    def _write_frames(self):
+        y1, y2, x1, x2 = self.paste_at
+        size = (x2 - x1, y2 - y1)
+        while True:
+            pred = self._queue.get()
+            if pred is _SENTINEL:
+                return
+            if self.error is not None:
+                continue  # keep draining so the producer never blocks
+            composite = encode = 0.0
+            try:
+                for p in pred:
+                    t0 = time.perf_counter()
+                    self.frame_buf[y1:y2, x1:x2] = cv2.resize(p.astype(np.uint8), size)
+                    t1 = time.perf_counter()
+                    self._proc.stdin.write(self.frame_buf.data)
+                    composite += t1 - t0
+                    encode += time.perf_counter() - t1
+            except BaseException as e:
+                self.error = e
+            if self.times is not None:
+                self.times.add("composite", composite)
+                self.times.add("encode", encode)
+
+    def put(self, pred: np.ndarray):
+        """Queue a (B, 96, 96, 3) batch of predictions in [0, 255]; blocks when the queue is full."""
+        if self.error is not None:
+            raise RuntimeError(f"Frame encoding failed: {self.error}") from self.error
+        self._queue.put(pred)
+
+    def close(self, abort: bool = False):
+        """Flush remaining frames and wait for ffmpeg; kills it instead when aborting."""
+        if abort:
+            self.error = self.error or RuntimeError("aborted")
+            self._proc.kill()
+        self._queue.put(_SENTINEL)
+        self._writer.join()
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._proc.wait()
+        self._audio_thread.join()
+        if abort:
+            return
+        if self.error is not None:
+            raise RuntimeError(f"Frame encoding failed: {self.error}") from self.error
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "ffmpeg")
@@ -0,0 +1,100 @@
+"""Render quality presets: trade some fidelity for latency when the service is busy.
+
+/speak and /lipsync take quality=full|fast|auto:
+
+- full: every video frame goes through the model, output at the avatar's
+  resolution (the default, and what every clip used before)
+- fast: the model only sees every FAST_FRAME_STRIDE-th frame; the frames in
+  between are blended from the neighbouring predictions (FAST_FRAME_MODE=blend)
+  or repeat the previous one (repeat). The output frame is scaled by
+  FAST_OUTPUT_SCALE (1 keeps the resolution), which shrinks compositing and
+  encoding work too.
+- auto: fast when at least AUTO_FAST_QUEUE_DEPTH requests are waiting for a
+  render slot (see admission.py) as this one starts rendering, else full
+
+Frame rate, frame count and audio are the same in every mode, so lip sync
+timing does not change. Responses say which one was used in X-Render-Quality.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+FAST_FRAME_STRIDE = max(int(os.getenv("FAST_FRAME_STRIDE", "2")), 1)
+FAST_FRAME_MODE = os.getenv("FAST_FRAME_MODE", "blend")  # "blend" or "repeat"
+FAST_OUTPUT_SCALE = float(os.getenv("FAST_OUTPUT_SCALE", "0.5"))
+AUTO_FAST_QUEUE_DEPTH = int(os.getenv("AUTO_FAST_QUEUE_DEPTH", "1"))
+
+QUALITIES = ("full", "fast", "auto")
+
+
+class RenderQuality:
+    """Resolved settings for one render."""
+
+    __slots__ = ("name", "stride", "blend", "scale")
+
+    def __init__(self, name: str, stride: int = 1, blend: bool = True, scale: float = 1.0):
+        self.name = name
+        self.stride = stride
+        self.blend = blend
+        self.scale = scale
+
+
+FULL = RenderQuality("full")
+FAST = RenderQuality("fast", FAST_FRAME_STRIDE, FAST_FRAME_MODE != "repeat", FAST_OUTPUT_SCALE)
+
+
+def choose(requested: str, queue_depth: int) -> RenderQuality:
+    """The preset for a request; auto looks at how many requests are waiting behind it."""
+    if requested == "fast" or (requested == "auto" and queue_depth >= AUTO_FAST_QUEUE_DEPTH):
+        return FAST
+    return FULL
+
+
+def scale_frame(frame_buf: np.ndarray, paste_at: tuple, scale: float) -> tuple[np.ndarray, tuple]:
+    """Shrink an output frame buffer (to even dimensions) and its face box with it."""
+    if scale == 1.0:
+        return frame_buf, paste_at
+    h, w = frame_buf.shape[:2]
+    sh, sw = max(int(h * scale) // 2 * 2, 2), max(int(w * scale) // 2 * 2, 2)
+    fy, fx = sh / h, sw / w
+    y1, y2, x1, x2 = paste_at
+    scaled = cv2.resize(frame_buf, (sw, sh), interpolation=cv2.INTER_AREA)
+    return scaled, (round(y1 * fy), max(round(y2 * fy), round(y1 * fy) + 1),
+                    round(x1 * fx), max(round(x2 * fx), round(x1 * fx) + 1))
+
+
+class KeyframeExpander:
+    """Rebuilds every frame of a clip from predictions for every `stride`-th frame.
+
+    Feed it the predicted batches in order; each call returns the frames that
+    are complete once those keyframes are known (a frame between two keyframes
+    needs both), and finish() returns the tail after the last keyframe.
+    """
+
+    def __init__(self, stride: int, total: int, blend: bool = True):
+        self.stride = stride
+        self.total = total
+        self.blend = blend
+        self._last = None
+        self._emitted = 0
+        # Weight of the next keyframe for each frame of a stride
+        self._weights = (np.arange(stride, dtype=np.float32) / stride)[:, None, None, None]
+
+    def feed(self, keys: np.ndarray) -> np.ndarray:
+        if self._last is not None:
+            keys = np.concatenate([self._last[None], keys])
+        self._last = keys[-1]
+        a, b = keys[:-1, None], keys[1:, None]
+        if self.blend:
+            frames = a + (b - a) * self._weights
+        else:
+            frames = np.broadcast_to(a, (len(a), self.stride) + a.shape[2:])
+        frames = frames.reshape((-1,) + keys.shape[1:])
+        self._emitted += len(frames)
+        return frames
+
+    def finish(self) -> np.ndarray:
+        remaining = max(self.total - self._emitted, 0)
+        return np.repeat(self._last[None], remaining, axis=0)
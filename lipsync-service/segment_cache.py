@@ -0,0 +1,139 @@
+"""Sentence-level cache of rendered lipsync segments for phrase splicing.
+
+Coaching scripts are mostly recombinations of recurring sentences ("Thanks for
+taking a minute with me.", "Let's talk about your shift."). Each sentence is
+rendered once to its own MP4 (video + audio) and reused; a full script is then
+assembled by concatenating segments with ffmpeg stream copy, so only novel
+sentences ever hit TTS and Wav2Lip.
+"""
+
+import contextlib
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Split after terminal punctuation followed by whitespace. Keeps the
+# punctuation attached so TTS prosody for each sentence is unchanged.
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split text into sentences on terminal punctuation."""
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+class SegmentCache:
+    """Bounded on-disk cache of rendered segments, evicted least-recently-used.
+
+    Recency is tracked in memory (seeded from file mtimes at startup), so a
+    put never has to list the directory. Hits are checked out into the
+    caller's work directory as hard links (or copies across filesystems):
+    a segment evicted by a concurrent put stays readable until the splice
+    that looked it up is done with it.
+    """
+
+    def __init__(self, root: str, max_entries: int):
+        self.root = root
+        self.max_entries = max_entries
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> None, least recently used first
+        self._entries: OrderedDict[str, None] = OrderedDict()
+        existing = []
+        for name in os.listdir(root):
+            if name.endswith(".mp4"):
+                try:
+                    existing.append((os.stat(os.path.join(root, name)).st_mtime, name[:-4]))
+                except FileNotFoundError:
+                    continue
+        for _, key in sorted(existing):
+            self._entries[key] = None
+        self._evict()
+
+    @staticmethod
+    def key(sentence: str, *parts: str) -> str:
+        """Cache key for a sentence rendered with the given voice/face parameters."""
+        normalized = _WHITESPACE_RE.sub(" ", sentence.strip())
+        h = hashlib.sha256(normalized.encode())
+        for part in parts:
+            h.update(b"\0" + part.encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.mp4")
+
+    def checkout(self, key: str, dest: str) -> bool:
+        """Link (or copy) the cached segment to dest; False on a miss."""
+        path = self._path(key)
+        try:
+            try:
+                os.link(path, dest)
+            except FileNotFoundError:
+                raise
+            except OSError:  # different filesystem, or no hard links
+                shutil.copyfile(path, dest)
+        except FileNotFoundError:
+            with self._lock:
+                self._entries.pop(key, None)
+            return False
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)  # keep recency across restarts
+        with self._lock:
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+        return True
+
+    def put(self, key: str, src_path: str):
+        """Copy a freshly rendered segment into the cache."""
+        path = self._path(key)
+        # Copy into the cache dir first so the final rename is atomic
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            excess = len(self._entries) - self.max_entries
+            victims = [self._entries.popitem(last=False)[0] for _ in range(max(excess, 0))]
+        for key in victims:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+def concat_segments(paths: list[str], out_path: str):
+    """Concatenate MP4 segments with ffmpeg's concat demuxer — stream copy, no re-encode.
+
+    All segments come out of the same Wav2Lip + mux pipeline, so codec
+    parameters match and the concat demuxer can join them losslessly.
+    """
+    list_path = out_path.rsplit(".", 1)[0] + ".txt"
+    with open(list_path, "w") as f:
+        for p in paths:
+            escaped = p.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        subprocess.check_call(
+            ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+             "-c", "copy", "-movflags", "+faststart", out_path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    finally:
+        os.remove(list_path)
@@ -0,0 +1,104 @@
+"""Startup artifacts that let the service skip its slowest cold-start work.
+
+- The Wav2Lip checkpoint is re-saved as a bare state dict (no "module."
+  prefixes, no optimizer state) that torch.load can memory-map, so weights are
+  paged in on demand instead of unpickled up front.
+- Face detections are persisted as JSON keyed by the image's content hash, so
+  the face detector is only ever built when an image is new or has changed.
+- ONNX exports (and their int8 quantization) for CPU_BACKEND=onnx/onnx-int8
+  are kept per checkpoint fingerprint, so they are built once, not every start.
+
+Artifacts are written on first use (or at image build time with
+`python3 app.py --prepare-artifacts`); any write failure just means the slow
+path runs again next start.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import torch
+
+
+def _atomic_write(path: str, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _checkpoint_fingerprint(path: str) -> str:
+    # Size + mtime is enough to notice a swapped checkpoint without hashing ~400 MB
+    st = os.stat(path)
+    return f"{st.st_size}-{int(st.st_mtime)}"
+
+
+def load_state_dict(checkpoint_path: str, artifact_dir: str) -> tuple[dict, bool]:
+    """Return (Wav2Lip state dict, loaded_from_artifact).
+
+    Prefers the memory-mappable artifact; otherwise loads the original
+    checkpoint and writes the artifact for next time.
+    """
+    artifact = os.path.join(artifact_dir, f"wav2lip_state-{_checkpoint_fingerprint(checkpoint_path)}.pt")
+    if os.path.exists(artifact):
+        return torch.load(artifact, map_location="cpu", mmap=True, weights_only=True), True
+
+    checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    state = {k.replace("module.", ""): v for k, v in checkpoint["state_dict"].items()}
+    try:
+        _atomic_write(artifact, lambda tmp: torch.save(state, tmp))
+    except OSError as e:
+        print(f"[startup] Could not persist model artifact: {e}")
+    return state, False
+
+
+def onnx_artifact(checkpoint_path: str, artifact_dir: str, name: str, write) -> str:
+    """Path of an ONNX model derived from the checkpoint, keyed on its fingerprint.
+
+    write(path) produces the file; it only runs when no artifact exists for
+    this checkpoint yet, and its output is renamed into place, so concurrent
+    workers never load a half-written model.
+    """
+    stem, ext = os.path.splitext(name)
+    artifact = os.path.join(artifact_dir, f"{stem}-{_checkpoint_fingerprint(checkpoint_path)}{ext}")
+    if not os.path.exists(artifact):
+        _atomic_write(artifact, write)
+    return artifact
+
+
+def image_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_face_coords(image_path: str, pads: list[int], artifact_dir: str, detect) -> tuple[tuple, bool]:
+    """Return ((y1, y2, x1, x2), loaded_from_artifact) for the face in image_path.
+
+    `detect` is only called when no artifact matches the image content and pads.
+    """
+    key = hashlib.sha256(f"{image_digest(image_path)}:{pads}".encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    artifact = os.path.join(artifact_dir, f"{name}-{key}.face.json")
+    try:
+        with open(artifact) as f:
+            return tuple(json.load(f)["coords"]), True
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+
+    coords = tuple(int(c) for c in detect())
+    try:
+        _atomic_write(artifact, lambda tmp: _write_json(tmp, {"image": image_path, "pads": pads, "coords": coords}))
+    except OSError as e:
+        print(f"[startup] Could not persist face artifact: {e}")
+    return coords, False
+
+
+def _write_json(path: str, obj: dict):
+    with open(path, "w") as f:
+        json.dump(obj, f)
@@ -0,0 +1,69 @@
+"""Low-overhead per-stage timers for the render pipeline.
+
+A request calls start() to get a StageTimes recorder bound to its context;
+code anywhere below it wraps work in `with stage("mel"):` or calls add()
+directly inside tight loops. contextvars follow the request into
+run_in_threadpool, so handlers and the render thread share one recorder.
+When nothing is recording, stage() costs a single ContextVar lookup.
+
+finish() hands the completed timings to every registered observer (the
+benchmark harness, metrics aggregation).
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+STAGES = ("queue", "tts", "decode", "mel", "batch", "inference", "interpolate", "composite", "encode", "mux")
+
+
+class StageTimes(dict):
+    """Seconds spent per stage for one request; stages may be hit many times."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.total = None
+
+    def add(self, name: str, seconds: float):
+        self[name] = self.get(name, 0.0) + seconds
+
+
+_current: contextvars.ContextVar[StageTimes | None] = contextvars.ContextVar("stage_times", default=None)
+
+observers: list = []  # callables (kind, StageTimes) -> None
+
+
+def start() -> StageTimes:
+    times = StageTimes()
+    _current.set(times)
+    return times
+
+
+def current() -> StageTimes | None:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    times = _current.get()
+    if times is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        times.add(name, time.perf_counter() - t0)
+
+
+def finish(kind: str, times: StageTimes | None = None) -> StageTimes | None:
+    """Close out a request's timings and notify observers."""
+    if times is None:
+        times = _current.get()  # an explicit StageTimes is used even while still empty
+    if times is None:
+        return None
+    times.total = time.perf_counter() - times.started
+    for observer in observers:
+        observer(kind, times)
+    return times
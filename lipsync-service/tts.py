@@ -0,0 +1,137 @@
+"""Async text-to-speech backends for the lipsync service.
+
+GoogleTTS talks to Cloud TTS over a pooled httpx connection and only refreshes
+its access token when it is close to expiry. StubTTS synthesizes a
+deterministic tone locally so the service can run without credentials or
+network (TTS_BACKEND=stub).
+"""
+
+import asyncio
+import base64
+import datetime
+import io
+import wave
+
+import google.auth
+import google.auth.transport.requests
+import httpx
+import numpy as np
+
+TTS_URL = "https://texttospeech.googleapis.com/v1/text:synthesize"
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Refresh the token this long before it expires, so a request never goes out
+# with a token that lapses in flight.
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+class GoogleTTS:
+    """Cloud TTS client with a persistent connection pool and cached credentials."""
+
+    def __init__(self, voice: dict, audio_config: dict, max_connections: int = 8, timeout: float = 15.0):
+        self.voice = voice
+        self.audio_config = audio_config
+        self._max_concurrency = max_connections
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._credentials = None
+        self._token_lock = asyncio.Lock()
+
+    def _token_fresh(self) -> bool:
+        creds = self._credentials
+        if creds is None or not creds.valid:
+            return False
+        if creds.expiry is None:
+            return True
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now > TOKEN_REFRESH_MARGIN
+
+    async def _token(self) -> str:
+        if self._token_fresh():
+            return self._credentials.token
+        async with self._token_lock:
+            # Another coroutine may have refreshed while we waited
+            if not self._token_fresh():
+                if self._credentials is None:
+                    self._credentials, _ = await asyncio.to_thread(google.auth.default, scopes=SCOPES)
+                # google-auth refresh is blocking; keep it off the event loop
+                await asyncio.to_thread(self._credentials.refresh, google.auth.transport.requests.Request())
+            return self._credentials.token
+
+    async def synthesize(self, text: str) -> bytes:
+        """Synthesize text to LINEAR16 WAV bytes."""
+        token = await self._token()
+        resp = await self._client.post(
+            TTS_URL,
+            headers={"Authorization": f"Bearer {token}"},
+            json={
+                "input": {"text": text},
+                "voice": self.voice,
+                "audioConfig": self.audio_config,
+            },
+        )
+        resp.raise_for_status()
+        return base64.b64decode(resp.json()["audioContent"])
+
+    async def synthesize_many(self, texts: list[str]) -> list[bytes]:
+        """Synthesize several texts concurrently, bounded by the connection pool size."""
+        sem = asyncio.Semaphore(self._max_concurrency)
+
+        async def one(text: str) -> bytes:
+            async with sem:
+                return await self.synthesize(text)
+
+        return list(await asyncio.gather(*(one(t) for t in texts)))
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class StubTTS:
+    """Offline TTS: a deterministic syllable-modulated tone, ~14 characters per second."""
+
+    SAMPLE_RATE = 24000
+    SECONDS_PER_CHAR = 0.07
+
+    def __init__(self, voice: dict | None = None, audio_config: dict | None = None, latency: float = 0.0):
+        self.voice = voice or {}
+        self.audio_config = audio_config or {}
+        self.latency = latency
+
+    def _render(self, text: str) -> bytes:
+        n = max(int(len(text) * self.SECONDS_PER_CHAR * self.SAMPLE_RATE), self.SAMPLE_RATE // 4)
+        t = np.arange(n) / self.SAMPLE_RATE
+        # 120 Hz voice-ish carrier with a 4 Hz "syllable" envelope so the mel
+        # spectrogram has speech-like energy variation
+        envelope = 0.5 * (1 - np.cos(2 * np.pi * 4 * t))
+        pcm = (0.3 * envelope * np.sin(2 * np.pi * 120 * t) * 32767).astype("<i2")
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.SAMPLE_RATE)
+            w.writeframes(pcm.tobytes())
+        return buf.getvalue()
+
+    async def synthesize(self, text: str) -> bytes:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._render(text)
+
+    async def synthesize_many(self, texts: list[str]) -> list[bytes]:
+        return list(await asyncio.gather(*(self.synthesize(t) for t in texts)))
+
+    async def aclose(self):
+        pass
+
+
+def create_tts(backend: str, voice: dict, audio_config: dict, max_connections: int = 8):
+    """Build the TTS backend named by TTS_BACKEND ('google' or 'stub')."""
+    if backend == "google":
+        return GoogleTTS(voice, audio_config, max_connections=max_connections)
+    if backend == "stub":
+        return StubTTS(voice, audio_config)
+    raise ValueError(f"Unknown TTS backend '{backend}'")
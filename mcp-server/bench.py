@@ -0,0 +1,167 @@
+"""Offline benchmark for the MCP tools against synthetic fleets of growing size.
+
+Each tool runs against replay.FakeGeotabAPI and a local OData stub, so no
+credentials or network are needed. For every fleet size it reports per-tool
+latency (median / max over --repeat runs), upstream round trips (from the
+tracing spans) and peak Python memory (tracemalloc).
+
+    python bench.py                                    # 10, 100, 1000 devices
+    python bench.py --devices 50,500 --events-per-day 400 --latency-ms 40
+    python bench.py --tools get_safety_events --json bench.json
+
+--latency-ms adds a simulated round-trip time to every Geotab call; the OData
+stub is real HTTP on localhost. ask_ace is excluded: it sleeps while polling.
+Each timed run starts with empty reference/OData/risk caches unless --warm is
+given, which measures the cached path instead. --revalidate expires cached
+OData results rather than dropping them, so they come back as 304s.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+TOOLS = ("get_safety_events", "get_fleet_kpis", "get_driver_rankings", "get_vehicle_details", "get_driver_history",
+         "compare_vehicles", "compare_drivers", "get_driver_risk")
+
+
+def _tool_args(name: str, fleet, args) -> dict:
+    if name == "get_safety_events":
+        return {"days": 7, "enrich": args.enrich}
+    if name == "get_driver_rankings":
+        return {"sort_by": "total_events", "limit": 20}
+    if name == "get_vehicle_details":
+        return {"vehicle_name": fleet.devices[len(fleet.devices) // 2]["name"]}
+    if name == "get_driver_history":
+        user = fleet.users[len(fleet.users) // 2]
+        return {"driver_name": f"{user['firstName']} {user['lastName']}", "days": 14}
+    if name == "compare_vehicles":
+        return {"vehicle_names": [d["name"] for d in fleet.devices[:10]]}
+    if name == "compare_drivers":
+        return {"driver_names": [f"{u['firstName']} {u['lastName']}" for u in fleet.users[:10]], "days": 14}
+    return {}
+
+
+async def _bench_fleet(server, replay, tracing, args, devices: int) -> list[dict]:
+    from geotab_client import GeotabClient
+    import odata_client
+    from tenants import default_database
+
+    drivers = max(1, int(devices * args.drivers_per_device))
+    fleet = replay.SyntheticFleet(devices=devices, drivers=drivers, events_per_day=args.events_per_day,
+                                  seed=args.seed, episode_rate=args.episode_rate)
+    stub = replay.ODataStub(fleet.odata_tables())
+    results = []
+    async with replay.serve_odata(stub) as base_url:
+        odata_client.ODATA_BASE_URL = base_url
+        odata = odata_client.ODataClient()
+        tenant = server._pool.register(
+            default_database(), GeotabClient(api=replay.FakeGeotabAPI(fleet, latency=args.latency_ms / 1000)), odata,
+        )
+
+        for name in args.tools.split(","):
+            tool = getattr(server, name)
+            fn = getattr(tool, "fn", tool)  # FastMCP 2 wraps tools; later versions return the function
+            kwargs = _tool_args(name, fleet, args)
+            await fn(**kwargs)  # warm connection pools and caches
+
+            latencies, peaks = [], []
+            span = None
+            for _ in range(args.repeat):
+                if not args.warm:
+                    _drop_caches(tenant, args.revalidate)
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                t0 = time.perf_counter()
+                out = await fn(**kwargs)
+                latencies.append(time.perf_counter() - t0)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+                span = tracing.snapshot(limit=1)["recent"][0]
+            error = json.loads(out).get("error") if out.lstrip().startswith("{") else None
+            results.append({
+                "tool": name,
+                "devices": devices,
+                "drivers": drivers,
+                "events": len(fleet.events),
+                "medianSeconds": round(statistics.median(latencies), 4),
+                "maxSeconds": round(max(latencies), 4),
+                "upstreamCalls": sum(u["calls"] for u in span["upstream"].values()),
+                "upstreamBatched": sum(u["batched"] for u in span["upstream"].values()),
+                "upstreamBytes": sum(u["bytes"] for u in span["upstream"].values()),
+                "outputBytes": span["outputBytes"],
+                "peakMemoryKb": round(max(peaks) / 1024),
+                "error": error,
+            })
+        await odata.close()
+    return results
+
+
+def _drop_caches(tenant, revalidate: bool = False):
+    from risk import RiskEngine
+
+    tenant.geotab._reference = None
+    if revalidate:
+        cache = tenant.odata._cache
+        for key, (_, rows, validators) in cache.items():
+            cache[key] = (0.0, rows, validators)
+    else:
+        tenant.odata._cache.clear()
+    tenant.risk = RiskEngine()
+
+
+def _print_row(r: dict):
+    print(
+        f"{r['tool']:<22} dev={r['devices']:<6} ev={r['events']:<7}"
+        f" p50={r['medianSeconds'] * 1000:8.1f}ms max={r['maxSeconds'] * 1000:8.1f}ms"
+        f" calls={r['upstreamCalls']:<4} batched={r['upstreamBatched']:<4}"
+        f" in={r['upstreamBytes'] // 1024:>6}KB out={r['outputBytes'] // 1024:>5}KB"
+        f" peak={r['peakMemoryKb']:>7}KB" + (f"  ERROR {r['error']}" if r["error"] else "")
+    )
+
+
+async def _main(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import replay
+    import server
+    import tracing
+
+    tracemalloc.start()
+    results = []
+    for devices in (int(v) for v in args.devices.split(",")):
+        for row in await _bench_fleet(server, replay, tracing, args, devices):
+            results.append(row)
+            _print_row(row)
+    tracemalloc.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", default="10,100,1000", help="comma-separated fleet sizes")
+    parser.add_argument("--drivers-per-device", type=float, default=1.2)
+    parser.add_argument("--events-per-day", type=int, default=100, help="fleet-wide exception events per day")
+    parser.add_argument("--episode-rate", type=float, default=0.0,
+                        help="share of events repeated in short runs (near-duplicates)")
+    parser.add_argument("--enrich", default="point", choices=("point", "profile"),
+                        help="get_safety_events enrichment mode")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated Geotab round-trip time")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tools", default=",".join(TOOLS))
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--warm", action="store_true", help="keep caches between runs")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="expire cached OData results instead of dropping them (conditional requests)")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Group near-duplicate exception events into episodes before enrichment.
+
+A long speeding stretch (or a multi-day event re-raised every day) comes back
+from ExceptionEvent as a run of events on the same device and rule, seconds or
+minutes apart. Events with the same key (device, category) whose start is
+within EPISODE_GAP_SECONDS of the end of the episode so far belong to that
+episode. fetch_safety_events enriches one representative per episode and
+reports the rest as a member count, so GPS / road-speed lookups and the
+payload shrink by the duplication factor.
+
+Works on columns (keys, start and end timestamps) rather than event dicts:
+one sort by (key, start) and one pass over it.
+"""
+
+import os
+
+EPISODE_GAP_SECONDS = float(os.getenv("MCP_EPISODE_GAP_SECONDS", "300"))
+
+
+def cluster(keys: list, starts: list[float], ends: list[float],
+            gap_seconds: float = EPISODE_GAP_SECONDS) -> list[list[int]]:
+    """Episodes as lists of row indices, each in time order.
+
+    Episodes come out in order of their earliest row's index, so the input
+    order (e.g. newest first) carries over.
+    """
+    order = sorted(range(len(keys)), key=lambda i: (keys[i], starts[i]))
+    episodes: list[list[int]] = []
+    current: list[int] = []
+    current_end = 0.0
+    for i in order:
+        if current and keys[i] == keys[current[0]] and starts[i] - current_end <= gap_seconds:
+            current.append(i)
+            current_end = max(current_end, ends[i])
+            continue
+        if current:
+            episodes.append(current)
+        current = [i]
+        current_end = ends[i]
+    if current:
+        episodes.append(current)
+    episodes.sort(key=min)
+    return episodes
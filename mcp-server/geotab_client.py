@@ -3,10 +3,15 @@
 import asyncio
 import json
 import os
-from datetime import datetime, time, timedelta, timezone
+from datetime import datetime, timedelta, timezone
 
 import mygeotab
 
+import clustering
+import kinematics
+import records
+import tracing
+
 # Built-in rule ID -> human-readable name
 BUILTIN_RULES = {
     "RuleHarshBrakingId": "Harsh Braking",
@@ -40,207 +45,372 @@ RULE_CATEGORIES = {
 }
 
 GPS_BATCH_SIZE = 20
+ENRICH_MODES = ("point", "profile")
+# Devices, users and rules change rarely; a name that is not found forces a refetch
+REFERENCE_TTL_SECONDS = float(os.getenv("MCP_REFERENCE_TTL_SECONDS", "600"))
+REFERENCE_TYPES = ("Device", "User", "Rule")
+
+
+def _count_rows(result) -> int:
+    """Rows in a Get result, a GetFeed page, or across the results of a multi_call."""
+    if isinstance(result, dict) and "toVersion" in result:
+        return len(result.get("data") or [])
+    if not isinstance(result, list):
+        return 1 if result else 0
+    if result and all(isinstance(r, list) for r in result):
+        return sum(len(r) for r in result)
+    return len(result)
+
+
+def _rule_map(rules: list[dict] | None) -> dict[str, str]:
+    """Rule id -> name, built-in rules included."""
+    rule_map = dict(BUILTIN_RULES)
+    for r in (rules or []):
+        rule_map[r["id"]] = r.get("name", r["id"])
+    return rule_map
+
+
+def _category(event: records.Event, rule_names: dict[str, str]) -> str:
+    return RULE_CATEGORIES.get(rule_names.get(event.rule_id, event.rule_id), "safety_event")
+
+
+def _episodes(events: list[records.Event], rule_names: dict[str, str]) -> list[list[records.Event]]:
+    """clustering.cluster over events keyed by (device, category); members in time order."""
+    keys = [(e.device_id, _category(e, rule_names)) for e in events]
+    episodes = clustering.cluster(keys, [e.start for e in events], [e.end for e in events])
+    return [[events[i] for i in episode] for episode in episodes]
+
+
+def _episode_summary(members: list[records.Event]) -> dict:
+    return {
+        "events": len(members),
+        "start": members[0].active_from,
+        "end": datetime.fromtimestamp(max(m.end for m in members), timezone.utc),
+        "durationSeconds": round(sum(m.duration for m in members)),
+        "distance": round(sum(m.distance or 0 for m in members), 3),
+        "eventIds": [m.id for m in members],
+    }
+
+
+def _is_speeding(event: records.Event, rule_names: dict[str, str]) -> bool:
+    return (event.rule_id in ("RulePostedSpeedingId", "RuleSpeedingId")
+            or "speed" in rule_names.get(event.rule_id, "").lower())
+
+
+def _span(event: records.Event) -> tuple[int, int]:
+    """The stretch a speed profile covers; multi-day events shrink to their lookup time."""
+    if event.duration >= 86400:
+        return event.lookup_time, event.lookup_time
+    return event.start, event.end
+
+
+def _profile_windows(events: list[records.Event]) -> tuple[list[tuple[str, int, int]], list[int]]:
+    """(device, from, to) windows padded around each event, merged per device where
+    they overlap, and the window of each event.
+
+    A merged window closes once taking in the next event would stretch it past
+    PROFILE_MAX_WINDOW_SECONDS, so its LogRecords fit in one resultsLimit. A single
+    event longer than that still gets one window of its own.
+    """
+    pad = kinematics.PROFILE_PADDING_SECONDS
+    spans = [_span(e) for e in events]
+    runs = clustering.cluster([e.device_id for e in events], [s - pad for s, _ in spans],
+                              [e + pad for _, e in spans], gap_seconds=0)
+    windows, window_of = [], [0] * len(events)
+    for run in runs:
+        device_id = events[run[0]].device_id
+        t0 = t1 = None
+        for i in run:  # in start order
+            lo, hi = spans[i][0] - pad, spans[i][1] + pad
+            if t0 is not None and max(t1, hi) - t0 > kinematics.PROFILE_MAX_WINDOW_SECONDS:
+                windows.append((device_id, t0, t1))
+                t0 = None
+            if t0 is None:
+                t0, t1 = lo, hi
+            else:
+                t1 = max(t1, hi)
+            window_of[i] = len(windows)
+        windows.append((device_id, t0, t1))
+    return windows, window_of
 
 
-def _get_id(field) -> str | None:
-    """Extract id from a Geotab reference field (may be dict or string)."""
-    if isinstance(field, dict):
-        return field.get("id")
-    if isinstance(field, str) and field and not field.startswith("Unknown"):
-        return field
-    return None
-
-
-def _to_datetime(val) -> datetime:
-    """Convert a mygeotab date field (datetime or string) to a tz-aware datetime."""
-    if isinstance(val, datetime):
-        if val.tzinfo is None:
-            return val.replace(tzinfo=timezone.utc)
-        return val
-    return datetime.fromisoformat(str(val).replace("Z", "+00:00"))
-
-
-def _event_lookup_time(event: dict) -> datetime:
-    """Get the best timestamp for GPS/speed lookups (end time for multi-day events)."""
-    t = _to_datetime(event["activeFrom"])
-    dur = event.get("duration")
-    # mygeotab may return duration as datetime.time, timedelta, or string
-    if isinstance(dur, timedelta) and dur.days > 0:
-        t = t + dur
-    elif isinstance(dur, str) and "." in dur:
-        # e.g. "2.03:15:30"
-        try:
-            parts = dur.split(".")
-            days = int(parts[0])
-            if days > 0:
-                h, m, s = parts[1].split(":")
-                t = t + timedelta(days=days, hours=int(h), minutes=int(m), seconds=int(s))
-        except (ValueError, IndexError):
-            pass
-    return t
+def _closest(items: list, t: int, lo: int, hi: int):
+    """The item whose .time is nearest t among those within [lo, hi], or None."""
+    inside = [x for x in items if lo <= x.time <= hi]
+    return min(inside, key=lambda x: abs(x.time - t)) if inside else None
 
 
-class GeotabClient:
-    def __init__(self):
-        self._api: mygeotab.API | None = None
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
 
-    def _get_api(self) -> mygeotab.API:
+class GeotabClient:
+    def __init__(self, credentials=None, max_connections: int = 8, api: mygeotab.API | None = None):
+        # credentials: tenants.Credentials; None reads GEOTAB_* from the environment.
+        # Pass an already-authenticated API (or a replay.FakeGeotabAPI) to skip authentication.
+        self._credentials = credentials
+        self._api = api
+        self._slots = asyncio.Semaphore(max_connections)  # concurrent requests to this database
+        self._auth_lock = asyncio.Lock()
+        self._reference: records.Reference | None = None
+        self._reference_expires = 0.0  # epoch seconds, so it survives a warm start
+
+    def _login(self) -> dict:
+        creds = self._credentials
+        return {
+            "username": creds.username if creds else os.getenv("GEOTAB_USERNAME", ""),
+            "password": creds.password if creds else os.getenv("GEOTAB_PASSWORD", ""),
+            "database": creds.database if creds else os.getenv("GEOTAB_DATABASE", ""),
+            "server": creds.server if creds else os.getenv("GEOTAB_SERVER", "my.geotab.com"),
+        }
+
+    async def _get_api(self) -> mygeotab.API:
+        tracing.cache("geotab.session", hit=self._api is not None)
         if self._api is None:
-            self._api = mygeotab.API(
-                username=os.getenv("GEOTAB_USERNAME", ""),
-                password=os.getenv("GEOTAB_PASSWORD", ""),
-                database=os.getenv("GEOTAB_DATABASE", ""),
-                server=os.getenv("GEOTAB_SERVER", "my.geotab.com"),
-            )
-            self._api.authenticate()
+            async with self._auth_lock:  # one login per database, however many calls wait on it
+                if self._api is None:
+                    api = mygeotab.API(**self._login())
+                    # authenticate() is a blocking HTTPS call: keep it off the event loop
+                    with tracing.phase("auth"), tracing.upstream("geotab.Authenticate"):
+                        await asyncio.to_thread(api.authenticate)
+                    self._api = api
         return self._api
 
+    async def reference(self, refresh: bool = False) -> records.Reference:
+        """Devices, users and rule names, fetched in one multi_call and reused for
+        REFERENCE_TTL_SECONDS."""
+        hit = not refresh and self._reference is not None and datetime.now(timezone.utc).timestamp() < self._reference_expires
+        tracing.cache("geotab.reference", hit=hit)
+        if not hit:
+            devices, users, rules = await self.multi_call(
+                [("Get", {"typeName": t}) for t in REFERENCE_TYPES], "reference",
+            )
+            with tracing.phase("normalize"):
+                self._reference = records.Reference(
+                    records.convert(records.Device, devices), records.convert(records.User, users), _rule_map(rules),
+                )
+            self._reference_expires = datetime.now(timezone.utc).timestamp() + REFERENCE_TTL_SECONDS
+        return self._reference
+
+    # -- warm start (see warmstart.py) ------------------------------------
+
+    def export_state(self) -> dict:
+        state = {}
+        api = self._api
+        if isinstance(api, mygeotab.API) and api.credentials and api.credentials.session_id:
+            c = api.credentials
+            state["session"] = {"username": c.username, "database": c.database,
+                                "session_id": c.session_id, "server": c.server}
+        if self._reference is not None:
+            state["reference"] = (self._reference_expires, self._reference)
+        return state
+
+    def restore_state(self, state: dict):
+        login = self._login()
+        session = state.get("session")
+        if (self._api is None and session
+                and (session["username"], session["database"]) == (login["username"], login["database"])):
+            # Keep the password: mygeotab re-authenticates once if the session has expired
+            self._api = mygeotab.API(login["username"], password=login["password"], database=login["database"],
+                                     session_id=session["session_id"], server=session["server"])
+        if "reference" in state:
+            self._reference_expires, self._reference = state["reference"]
+
+    async def api_call(self, method: str, params: dict):
+        """Single JSON-RPC call, e.g. api_call("Get", {"typeName": "Device"})."""
+        api = await self._get_api()
+        op = f"geotab.{method}:{params['typeName']}" if "typeName" in params else f"geotab.{method}"
+        async with self._slots:
+            with tracing.upstream(op) as up:
+                result = await api.call_async(method, **params)
+                up.rows = _count_rows(result)
+        return result
+
+    async def multi_call(self, calls: list, label: str = "batch") -> list:
+        """Several calls in one round trip, e.g. one ExceptionEvent Get per device."""
+        return await self._multi_call(await self._get_api(), calls, label)
+
+    async def _multi_call(self, api: mygeotab.API, calls: list, label: str) -> list:
+        async with self._slots:
+            with tracing.upstream(f"geotab.multi_call:{label}", batched=len(calls)) as up:
+                results = await api.multi_call_async(calls)
+                up.rows = _count_rows(results)
+        return results
+
     async def close(self):
         pass  # mygeotab manages its own connections
 
     # ------------------------------------------------------------------
     # Fetch enriched safety events
     # ------------------------------------------------------------------
-    async def fetch_safety_events(self, days: int = 1) -> list[dict]:
-        api = self._get_api()
+    async def fetch_safety_events(self, days: int = 1, group_episodes: bool = True,
+                                  enrich: str = "point") -> list[dict]:
+        """Enriched exception events; with group_episodes, one per episode (see clustering).
+
+        enrich="point" adds the GPS fix closest to each event; "profile" also adds a
+        speed profile over a window of fixes around it (see kinematics).
+        """
+        if enrich not in ENRICH_MODES:
+            raise ValueError(f"enrich must be one of {', '.join(ENRICH_MODES)}")
+        profile = enrich == "profile"
+        if profile:
+            kinematics.require_numpy()
+        api = await self._get_api()
         from_date = datetime.now(timezone.utc) - timedelta(days=days)
 
-        events = await api.get_async(
-            "ExceptionEvent", from_date=from_date, results_limit=100
-        )
-        if not events:
+        async with self._slots:
+            with tracing.phase("events"), tracing.upstream("geotab.Get:ExceptionEvent") as up:
+                raw_events = await api.get_async(
+                    "ExceptionEvent", from_date=from_date, results_limit=100
+                )
+                up.rows = _count_rows(raw_events)
+        if not raw_events:
             return []
-
-        # Batch-fetch reference entities
-        devices, users, rules = await api.multi_call_async([
-            ("Get", {"typeName": "Device"}),
-            ("Get", {"typeName": "User"}),
-            ("Get", {"typeName": "Rule"}),
-        ])
-
-        device_map = {d["id"]: d for d in (devices or [])}
-        user_map = {u["id"]: u for u in (users or [])}
-        rule_map = dict(BUILTIN_RULES)
-        for r in (rules or []):
-            rule_map[r["id"]] = r.get("name", r["id"])
+        with tracing.phase("normalize"):
+            events = [e for e in records.convert(records.Event, raw_events) if e.device_id]
+
+        # Reference entities (cached)
+        with tracing.phase("reference"):
+            ref = await self.reference()
+        rule_names = ref.rule_names
+
+        # Collapse runs of the same event on a device into episodes; only the
+        # longest member of each is looked up
+        with tracing.phase("cluster"):
+            episodes = _episodes(events, rule_names) if group_episodes else [[e] for e in events]
+        gps_meta = [max(m, key=lambda e: e.duration) for m in episodes]
+
+        # Lookup windows: a minute around each event, or for profiles one padded
+        # window per run of nearby events on a device
+        speeding = [_is_speeding(e, rule_names) for e in gps_meta]
+        if profile:
+            gps_windows, window_of = _profile_windows(gps_meta)
+            speed_windows = [(w, gps_windows[w]) for w in sorted({window_of[i] for i, s in enumerate(speeding) if s})]
+        else:
+            gps_windows = [(e.device_id, e.lookup_time - 30, e.lookup_time + 30) for e in gps_meta]
+            window_of = list(range(len(gps_meta)))
+            speed_windows = [(i, (e.device_id, e.lookup_time - 10, e.lookup_time + 30))
+                             for i, e in enumerate(gps_meta) if speeding[i]]
 
         # GPS enrichment — LogRecord lookups in batches of 20
         gps_calls = []
-        gps_meta = []
-        for event in events:
-            device_id = _get_id(event.get("device"))
-            if not device_id:
-                continue
-            t = _event_lookup_time(event)
+        for device_id, t0, t1 in gps_windows:
             gps_calls.append(("Get", {
                 "typeName": "LogRecord",
                 "search": {
                     "deviceSearch": {"id": device_id},
-                    "fromDate": (t - timedelta(seconds=30)).isoformat(),
-                    "toDate": (t + timedelta(seconds=30)).isoformat(),
+                    "fromDate": _iso(t0),
+                    "toDate": _iso(t1),
                 },
-                "resultsLimit": 5,
+                "resultsLimit": kinematics.PROFILE_MAX_RECORDS if profile else 5,
             }))
-            gps_meta.append(event)
 
-        all_gps = []
-        for i in range(0, len(gps_calls), GPS_BATCH_SIZE):
-            batch = gps_calls[i : i + GPS_BATCH_SIZE]
-            try:
-                results = await api.multi_call_async(batch)
-                all_gps.extend(results)
-            except Exception:
-                all_gps.extend([[] for _ in batch])
+        all_gps: list[list[records.LogPoint]] = []
+        with tracing.phase("gps"):
+            for i in range(0, len(gps_calls), GPS_BATCH_SIZE):
+                batch = gps_calls[i : i + GPS_BATCH_SIZE]
+                try:
+                    results = await self._multi_call(api, batch, "LogRecord")
+                    all_gps.extend(records.convert(records.LogPoint, r) for r in results)
+                except Exception:
+                    all_gps.extend([[] for _ in batch])
 
         # Speed limit lookups for speeding events
         speed_calls = []
         speed_indices = []
-        for i, event in enumerate(gps_meta):
-            rule_id = _get_id(event.get("rule")) or ""
-            rule_name = rule_map.get(rule_id, "")
-            if rule_id in ("RulePostedSpeedingId", "RuleSpeedingId") or "speed" in rule_name.lower():
-                device_id = _get_id(event.get("device"))
-                t = _event_lookup_time(event)
-                speed_calls.append(("GetRoadMaxSpeeds", {
-                    "deviceSearch": {"id": device_id},
-                    "fromDate": (t - timedelta(seconds=10)).isoformat(),
-                    "toDate": (t + timedelta(seconds=30)).isoformat(),
-                }))
-                speed_indices.append(i)
+        for w, (device_id, t0, t1) in speed_windows:
+            speed_calls.append(("GetRoadMaxSpeeds", {
+                "deviceSearch": {"id": device_id},
+                "fromDate": _iso(t0),
+                "toDate": _iso(t1),
+            }))
+            speed_indices.append(w)
+
+        road_speeds_by_window: dict[int, list[records.RoadSpeed]] = {}
+        with tracing.phase("road_speed"):
+            for i in range(0, len(speed_calls), GPS_BATCH_SIZE):
+                batch = speed_calls[i : i + GPS_BATCH_SIZE]
+                batch_idx = speed_indices[i : i + GPS_BATCH_SIZE]
+                try:
+                    results = await self._multi_call(api, batch, "GetRoadMaxSpeeds")
+                    for j, road_speeds in enumerate(results):
+                        if road_speeds:
+                            road_speeds_by_window[batch_idx[j]] = records.convert(records.RoadSpeed, road_speeds)
+                except Exception:
+                    pass
+
+        # A shared window also holds its neighbours' fixes; each event only takes
+        # them from its own (padded) span
+        if profile:
+            pad = kinematics.PROFILE_PADDING_SECONDS
+            own_spans = [(lo - pad, hi + pad) for lo, hi in map(_span, gps_meta)]
+        else:
+            own_spans = [(t0, t1) for _, t0, t1 in gps_windows]
 
         speed_limit_map: dict[int, float] = {}
-        for i in range(0, len(speed_calls), GPS_BATCH_SIZE):
-            batch = speed_calls[i : i + GPS_BATCH_SIZE]
-            batch_idx = speed_indices[i : i + GPS_BATCH_SIZE]
-            try:
-                results = await api.multi_call_async(batch)
-                for j, road_speeds in enumerate(results):
-                    if road_speeds:
-                        evt = gps_meta[batch_idx[j]]
-                        evt_time = _to_datetime(evt["activeFrom"])
-                        closest = min(road_speeds, key=lambda rs: abs(
-                            _to_datetime(rs["k"]).timestamp() - evt_time.timestamp()
-                        ))
-                        speed_limit_map[batch_idx[j]] = closest["v"]
-            except Exception:
-                pass
-
-        # Build enriched events
-        enriched = []
         for i, event in enumerate(gps_meta):
-            log_records = all_gps[i] if i < len(all_gps) else []
-            if not isinstance(log_records, list):
-                log_records = []
+            road_speeds = road_speeds_by_window.get(window_of[i]) if speeding[i] else None
+            closest = _closest(road_speeds, event.start, *own_spans[i]) if road_speeds else None
+            if closest:
+                speed_limit_map[i] = closest.limit
 
-            device_id = _get_id(event.get("device"))
-            driver_id = _get_id(event.get("driver"))
-            rule_id = _get_id(event.get("rule")) or ""
-
-            device = device_map.get(device_id)
-            user = user_map.get(driver_id)
-            rule_name = rule_map.get(rule_id, rule_id or "Safety Event")
-            category = RULE_CATEGORIES.get(rule_name, "safety_event")
-
-            if user:
-                driver_name = f"{user.get('firstName', '')} {user.get('lastName', '')}".strip()
-            else:
-                driver_name = device.get("name", "Unknown Driver") if device else "Unknown Driver"
-
-            location = None
-            vehicle_speed = 0
-            if log_records:
-                event_dt = _to_datetime(event["activeFrom"])
-                closest_lr = min(log_records, key=lambda lr: abs(
-                    _to_datetime(lr["dateTime"]).timestamp() - event_dt.timestamp()
-                ))
-                vehicle_speed = closest_lr.get("speed", 0)
-                if closest_lr.get("longitude", 0) != 0 or closest_lr.get("latitude", 0) != 0:
-                    location = {
-                        "latitude": closest_lr["latitude"],
-                        "longitude": closest_lr["longitude"],
+        # Build enriched events
+        with tracing.phase("enrich"):
+            enriched = []
+            tracks: dict[int, kinematics.Track] = {}
+            for i, event in enumerate(gps_meta):
+                w = window_of[i]
+                log_points = all_gps[w] if w < len(all_gps) else []
+
+                device = ref.device_by_id.get(event.device_id)
+                user = ref.user_by_id.get(event.driver_id)
+                rule_name = rule_names.get(event.rule_id, event.rule_id or "Safety Event")
+                category = RULE_CATEGORIES.get(rule_name, "safety_event")
+
+                if user:
+                    driver_name = user.name
+                else:
+                    driver_name = device.name if device else "Unknown Driver"
+
+                location = None
+                vehicle_speed = 0
+                closest_lr = _closest(log_points, event.start, *own_spans[i])
+                if closest_lr:
+                    vehicle_speed = closest_lr.speed
+                    if closest_lr.longitude != 0 or closest_lr.latitude != 0:
+                        location = {
+                            "latitude": closest_lr.latitude,
+                            "longitude": closest_lr.longitude,
+                            "speed": vehicle_speed,
+                        }
+
+                entry = {
+                    "id": event.id,
+                    "driverId": event.driver_id or event.device_id or "unknown",
+                    "driverName": driver_name,
+                    "deviceName": device.name if device else "Unknown Vehicle",
+                    "type": category,
+                    "ruleName": rule_name,
+                    "timestamp": event.active_from,
+                    "location": location,
+                    "rawData": {
+                        "ruleId": event.rule_id or None,
+                        "deviceId": event.device_id or None,
+                        "driverId": event.driver_id or None,
+                        "duration": event.raw_duration,
+                        "distance": event.distance,
                         "speed": vehicle_speed,
-                    }
-
-            enriched.append({
-                "id": event.get("id"),
-                "driverId": driver_id or device_id or "unknown",
-                "driverName": driver_name,
-                "deviceName": device.get("name", "Unknown Vehicle") if device else "Unknown Vehicle",
-                "type": category,
-                "ruleName": rule_name,
-                "timestamp": event["activeFrom"],
-                "location": location,
-                "rawData": {
-                    "ruleId": rule_id or None,
-                    "deviceId": device_id or None,
-                    "driverId": driver_id or None,
-                    "duration": event.get("duration"),
-                    "distance": event.get("distance", 0),
-                    "speed": vehicle_speed,
-                    "speedLimit": speed_limit_map.get(i),
-                    "state": event.get("state"),
-                },
-            })
+                        "speedLimit": speed_limit_map.get(i),
+                        "state": event.state,
+                    },
+                }
+                if profile:
+                    if w not in tracks:
+                        tracks[w] = kinematics.Track(log_points, road_speeds_by_window.get(w, []))
+                    entry["profile"] = tracks[w].profile(*_span(event))
+                if len(episodes[i]) > 1:
+                    entry["episode"] = _episode_summary(episodes[i])
+                enriched.append(entry)
 
         return enriched
 
@@ -248,15 +418,13 @@ class GeotabClient:
     # 3-step Ace AI query
     # ------------------------------------------------------------------
     async def query_ace_ai(self, question: str, vehicle_name: str | None = None) -> str | None:
-        api = self._get_api()
-
         # Step 1: Create chat
-        create_result = await api.call_async("GetAceResults",
-            serviceName="dna-planet-orchestration",
-            functionName="create-chat",
-            customerData=True,
-            functionParameters={},
-        )
+        create_result = await self.api_call("GetAceResults", {
+            "serviceName": "dna-planet-orchestration",
+            "functionName": "create-chat",
+            "customerData": True,
+            "functionParameters": {},
+        })
         results = create_result if isinstance(create_result, list) else (create_result or {}).get("results", [])
         chat_id = results[0].get("chat_id") if results else None
         if not chat_id:
@@ -264,12 +432,12 @@ class GeotabClient:
 
         # Step 2: Send prompt
         prompt = f"For vehicle {vehicle_name}: {question}" if vehicle_name else question
-        send_result = await api.call_async("GetAceResults",
-            serviceName="dna-planet-orchestration",
-            functionName="send-prompt",
-            customerData=True,
-            functionParameters={"chat_id": chat_id, "prompt": prompt},
-        )
+        send_result = await self.api_call("GetAceResults", {
+            "serviceName": "dna-planet-orchestration",
+            "functionName": "send-prompt",
+            "customerData": True,
+            "functionParameters": {"chat_id": chat_id, "prompt": prompt},
+        })
         send_results = send_result if isinstance(send_result, list) else (send_result or {}).get("results", [])
         msg_group_id = None
         if send_results:
@@ -281,12 +449,12 @@ class GeotabClient:
         # Step 3: Poll — adaptive intervals, 60s total timeout
         for interval in [2, 3, 5, 8, 8, 8, 8, 8, 8, 8]:
             await asyncio.sleep(interval)
-            poll_result = await api.call_async("GetAceResults",
-                serviceName="dna-planet-orchestration",
-                functionName="get-message-group",
-                customerData=True,
-                functionParameters={"message_group_id": msg_group_id},
-            )
+            poll_result = await self.api_call("GetAceResults", {
+                "serviceName": "dna-planet-orchestration",
+                "functionName": "get-message-group",
+                "customerData": True,
+                "functionParameters": {"message_group_id": msg_group_id},
+            })
             poll_results = poll_result if isinstance(poll_result, list) else (poll_result or {}).get("results", [])
             if not poll_results:
                 continue
@@ -0,0 +1,105 @@
+"""Speed profiles around exception events, computed with NumPy over LogRecord windows.
+
+The default enrichment keeps the one GPS fix closest to each event. The
+"profile" mode of fetch_safety_events instead reads every fix in a window of
+PROFILE_PADDING_SECONDS either side of the event. Events on the same device
+whose windows overlap share one window, and so one LogRecord call and at most
+one GetRoadMaxSpeeds call, as long as the shared window stays within
+PROFILE_MAX_WINDOW_SECONDS; past that it is split so no window can hold more
+fixes than PROFILE_MAX_RECORDS. Per event it reports:
+
+- the speed samples in the window (seconds from the event start, km/h)
+- peak and mean speed
+- peak margin over the posted limit and time spent over it (when limits were fetched)
+- peak deceleration and acceleration between consecutive fixes (m/s²)
+
+Each window becomes a Track: sorted int64/float64 arrays. Events slice their
+span out of a Track with searchsorted, and every metric is a vectorized
+expression over that slice.
+
+numpy is optional: install with `pip install geoff-mcp-server[profile]`.
+"""
+
+import os
+
+from records import LogPoint, RoadSpeed
+
+PROFILE_PADDING_SECONDS = int(os.getenv("MCP_PROFILE_PADDING_SECONDS", "60"))
+PROFILE_MAX_RECORDS = 2000  # LogRecord resultsLimit per window
+PROFILE_MAX_WINDOW_SECONDS = PROFILE_MAX_RECORDS  # devices log at most once a second
+PROFILE_MAX_SAMPLES = 60  # speed samples returned per event; longer spans are thinned evenly
+
+
+def require_numpy():
+    try:
+        import numpy  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Speed profiles need numpy: pip install 'geoff-mcp-server[profile]'") from e
+
+
+class Track:
+    """GPS fixes and posted limits of one device over one window."""
+
+    __slots__ = ("times", "speeds", "limit_times", "limits")
+
+    def __init__(self, points: list[LogPoint], road_speeds: list[RoadSpeed]):
+        import numpy as np
+
+        times = np.fromiter((p.time for p in points), dtype=np.int64, count=len(points))
+        speeds = np.fromiter((p.speed or 0.0 for p in points), dtype=np.float64, count=len(points))
+        # Sorted, one fix per second (a repeated timestamp would be a zero-length interval)
+        times, first = np.unique(times, return_index=True)
+        self.times, self.speeds = times, speeds[first]
+
+        limit_times = np.fromiter((r.time for r in road_speeds), dtype=np.int64, count=len(road_speeds))
+        limits = np.fromiter((r.limit for r in road_speeds), dtype=np.float64, count=len(road_speeds))
+        order = np.argsort(limit_times, kind="stable")
+        self.limit_times, self.limits = limit_times[order], limits[order]
+
+    def limit_at(self, times):
+        """Posted limit in force at each time (a limit applies from its time on); NaN where unknown."""
+        import numpy as np
+
+        idx = np.searchsorted(self.limit_times, times, side="right") - 1
+        out = np.full(len(times), np.nan)
+        known = idx >= 0
+        out[known] = self.limits[idx[known]]
+        return out
+
+    def profile(self, start: int, end: int, padding: int = PROFILE_PADDING_SECONDS) -> dict | None:
+        """Speed profile of [start - padding, end + padding]; None without any fix in it."""
+        import numpy as np
+
+        lo = np.searchsorted(self.times, start - padding, side="left")
+        hi = np.searchsorted(self.times, end + padding, side="right")
+        times, speeds = self.times[lo:hi], self.speeds[lo:hi]
+        if not len(times):
+            return None
+
+        dt = np.diff(times).astype(np.float64)
+        accel = np.diff(speeds) / 3.6 / dt  # km/h per s -> m/s²
+
+        result = {
+            "from": int(times[0] - start),
+            "to": int(times[-1] - start),
+            "samples": int(len(times)),
+            "peakSpeed": round(float(speeds.max()), 1),
+            "avgSpeed": round(float(speeds.mean()), 1),
+            "maxDeceleration": round(float(max(-accel.min(), 0.0)), 2) if len(accel) else None,
+            "maxAcceleration": round(float(max(accel.max(), 0.0)), 2) if len(accel) else None,
+            "peakOverLimit": None,
+            "timeOverLimitSeconds": None,
+        }
+
+        limits = self.limit_at(times)
+        known = ~np.isnan(limits)
+        if known.any():
+            over = speeds - limits
+            result["peakOverLimit"] = round(float(over[known].max()), 1)
+            # An interval counts as over the limit when it starts over it
+            over_left = (over[:-1] > 0) & known[:-1]
+            result["timeOverLimitSeconds"] = int(dt[over_left].sum())
+
+        step = -(-len(times) // PROFILE_MAX_SAMPLES)  # ceil
+        result["speeds"] = [[int(t - start), float(s)] for t, s in zip(times[::step], speeds[::step])]
+        return result
@@ -1,32 +1,208 @@
 """OData Data Connector client — async port of functions/analytics/odata.js."""
 
+import asyncio
 import base64
+import json
 import os
+import random
+import time
+import zlib
+from collections import OrderedDict
 
 import aiohttp
 
+import tracing
+
 GEOTAB_DATABASE = os.getenv("GEOTAB_DATABASE", "")
 GEOTAB_USERNAME = os.getenv("GEOTAB_USERNAME", "")
 GEOTAB_PASSWORD = os.getenv("GEOTAB_PASSWORD", "")
 ODATA_SERVER = os.getenv("ODATA_SERVER", "odata-connector-2")
-
-
-def _get_auth_header() -> str:
+# Override to point at a local stand-in (see replay.serve_odata)
+ODATA_BASE_URL = os.getenv("ODATA_BASE_URL", f"https://{ODATA_SERVER}.geotab.com/odata/v4/svc")
+# The daily tables change a few times a day at most; identical queries within this are served from memory
+ODATA_CACHE_SECONDS = float(os.getenv("MCP_ODATA_CACHE_SECONDS", "300"))
+ODATA_CACHE_ENTRIES = 256
+ODATA_MAX_ROWS = 5000  # default cap on rows paged in per query
+# Transport: per-request timeout, and retries (with exponential backoff) for
+# dropped connections, timeouts and 429/5xx answers
+ODATA_TIMEOUT_SECONDS = float(os.getenv("MCP_ODATA_TIMEOUT_SECONDS", "60"))
+ODATA_RETRIES = int(os.getenv("MCP_ODATA_RETRIES", "2"))
+ODATA_RETRY_BACKOFF_SECONDS = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 60
+
+
+def _get_auth_header(database: str = GEOTAB_DATABASE, username: str = GEOTAB_USERNAME,
+                     password: str = GEOTAB_PASSWORD) -> str:
     # Geotab OData uses Basic auth: base64(database/username:password)
-    auth_string = f"{GEOTAB_DATABASE}/{GEOTAB_USERNAME}:{GEOTAB_PASSWORD}"
+    auth_string = f"{database}/{username}:{password}"
     b64 = base64.b64encode(auth_string.encode()).decode()
     return f"Basic {b64}"
 
 
+def _decode_body(body: bytes, encoding: str) -> bytes:
+    """Undo Content-Encoding. The session leaves bodies compressed so that upstream
+    bytes count what actually crossed the wire."""
+    encoding = encoding.strip().lower()
+    if encoding == "gzip":
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)  # raw deflate, as some servers send
+    return body
+
+
+def _retry_after(headers) -> float | None:
+    try:
+        return min(float(headers.get("Retry-After", "")), 30.0)
+    except ValueError:
+        return None
+
+
+def _validators(headers) -> dict[str, str] | None:
+    """Conditional request headers that revalidate a response with these headers."""
+    validators = {}
+    if "ETag" in headers:
+        validators["If-None-Match"] = headers["ETag"]
+    if "Last-Modified" in headers:
+        validators["If-Modified-Since"] = headers["Last-Modified"]
+    return validators or None
+
+
+def _quote(value: str) -> str:
+    """OData string literal (single quotes doubled)."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _any_of(field: str, values: list[str]) -> str:
+    """`field eq 'a' or field eq 'b' ...` — the connector has no `in` operator."""
+    return " or ".join(f"{field} eq {_quote(v)}" for v in values)
+
+
+def _group_by(rows: list[dict], field: str) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {}
+    for row in rows:
+        grouped.setdefault(row.get(field, ""), []).append(row)
+    return grouped
+
+
+class ODataError(RuntimeError):
+    """Non-200 response from the Data Connector."""
+
+    def __init__(self, table: str, status: int, message: str):
+        super().__init__(f"OData {table} error {status}: {message}")
+        self.status = status
+
+
+# Aggregations are {alias: (field, op)}; ops are the OData `with` methods
+AGGREGATE_OPS = ("sum", "max", "min", "average")
+
+
+def _apply_clause(group_by: list[str], aggregates: dict[str, tuple[str, str]], filter_: str | None = None) -> str:
+    """`$apply` for grouped totals: filter(...)/groupby((a,b),aggregate(x with sum as y,...))."""
+    for field, op in aggregates.values():
+        if op not in AGGREGATE_OPS:
+            raise ValueError(f"Unsupported aggregate '{op}' for {field}")
+    methods = ",".join(f"{field} with {op} as {alias}" for alias, (field, op) in aggregates.items())
+    clause = f"groupby(({','.join(group_by)}),aggregate({methods}))" if group_by else f"aggregate({methods})"
+    # $filter would apply to the grouped result, so row filters go inside $apply
+    return f"filter({filter_})/{clause}" if filter_ else clause
+
+
+def _aggregate_rows(rows: list[dict], group_by: list[str], aggregates: dict[str, tuple[str, str]]) -> list[dict]:
+    """Local equivalent of _apply_clause, for connectors without $apply."""
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row.get(f) for f in group_by), []).append(row)
+    out = []
+    for key, members in groups.items():
+        result = dict(zip(group_by, key))
+        for alias, (field, op) in aggregates.items():
+            values = [r[field] for r in members if r.get(field) is not None]
+            if op == "sum":
+                result[alias] = sum(values)
+            elif not values:
+                result[alias] = None
+            elif op == "max":
+                result[alias] = max(values)
+            elif op == "min":
+                result[alias] = min(values)
+            else:
+                result[alias] = sum(values) / len(values)
+        out.append(result)
+    return out
+
+
+def _order_rows(rows: list[dict], orderby: str) -> list[dict]:
+    """Sort like `$orderby=a desc,b` (nulls first, as OData does)."""
+    for clause in reversed(orderby.split(",")):
+        field, _, direction = clause.strip().partition(" ")
+        rows.sort(key=lambda r: (r.get(field) is not None, r.get(field)), reverse=direction.strip() == "desc")
+    return rows
+
+
 class ODataClient:
-    def __init__(self):
+    def __init__(self, credentials=None, max_connections: int = 8):
+        # credentials: tenants.Credentials; None uses the GEOTAB_* environment
         self._session: aiohttp.ClientSession | None = None
+        self._max_connections = max_connections
+        self._no_apply: set[str] = set()  # tables whose connector rejected $apply
+        # (url, params) -> (expires at, epoch seconds; rows; conditional headers or None),
+        # least recently used first. Expired entries with validators are revalidated.
+        self._cache: OrderedDict[tuple, tuple[float, list[dict], dict | None]] = OrderedDict()
+        if credentials is None:
+            self._auth_header = _get_auth_header()
+            self._base_url = ODATA_BASE_URL
+        else:
+            self._auth_header = _get_auth_header(credentials.database, credentials.username, credentials.password)
+            self._base_url = (
+                ODATA_BASE_URL if "ODATA_BASE_URL" in os.environ
+                else f"https://{credentials.odata_server}.geotab.com/odata/v4/svc"
+            )
 
     async def _get_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._max_connections,
+                    ttl_dns_cache=DNS_CACHE_SECONDS,
+                    keepalive_timeout=KEEPALIVE_SECONDS,
+                ),
+                timeout=aiohttp.ClientTimeout(total=ODATA_TIMEOUT_SECONDS),
+                # Sent with every request, built once
+                headers={
+                    "Authorization": self._auth_header,
+                    "Accept": "application/json",
+                    "Accept-Encoding": "gzip, deflate",
+                },
+                auto_decompress=False,
+            )
         return self._session
 
+    async def _get(self, url: str, params: dict | None, headers: dict | None, op: str) -> tuple[int, dict, int, bytes]:
+        """GET with retries; returns (status, response headers, bytes on the wire, decoded body)."""
+        session = await self._get_session()
+        for attempt in range(ODATA_RETRIES + 1):
+            delay = None
+            try:
+                async with session.get(url, params=params, headers=headers) as resp:
+                    body = await resp.read()
+                    if resp.status not in RETRY_STATUSES or attempt == ODATA_RETRIES:
+                        encoding = resp.headers.get("Content-Encoding", "")
+                        return resp.status, resp.headers, len(body), _decode_body(body, encoding)
+                    delay = _retry_after(resp.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == ODATA_RETRIES:
+                    raise
+            tracing.retry(op)
+            if delay is None:
+                delay = ODATA_RETRY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.0)
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
     async def close(self):
         if self._session and not self._session.closed:
             await self._session.close()
@@ -38,8 +214,12 @@ class ODataClient:
         filter_: str | None = None,
         search: str | None = None,
         top: int | None = None,
+        apply: str | None = None,
+        orderby: str | None = None,
+        max_rows: int | None = ODATA_MAX_ROWS,
     ) -> list[dict]:
-        base_url = f"https://{ODATA_SERVER}.geotab.com/odata/v4/svc/{table}"
+        """Rows of an OData query, following nextLinks until max_rows (None: all pages)."""
+        base_url = f"{self._base_url}/{table}"
 
         params: dict[str, str] = {}
         if select:
@@ -48,80 +228,187 @@ class ODataClient:
             params["$filter"] = filter_
         if search:
             params["$search"] = search
+        if apply:
+            params["$apply"] = apply
+        if orderby:
+            params["$orderby"] = orderby
         if top:
             params["$top"] = str(top)
 
-        session = await self._get_session()
-        headers = {"Authorization": _get_auth_header(), "Accept": "application/json"}
-
-        async with session.get(base_url, params=params, headers=headers) as resp:
-            if resp.status != 200:
-                text = await resp.text()
-                raise RuntimeError(f"OData {table} error {resp.status}: {text}")
-            data = await resp.json()
-
-        rows = data.get("value", [])
-
-        # Handle pagination (up to 5000 rows)
-        next_link = data.get("@odata.nextLink")
-        while next_link and len(rows) < 5000:
-            async with session.get(next_link, headers=headers) as resp:
-                next_data = await resp.json()
-            rows.extend(next_data.get("value", []))
-            next_link = next_data.get("@odata.nextLink")
-
-        return rows
+        key = (base_url, tuple(sorted(params.items())), max_rows)
+        cached = self._cache.get(key)
+        hit = cached is not None and cached[0] > time.time()
+        tracing.cache("odata", hit=hit)
+        if hit:
+            self._cache.move_to_end(key)
+            return list(cached[1])
+        # An expired result with an ETag/Last-Modified is revalidated: 304 keeps its rows
+        conditional = cached[2] if cached is not None else None
+
+        op = f"odata.{table}"
+        with tracing.upstream(op) as up:
+            status, headers, wire_bytes, body = await self._get(base_url, params, conditional, op)
+            up.bytes += wire_bytes
+            if conditional:
+                tracing.cache("odata.revalidate", hit=status == 304)
+            if status == 304 and cached is not None:
+                rows = cached[1]
+                validators = _validators(headers) or conditional
+            else:
+                if status != 200:
+                    raise ODataError(table, status, body.decode(errors="replace"))
+                data = json.loads(body)
+                rows = data.get("value", [])
+                # Validators describe the first page only, so paged results are refetched in full
+                validators = _validators(headers)
+
+                # Handle pagination (up to max_rows)
+                next_link = data.get("@odata.nextLink")
+                while next_link and (max_rows is None or len(rows) < max_rows):
+                    validators = None
+                    up.calls += 1
+                    status, _, wire_bytes, body = await self._get(next_link, None, None, op)
+                    up.bytes += wire_bytes
+                    if status != 200:
+                        raise ODataError(table, status, body.decode(errors="replace"))
+                    next_data = json.loads(body)
+                    rows.extend(next_data.get("value", []))
+                    next_link = next_data.get("@odata.nextLink")
+                up.rows += len(rows)
+
+        self._cache[key] = (time.time() + ODATA_CACHE_SECONDS, rows, validators)
+        self._cache.move_to_end(key)
+        while len(self._cache) > ODATA_CACHE_ENTRIES:
+            self._cache.popitem(last=False)
+        return list(rows)
+
+    # -- warm start (see warmstart.py) ------------------------------------
+
+    def export_state(self) -> dict:
+        now = time.time()
+        return {
+            # Expired results are still worth keeping when they can be revalidated
+            "cache": [(key, entry) for key, entry in self._cache.items() if entry[0] > now or entry[2]],
+            "no_apply": set(self._no_apply),
+        }
+
+    def restore_state(self, state: dict):
+        self._cache.update(state.get("cache", []))
+        self._no_apply |= state.get("no_apply", set())
+
+    async def aggregate(
+        self,
+        table: str,
+        group_by: list[str],
+        aggregates: dict[str, tuple[str, str]],
+        search: str | None = None,
+        filter_: str | None = None,
+        orderby: str | None = None,
+        top: int | None = None,
+    ) -> list[dict]:
+        """Grouped totals, one row per group: {**group_by fields, **aggregate aliases}.
+
+        Computed by the connector with `$apply` (plus `$orderby`/`$top` on the
+        grouped rows). If it rejects that, the table is remembered and the rows
+        are fetched and grouped here instead, with the same result shape.
+        """
+        if table not in self._no_apply:
+            try:
+                return await self.query(
+                    table, search=search, apply=_apply_clause(group_by, aggregates, filter_), orderby=orderby, top=top,
+                )
+            except ODataError as e:
+                if e.status not in (400, 501):
+                    raise
+                self._no_apply.add(table)
+        fields = dict.fromkeys([*group_by, *(field for field, _ in aggregates.values())])
+        rows = await self.query(table, select=",".join(fields), filter_=filter_, search=search)
+        with tracing.phase("aggregate"):
+            grouped = _aggregate_rows(rows, group_by, aggregates)
+            if orderby:
+                _order_rows(grouped, orderby)
+        return grouped[:top] if top else grouped
+
+    async def _latest_rows(self, table: str, name_field: str, latest_dates: dict[str, str], select: str,
+                           names: list[str] | None = None) -> dict[str, dict]:
+        """Each entity's row from its own latest day (`latest_dates`, from a max aggregate).
+
+        Only days from the earliest of those dates are fetched — normally just
+        yesterday — instead of the whole 14-day window.
+        """
+        dates = [d for d in latest_dates.values() if d]
+        if not dates:
+            return {}
+        filter_ = f"Local_Date ge {min(dates)}"
+        if names:
+            filter_ += f" and ({_any_of(name_field, names)})"
+        rows = await self.query(table, search="last_14_day", filter_=filter_, select=select)
+        latest: dict[str, dict] = {}
+        for row in rows:
+            name = row.get(name_field)
+            if name not in latest and row.get("Local_Date") == latest_dates.get(name):
+                latest[name] = row
+        return latest
 
     async def fetch_fleet_analytics(self) -> dict:
-        results: dict[str, list] = {}
+        """Fleet totals, daily trends and driver rankings for the last 14 days.
 
-        # Vehicle KPIs — last 14 days
-        try:
-            results["vehicleKpis"] = await self.query(
-                "VehicleKpi_Daily",
-                search="last_14_day",
-                select="Device_Name,Device_SerialNo,Local_Date,Trip_Distance_Km,Total_Driving_Duration_Seconds,Total_Idling_Duration_Seconds,Trip_Count,Stop_Count",
-                top=2000,
-            )
-        except Exception:
-            results["vehicleKpis"] = []
+        Every part is grouped by the connector, so this transfers a row per day,
+        vehicle or driver rather than one per vehicle-day.
+        """
 
-        # Vehicle safety — last 14 days
-        try:
-            results["vehicleSafety"] = await self.query(
-                "VehicleSafety_Daily",
-                search="last_14_day",
-                select="Device_Name,Local_Date,Safety_Score,HarshBraking_Count,HarshCornering_Count,Speeding_Count,Speeding_Duration_Seconds,SeatbeltOff_Count",
-                top=2000,
-            )
-        except Exception:
-            results["vehicleSafety"] = []
+        async def safely(coro):
+            try:
+                return await coro
+            except Exception:
+                return []
 
-        # Driver safety scores — last 14 days
-        try:
-            results["driverSafety"] = await self.query(
-                "DriverSafety_Daily",
-                search="last_14_day",
-                select="Driver_Name,Local_Date,Safety_Score,HarshBraking_Count,HarshCornering_Count,Speeding_Count",
-                top=2000,
+        async def latest_vehicle_scores() -> list:
+            dates = await self.aggregate(
+                "VehicleSafety_Daily", ["Device_Name"], {"Latest_Date": ("Local_Date", "max")}, search="last_14_day",
             )
-        except Exception:
-            results["driverSafety"] = []
-
-        summary = _aggregate_analytics(results)
-        return {"raw": results, "summary": summary}
-
-    async def fetch_driver_safety(self) -> list[dict]:
-        """Fetch just driver safety data for rankings."""
+            latest = await self._latest_rows(
+                "VehicleSafety_Daily", "Device_Name", {r.get("Device_Name"): r.get("Latest_Date") for r in dates},
+                select="Device_Name,Local_Date,Safety_Score",
+            )
+            return [r.get("Safety_Score") for r in latest.values()]
+
+        daily_kpis, daily_safety, vehicle_scores, drivers = await asyncio.gather(
+            safely(self.aggregate("VehicleKpi_Daily", ["Local_Date"], _KPI_TOTALS, search="last_14_day",
+                                  orderby="Local_Date")),
+            safely(self.aggregate("VehicleSafety_Daily", ["Local_Date"], _SAFETY_TOTALS, search="last_14_day",
+                                  orderby="Local_Date")),
+            safely(latest_vehicle_scores()),
+            self.fetch_driver_rankings(),
+        )
+        results = {
+            "dailyKpis": daily_kpis,
+            "dailySafety": daily_safety,
+            "vehicleScores": vehicle_scores,
+            "driverRankings": drivers,
+        }
+        return {"raw": results, "summary": _summarize(daily_kpis, daily_safety, vehicle_scores, drivers)}
+
+    async def fetch_driver_rankings(self, limit: int | None = None) -> list[dict]:
+        """Per-driver event totals and latest safety score, most events first.
+
+        With a limit, only those top drivers have their latest score looked up.
+        """
         try:
-            return await self.query(
-                "DriverSafety_Daily",
-                search="last_14_day",
-                select="Driver_Name,Local_Date,Safety_Score,HarshBraking_Count,HarshCornering_Count,Speeding_Count",
-                top=2000,
+            totals = await self.aggregate("DriverSafety_Daily", ["Driver_Name"], _DRIVER_TOTALS, search="last_14_day")
+            rankings = _driver_rankings(totals)
+            if limit:
+                rankings = rankings[:limit]
+            latest = await self._latest_rows(
+                "DriverSafety_Daily", "Driver_Name", {d["name"]: d["latestDate"] for d in rankings},
+                select="Driver_Name,Local_Date,Safety_Score",
+                names=[d["name"] for d in rankings] if limit else None,
             )
         except Exception:
             return []
+        for d in rankings:
+            d["latestScore"] = latest.get(d["name"], {}).get("Safety_Score")
+        return rankings
 
     async def fetch_vehicle_kpis(self, vehicle_name: str) -> dict:
         """Fetch KPIs for a specific vehicle."""
@@ -131,7 +418,7 @@ class ODataClient:
             kpis = await self.query(
                 "VehicleKpi_Daily",
                 search="last_14_day",
-                filter_=f"Device_Name eq '{vehicle_name}'",
+                filter_=f"Device_Name eq {_quote(vehicle_name)}",
                 select="Device_Name,Local_Date,Trip_Distance_Km,Total_Driving_Duration_Seconds,Total_Idling_Duration_Seconds,Trip_Count",
                 top=100,
             )
@@ -141,7 +428,7 @@ class ODataClient:
             safety = await self.query(
                 "VehicleSafety_Daily",
                 search="last_14_day",
-                filter_=f"Device_Name eq '{vehicle_name}'",
+                filter_=f"Device_Name eq {_quote(vehicle_name)}",
                 select="Device_Name,Local_Date,Safety_Score,HarshBraking_Count,HarshCornering_Count,Speeding_Count,SeatbeltOff_Count",
                 top=100,
             )
@@ -155,83 +442,173 @@ class ODataClient:
             return await self.query(
                 "DriverSafety_Daily",
                 search="last_14_day",
-                filter_=f"Driver_Name eq '{driver_name}'",
+                filter_=f"Driver_Name eq {_quote(driver_name)}",
                 select="Driver_Name,Local_Date,Safety_Score,HarshBraking_Count,HarshCornering_Count,Speeding_Count",
                 top=100,
             )
         except Exception:
             return []
 
+    async def fetch_vehicles_kpis(self, vehicle_names: list[str]) -> dict[str, dict]:
+        """fetch_vehicle_kpis for several vehicles: one query per table, split per vehicle."""
+        if not vehicle_names:
+            return {}
+        top = min(100 * len(vehicle_names), 5000)
+        kpis, safety = await asyncio.gather(
+            self.query(
+                "VehicleKpi_Daily",
+                search="last_14_day",
+                filter_=_any_of("Device_Name", vehicle_names),
+                select="Device_Name,Local_Date,Trip_Distance_Km,Total_Driving_Duration_Seconds,Total_Idling_Duration_Seconds,Trip_Count",
+                top=top,
+            ),
+            self.query(
+                "VehicleSafety_Daily",
+                search="last_14_day",
+                filter_=_any_of("Device_Name", vehicle_names),
+                select="Device_Name,Local_Date,Safety_Score,HarshBraking_Count,HarshCornering_Count,Speeding_Count,SeatbeltOff_Count",
+                top=top,
+            ),
+            return_exceptions=True,
+        )
+        kpis = _group_by(kpis, "Device_Name") if isinstance(kpis, list) else {}
+        safety = _group_by(safety, "Device_Name") if isinstance(safety, list) else {}
+        return {name: {"kpis": kpis.get(name, []), "safety": safety.get(name, [])} for name in vehicle_names}
+
+    async def fetch_drivers_kpis(self, driver_names: list[str]) -> dict[str, list[dict]]:
+        """fetch_driver_kpis for several drivers in one query."""
+        if not driver_names:
+            return {}
+        try:
+            rows = await self.query(
+                "DriverSafety_Daily",
+                search="last_14_day",
+                filter_=_any_of("Driver_Name", driver_names),
+                select="Driver_Name,Local_Date,Safety_Score,HarshBraking_Count,HarshCornering_Count,Speeding_Count",
+                top=min(100 * len(driver_names), 5000),
+            )
+        except Exception:
+            rows = []
+        grouped = _group_by(rows, "Driver_Name")
+        return {name: grouped.get(name, []) for name in driver_names}
+
+
+_KPI_TOTALS = {
+    "Distance_Km": ("Trip_Distance_Km", "sum"),
+    "Driving_Seconds": ("Total_Driving_Duration_Seconds", "sum"),
+    "Idling_Seconds": ("Total_Idling_Duration_Seconds", "sum"),
+    "Trips": ("Trip_Count", "sum"),
+}
+_SAFETY_TOTALS = {
+    "HarshBraking": ("HarshBraking_Count", "sum"),
+    "HarshCornering": ("HarshCornering_Count", "sum"),
+    "Speeding": ("Speeding_Count", "sum"),
+    "SeatbeltOff": ("SeatbeltOff_Count", "sum"),
+}
+_DRIVER_TOTALS = {
+    "HarshBraking": ("HarshBraking_Count", "sum"),
+    "HarshCornering": ("HarshCornering_Count", "sum"),
+    "Speeding": ("Speeding_Count", "sum"),
+    "Latest_Date": ("Local_Date", "max"),
+}
+
+
+def _latest_by(rows: list[dict], field: str) -> dict[str, dict]:
+    latest: dict[str, dict] = {}
+    for row in rows:
+        name = row.get(field, "")
+        if not latest.get(name) or row.get("Local_Date", "") > latest[name].get("Local_Date", ""):
+            latest[name] = row
+    return latest
+
+
+def _driver_rankings(totals: list[dict], latest: dict[str, dict] | None = None) -> list[dict]:
+    """Driver_Name groups of _DRIVER_TOTALS -> ranking entries, most events first."""
+    rankings = []
+    for row in sorted(totals, key=lambda r: r.get("Driver_Name") or ""):
+        name = row.get("Driver_Name")
+        if not name:
+            continue
+        brakes = row.get("HarshBraking") or 0
+        corners = row.get("HarshCornering") or 0
+        speeding = row.get("Speeding") or 0
+        rankings.append({
+            "name": name,
+            "totalEvents": brakes + corners + speeding,
+            "harshBraking": brakes,
+            "harshCornering": corners,
+            "speeding": speeding,
+            "latestScore": (latest or {}).get(name, {}).get("Safety_Score"),
+            "latestDate": row.get("Latest_Date"),
+        })
+    rankings.sort(key=lambda d: d["totalEvents"], reverse=True)
+    return rankings
+
 
 def _aggregate_analytics(results: dict) -> dict:
-    vehicle_kpis = results.get("vehicleKpis", [])
+    """The fleet summary from raw daily rows (vehicleKpis / vehicleSafety / driverSafety)."""
     vehicle_safety = results.get("vehicleSafety", [])
     driver_safety = results.get("driverSafety", [])
-
-    # Fleet-wide KPIs
-    total_distance = sum(r.get("Trip_Distance_Km", 0) for r in vehicle_kpis)
-    total_drive_secs = sum(r.get("Total_Driving_Duration_Seconds", 0) for r in vehicle_kpis)
-    total_idle_secs = sum(r.get("Total_Idling_Duration_Seconds", 0) for r in vehicle_kpis)
-    total_trips = sum(r.get("Trip_Count", 0) for r in vehicle_kpis)
-
-    # Safety aggregates
-    total_harsh_brakes = sum(r.get("HarshBraking_Count", 0) for r in vehicle_safety)
-    total_harsh_corners = sum(r.get("HarshCornering_Count", 0) for r in vehicle_safety)
-    total_speeding = sum(r.get("Speeding_Count", 0) for r in vehicle_safety)
-    total_seatbelt_off = sum(r.get("SeatbeltOff_Count", 0) for r in vehicle_safety)
-
-    # Average safety score (from most recent day per vehicle)
-    latest_by_vehicle: dict[str, dict] = {}
-    for row in vehicle_safety:
-        name = row.get("Device_Name", "")
-        if not latest_by_vehicle.get(name) or row.get("Local_Date", "") > latest_by_vehicle[name].get("Local_Date", ""):
-            latest_by_vehicle[name] = row
-
-    safety_scores = [r["Safety_Score"] for r in latest_by_vehicle.values() if r.get("Safety_Score") is not None]
-    avg_safety_score = round(sum(safety_scores) / len(safety_scores), 1) if safety_scores else None
-
+    vehicle_latest = _latest_by(vehicle_safety, "Device_Name")
+    return _summarize(
+        _aggregate_rows(results.get("vehicleKpis", []), ["Local_Date"], _KPI_TOTALS),
+        _aggregate_rows(vehicle_safety, ["Local_Date"], _SAFETY_TOTALS),
+        [r.get("Safety_Score") for r in vehicle_latest.values()],
+        _driver_rankings(_aggregate_rows(driver_safety, ["Driver_Name"], _DRIVER_TOTALS),
+                         _latest_by(driver_safety, "Driver_Name")),
+    )
+
+
+def _summarize(daily_kpis: list[dict], daily_safety: list[dict], vehicle_scores: list, drivers: list[dict]) -> dict:
+    """Fleet summary from per-day totals (_KPI_TOTALS / _SAFETY_TOTALS), each
+    vehicle's latest safety score and _driver_rankings entries."""
     # Daily KPI trends
-    daily_kpis: dict[str, dict] = {}
-    for row in vehicle_kpis:
+    kpis_by_date: dict[str, dict] = {}
+    for row in daily_kpis:
         date = (row.get("Local_Date") or "")[:10]
         if not date:
             continue
-        if date not in daily_kpis:
-            daily_kpis[date] = {"date": date, "distance": 0, "driveHours": 0, "idleHours": 0, "trips": 0}
-        daily_kpis[date]["distance"] += row.get("Trip_Distance_Km", 0)
-        daily_kpis[date]["driveHours"] += row.get("Total_Driving_Duration_Seconds", 0) / 3600
-        daily_kpis[date]["idleHours"] += row.get("Total_Idling_Duration_Seconds", 0) / 3600
-        daily_kpis[date]["trips"] += row.get("Trip_Count", 0)
+        if date not in kpis_by_date:
+            kpis_by_date[date] = {"date": date, "distance": 0, "driveHours": 0, "idleHours": 0, "trips": 0}
+        kpis_by_date[date]["distance"] += row.get("Distance_Km") or 0
+        kpis_by_date[date]["driveHours"] += (row.get("Driving_Seconds") or 0) / 3600
+        kpis_by_date[date]["idleHours"] += (row.get("Idling_Seconds") or 0) / 3600
+        kpis_by_date[date]["trips"] += row.get("Trips") or 0
 
     # Daily safety trends
-    daily_safety: dict[str, dict] = {}
-    for row in vehicle_safety:
+    safety_by_date: dict[str, dict] = {}
+    for row in daily_safety:
         date = (row.get("Local_Date") or "")[:10]
         if not date:
             continue
-        if date not in daily_safety:
-            daily_safety[date] = {"date": date, "harshBrakes": 0, "harshCorners": 0, "speeding": 0, "seatbeltOff": 0}
-        daily_safety[date]["harshBrakes"] += row.get("HarshBraking_Count", 0)
-        daily_safety[date]["harshCorners"] += row.get("HarshCornering_Count", 0)
-        daily_safety[date]["speeding"] += row.get("Speeding_Count", 0)
-        daily_safety[date]["seatbeltOff"] += row.get("SeatbeltOff_Count", 0)
-
-    # Driver rankings
-    driver_scores: dict[str, dict] = {}
-    for row in driver_safety:
-        name = row.get("Driver_Name", "")
-        if not name:
-            continue
-        if name not in driver_scores:
-            driver_scores[name] = {"name": name, "totalEvents": 0, "latestScore": None, "latestDate": None}
-        driver_scores[name]["totalEvents"] += (
-            row.get("HarshBraking_Count", 0)
-            + row.get("HarshCornering_Count", 0)
-            + row.get("Speeding_Count", 0)
-        )
-        if not driver_scores[name]["latestDate"] or row.get("Local_Date", "") > driver_scores[name]["latestDate"]:
-            driver_scores[name]["latestScore"] = row.get("Safety_Score")
-            driver_scores[name]["latestDate"] = row.get("Local_Date")
+        if date not in safety_by_date:
+            safety_by_date[date] = {"date": date, "harshBrakes": 0, "harshCorners": 0, "speeding": 0, "seatbeltOff": 0}
+        safety_by_date[date]["harshBrakes"] += row.get("HarshBraking") or 0
+        safety_by_date[date]["harshCorners"] += row.get("HarshCornering") or 0
+        safety_by_date[date]["speeding"] += row.get("Speeding") or 0
+        safety_by_date[date]["seatbeltOff"] += row.get("SeatbeltOff") or 0
+
+    # Fleet-wide KPIs
+    total_distance = sum(r.get("Distance_Km") or 0 for r in daily_kpis)
+    total_drive_secs = sum(r.get("Driving_Seconds") or 0 for r in daily_kpis)
+    total_idle_secs = sum(r.get("Idling_Seconds") or 0 for r in daily_kpis)
+    total_trips = sum(r.get("Trips") or 0 for r in daily_kpis)
+
+    # Safety aggregates
+    total_harsh_brakes = sum(r.get("HarshBraking") or 0 for r in daily_safety)
+    total_harsh_corners = sum(r.get("HarshCornering") or 0 for r in daily_safety)
+    total_speeding = sum(r.get("Speeding") or 0 for r in daily_safety)
+    total_seatbelt_off = sum(r.get("SeatbeltOff") or 0 for r in daily_safety)
+
+    # Average safety score (from most recent day per vehicle)
+    safety_scores = [s for s in vehicle_scores if s is not None]
+    avg_safety_score = round(sum(safety_scores) / len(safety_scores), 1) if safety_scores else None
+
+    # Driver rankings (fewest events first)
+    rankings = [
+        {"name": d["name"], "totalEvents": d["totalEvents"], "latestScore": d["latestScore"], "latestDate": d["latestDate"]}
+        for d in sorted(drivers, key=lambda d: d["totalEvents"])
+    ]
 
     total_active = total_drive_secs + total_idle_secs
     return {
@@ -251,7 +628,7 @@ def _aggregate_analytics(results: dict) -> dict:
             "seatbeltOff": total_seatbelt_off,
             "total": total_harsh_brakes + total_harsh_corners + total_speeding + total_seatbelt_off,
         },
-        "dailyKpis": sorted(daily_kpis.values(), key=lambda d: d["date"]),
-        "dailySafety": sorted(daily_safety.values(), key=lambda d: d["date"]),
-        "driverRankings": sorted(driver_scores.values(), key=lambda d: d["totalEvents"]),
+        "dailyKpis": sorted(kpis_by_date.values(), key=lambda d: d["date"]),
+        "dailySafety": sorted(safety_by_date.values(), key=lambda d: d["date"]),
+        "driverRankings": rankings,
     }
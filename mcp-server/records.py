@@ -0,0 +1,139 @@
+"""Compact typed records for the mygeotab payloads the tools work on.
+
+Raw Get results are dicts holding datetimes (or ISO strings), reference fields
+({"id": ...} or "UnknownDriverId") and durations in three formats. Enrichment
+used to re-derive those on every access, e.g. parsing timestamps inside every
+min() key. Each record class here converts a payload once:
+
+- timestamps become epoch seconds (int)
+- ids are interned, so the same device/driver/rule id is one string object
+- durations become seconds (float)
+
+Only the fields the tools read are kept. The values that are echoed back to
+the caller (activeFrom, duration) are kept as given, so outputs don't change.
+"""
+
+import sys
+from datetime import datetime, time, timedelta, timezone
+
+
+def ref_id(field) -> str | None:
+    """Id of a reference field (dict or string); None for missing/Unknown* references."""
+    if isinstance(field, dict):
+        value = field.get("id")
+    elif isinstance(field, str) and field and not field.startswith("Unknown"):
+        value = field
+    else:
+        return None
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def epoch(value) -> int:
+    """A mygeotab date (datetime, naive means UTC, or ISO string) as epoch seconds."""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def duration_seconds(dur) -> float:
+    """ExceptionEvent duration (timedelta, datetime.time or "[d.]hh:mm:ss[.fff]") in seconds."""
+    if isinstance(dur, timedelta):
+        return dur.total_seconds()
+    if isinstance(dur, time):
+        return dur.hour * 3600 + dur.minute * 60 + dur.second + dur.microsecond / 1e6
+    if isinstance(dur, str) and dur.count(":") == 2:
+        try:
+            h, m, s = dur.split(":")
+            days, _, h = h.rpartition(".")
+            return int(days or 0) * 86400 + int(h) * 3600 + int(m) * 60 + float(s)
+        except ValueError:
+            pass
+    return 0.0
+
+
+class Event:
+    """An ExceptionEvent."""
+
+    __slots__ = ("id", "device_id", "driver_id", "rule_id", "start", "end", "duration",
+                 "distance", "state", "active_from", "raw_duration")
+
+    def __init__(self, raw: dict):
+        self.id = raw.get("id")
+        self.device_id = ref_id(raw.get("device"))
+        self.driver_id = ref_id(raw.get("driver"))
+        self.rule_id = ref_id(raw.get("rule")) or ""
+        self.active_from = raw["activeFrom"]
+        self.raw_duration = raw.get("duration")
+        self.start = epoch(self.active_from)
+        self.duration = duration_seconds(self.raw_duration)
+        self.end = epoch(raw["activeTo"]) if raw.get("activeTo") else self.start + int(self.duration)
+        self.distance = raw.get("distance", 0)
+        self.state = raw.get("state")
+
+    @property
+    def lookup_time(self) -> int:
+        """Best time for GPS/speed lookups: the end of multi-day events, else the start."""
+        return self.start + int(self.duration) if self.duration >= 86400 else self.start
+
+
+class Device:
+    __slots__ = ("id", "name", "serial_number", "vin", "license_plate", "comment")
+
+    def __init__(self, raw: dict):
+        self.id = sys.intern(raw["id"])
+        self.name = raw.get("name") or ""
+        self.serial_number = raw.get("serialNumber")
+        self.vin = raw.get("vehicleIdentificationNumber")
+        self.license_plate = raw.get("licensePlate")
+        self.comment = raw.get("comment")
+
+
+class User:
+    __slots__ = ("id", "name", "login")
+
+    def __init__(self, raw: dict):
+        self.id = sys.intern(raw["id"])
+        self.name = f"{raw.get('firstName', '')} {raw.get('lastName', '')}".strip()
+        self.login = raw.get("name")
+
+
+class LogPoint:
+    """A LogRecord (GPS fix)."""
+
+    __slots__ = ("time", "latitude", "longitude", "speed")
+
+    def __init__(self, raw: dict):
+        self.time = epoch(raw["dateTime"])
+        self.latitude = raw.get("latitude", 0)
+        self.longitude = raw.get("longitude", 0)
+        self.speed = raw.get("speed", 0)
+
+
+class RoadSpeed:
+    """A GetRoadMaxSpeeds entry: posted limit from `time`."""
+
+    __slots__ = ("time", "limit")
+
+    def __init__(self, raw: dict):
+        self.time = epoch(raw["k"])
+        self.limit = raw["v"]
+
+
+class Reference:
+    """Devices, users and rule names of one database, indexed by id."""
+
+    __slots__ = ("devices", "users", "rule_names", "device_by_id", "user_by_id")
+
+    def __init__(self, devices: list[Device], users: list[User], rule_names: dict[str, str]):
+        self.devices = devices
+        self.users = users
+        self.rule_names = rule_names
+        self.device_by_id = {d.id: d for d in devices}
+        self.user_by_id = {u.id: u for u in users}
+
+
+def convert(cls, rows) -> list:
+    """[cls(row) for row in rows], tolerating a missing/failed result."""
+    return [cls(row) for row in rows] if isinstance(rows, list) else []
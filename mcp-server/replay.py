@@ -0,0 +1,644 @@
+"""Offline stand-ins for MyGeotab and the OData Data Connector.
+
+- SyntheticFleet      deterministic fleet of any size: devices, drivers, rules,
+                      exception events, GPS and road speed limits, and the
+                      OData daily KPI/safety tables derived from them.
+- FakeGeotabAPI       answers the mygeotab.API calls the MCP tools make
+                      (Get, ExecuteMultiCall, GetRoadMaxSpeeds, GetAceResults)
+                      from a SyntheticFleet, with optional per-call latency.
+- RecordingAPI        wraps a live mygeotab.API and saves every call and its
+                      result to a JSON fixture; ReplayAPI serves that fixture.
+- serve_odata()       a local aiohttp server speaking enough OData ($select,
+                      $filter, $search=last_N_day / from_<d>_to_<d>, $apply
+                      filter/groupby/aggregate, $orderby, $top, paging) for
+                      the ODataClient; point ODATA_BASE_URL at it. Responses
+                      are gzip-compressed when asked, carry ETag/Last-Modified
+                      and answer conditional requests with 304; ODataStub can
+                      also fail its first requests with 503 to exercise retries.
+
+Results go through mygeotab's own JSON serializers, so callers see datetimes
+and fresh objects exactly as they would from the live API.
+
+    fleet = SyntheticFleet(devices=50, drivers=60, events_per_day=200)
+    client = GeotabClient(api=FakeGeotabAPI(fleet))
+    async with serve_odata(fleet.odata_tables()) as base_url:
+        os.environ["ODATA_BASE_URL"] = base_url  # before importing odata_client
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import zlib
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from aiohttp import web
+from mygeotab.api import convert_get_parameters
+from mygeotab.serializers import json_deserialize, json_serialize
+
+from geotab_client import BUILTIN_RULES
+
+FIRST_NAMES = ["Ana", "Ben", "Chloe", "Dev", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jamal", "Kai", "Lena"]
+LAST_NAMES = ["Alvarez", "Brooks", "Chen", "Dubois", "Evans", "Fischer", "Garcia", "Haddad", "Ito", "Jensen"]
+GPS_INTERVAL_SECONDS = 5
+ODATA_PAGE_SIZE = 1000
+
+
+def _stable_hash(*parts) -> int:
+    # hash() of a str changes per process; fixtures must not
+    return zlib.crc32(":".join(map(str, parts)).encode())
+
+
+def _parse_date(val) -> datetime:
+    if isinstance(val, datetime):
+        return val if val.tzinfo else val.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(str(val).replace("Z", "+00:00"))
+
+
+class SyntheticFleet:
+    """A deterministic fleet; the same arguments always produce the same data."""
+
+    def __init__(self, devices: int = 25, drivers: int = 30, events_per_day: int = 60,
+                 days: int = 14, seed: int = 7, now: datetime | None = None, episode_rate: float = 0.0):
+        # episode_rate: share of events followed by 1-6 repeats on the same
+        # device and rule shortly after (long speeding stretches and the like)
+        rng = random.Random(seed)
+        self.now = (now or datetime.now(timezone.utc)).replace(microsecond=0)
+        self.days = days
+
+        self.devices = [{
+            "id": f"b{i + 1:X}",
+            "name": f"Truck {i + 1:03d}",
+            "serialNumber": f"G9{rng.randrange(10**9, 10**10)}",
+            "vehicleIdentificationNumber": f"1FTFW1E{rng.randrange(10**9, 10**10)}",
+            "licensePlate": f"GX-{rng.randrange(1000, 9999)}",
+            "comment": "",
+        } for i in range(devices)]
+        self.users = [{
+            "id": f"u{i + 1:X}",
+            "name": f"driver{i + 1}@fleet.example",
+            "firstName": FIRST_NAMES[i % len(FIRST_NAMES)],
+            "lastName": self._last_name(i),
+            "isDriver": True,
+        } for i in range(drivers)]
+        self.rules = [{"id": "aMaxSpeed", "name": "Max Speed"}]
+        # Each device has a home position; GPS wanders around it
+        self._home = {d["id"]: (rng.uniform(33.0, 45.0), rng.uniform(-120.0, -75.0)) for d in self.devices}
+
+        rule_ids = list(BUILTIN_RULES) + ["aMaxSpeed"]
+        weights = [6 if r in ("RuleHarshBrakingId", "RulePostedSpeedingId", "RuleSpeedingId") else 1 for r in rule_ids]
+        self.events = []
+        start = self.now - timedelta(days=days)
+        for n in range(events_per_day * days):
+            device = rng.choice(self.devices)
+            user = rng.choice(self.users) if self.users and rng.random() > 0.1 else None
+            active_from = start + timedelta(seconds=rng.randrange(days * 86400))
+            seconds = rng.randrange(1, 90)
+            self.events.append({
+                "id": f"a{n + 1:X}",
+                "activeFrom": active_from,
+                "activeTo": active_from + timedelta(seconds=seconds),
+                "duration": f"00:{seconds // 60:02d}:{seconds % 60:02d}",
+                "distance": round(rng.uniform(0.0, 1.5), 3),
+                "device": {"id": device["id"]},
+                "driver": {"id": user["id"]} if user else "UnknownDriverId",
+                "rule": {"id": rng.choices(rule_ids, weights)[0]},
+                "state": "Valid",
+                "version": "0000000000000001",
+            })
+        if episode_rate:
+            repeats = random.Random(seed + 1)  # leaves the base events unchanged
+            for event in list(self.events):
+                if repeats.random() >= episode_rate:
+                    continue
+                previous = event
+                for k in range(repeats.randint(1, 6)):
+                    active_from = previous["activeTo"] + timedelta(seconds=repeats.randrange(5, 120))
+                    seconds = repeats.randrange(1, 90)
+                    previous = {
+                        **event,
+                        "id": f"{event['id']}r{k + 1}",
+                        "activeFrom": active_from,
+                        "activeTo": active_from + timedelta(seconds=seconds),
+                        "duration": f"00:{seconds // 60:02d}:{seconds % 60:02d}",
+                        "distance": round(repeats.uniform(0.0, 1.5), 3),
+                    }
+                    self.events.append(previous)
+        self.events.sort(key=lambda e: e["activeFrom"])
+
+    @staticmethod
+    def _last_name(i: int) -> str:
+        # Unique full names: cycle first x last names, then number the repeats
+        n = len(FIRST_NAMES) * len(LAST_NAMES)
+        name = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        return name if i < n else f"{name}-{i // n + 1}"
+
+    # -- GPS and road speed, generated on demand for any window --------------
+
+    def log_records(self, device_id: str, from_date: datetime, to_date: datetime, limit: int) -> list[dict]:
+        lat0, lon0 = self._home.get(device_id, (0.0, 0.0))
+        t = int(from_date.timestamp()) // GPS_INTERVAL_SECONDS * GPS_INTERVAL_SECONDS
+        if t < from_date.timestamp():
+            t += GPS_INTERVAL_SECONDS
+        records = []
+        while t <= to_date.timestamp() and len(records) < limit:
+            phase = (t // GPS_INTERVAL_SECONDS) % 720
+            records.append({
+                "id": None,
+                "dateTime": datetime.fromtimestamp(t, timezone.utc),
+                "latitude": round(lat0 + 0.0004 * phase, 6),
+                "longitude": round(lon0 + 0.0003 * phase, 6),
+                "speed": float(30 + _stable_hash(device_id, t) % 90),
+                "device": {"id": device_id},
+            })
+            t += GPS_INTERVAL_SECONDS
+        return records
+
+    def road_max_speeds(self, device_id: str, from_date: datetime, to_date: datetime) -> list[dict]:
+        t = int(from_date.timestamp()) // 10 * 10
+        return [
+            {"k": datetime.fromtimestamp(s, timezone.utc), "v": float(40 + 10 * (_stable_hash(device_id, s // 600) % 7))}
+            for s in range(t, int(to_date.timestamp()) + 1, 10)
+        ]
+
+    # -- OData tables -------------------------------------------------------
+
+    def odata_tables(self) -> dict[str, list[dict]]:
+        """Daily VehicleKpi/VehicleSafety/DriverSafety rows consistent with the events."""
+        rng = random.Random(len(self.events))
+        user_names = {u["id"]: f"{u['firstName']} {u['lastName']}" for u in self.users}
+        counts: dict[tuple, dict[str, int]] = {}
+        for e in self.events:
+            day = e["activeFrom"].date().isoformat()
+            column = {
+                "RuleHarshBrakingId": "HarshBraking_Count",
+                "RuleHarshCorneringId": "HarshCornering_Count",
+                "RulePostedSpeedingId": "Speeding_Count",
+                "RuleSpeedingId": "Speeding_Count",
+                "aMaxSpeed": "Speeding_Count",
+                "RuleSeatbeltId": "SeatbeltOff_Count",
+            }.get(e["rule"]["id"])
+            if not column:
+                continue
+            for key in (("device", e["device"]["id"], day),
+                        ("driver", e["driver"]["id"] if isinstance(e["driver"], dict) else None, day)):
+                if key[1]:
+                    row = counts.setdefault(key, {})
+                    row[column] = row.get(column, 0) + 1
+
+        tables: dict[str, list[dict]] = {"VehicleKpi_Daily": [], "VehicleSafety_Daily": [], "DriverSafety_Daily": []}
+        for offset in range(self.days, -1, -1):
+            day = (self.now - timedelta(days=offset)).date().isoformat()
+            for d in self.devices:
+                drive = rng.randrange(2 * 3600, 9 * 3600)
+                tables["VehicleKpi_Daily"].append({
+                    "Device_Name": d["name"], "Device_SerialNo": d["serialNumber"], "Local_Date": day,
+                    "Trip_Distance_Km": round(drive / 3600 * rng.uniform(35, 70), 2),
+                    "Total_Driving_Duration_Seconds": drive,
+                    "Total_Idling_Duration_Seconds": rng.randrange(600, 5400),
+                    "Trip_Count": rng.randrange(3, 25), "Stop_Count": rng.randrange(3, 30),
+                })
+                c = counts.get(("device", d["id"], day), {})
+                tables["VehicleSafety_Daily"].append({
+                    "Device_Name": d["name"], "Local_Date": day, **self._safety(c, rng),
+                    "Speeding_Duration_Seconds": c.get("Speeding_Count", 0) * rng.randrange(5, 60),
+                    "SeatbeltOff_Count": c.get("SeatbeltOff_Count", 0),
+                })
+            for u in self.users:
+                c = counts.get(("driver", u["id"], day), {})
+                tables["DriverSafety_Daily"].append({"Driver_Name": user_names[u["id"]], "Local_Date": day,
+                                                     **self._safety(c, rng)})
+        return tables
+
+    @staticmethod
+    def _safety(c: dict, rng: random.Random) -> dict:
+        brakes = c.get("HarshBraking_Count", 0)
+        corners = c.get("HarshCornering_Count", 0)
+        speeding = c.get("Speeding_Count", 0)
+        return {
+            "Safety_Score": round(max(0.0, 100 - 4 * brakes - 3 * corners - 2 * speeding - rng.uniform(0, 5)), 1),
+            "HarshBraking_Count": brakes,
+            "HarshCornering_Count": corners,
+            "Speeding_Count": speeding,
+        }
+
+
+# ----------------------------------------------------------------------
+# mygeotab.API stand-ins
+# ----------------------------------------------------------------------
+class _APIBase:
+    """The mygeotab.API surface GeotabClient uses, funnelled into call_async()."""
+
+    def authenticate(self, is_global=True):
+        return None
+
+    async def get_async(self, type_name, **parameters):
+        return await self.call_async("Get", type_name=type_name, **convert_get_parameters(parameters))
+
+    async def multi_call_async(self, calls):
+        formatted = [dict(method=c[0], params=c[1] if len(c) > 1 else {}) for c in calls]
+        return await self.call_async("ExecuteMultiCall", calls=formatted)
+
+    async def call_async(self, method, **parameters):
+        raise NotImplementedError
+
+
+def _normalize(parameters: dict) -> dict:
+    # mygeotab camelCases the keyword arguments (type_name -> typeName)
+    return {re.sub(r"_([a-z])", lambda m: m.group(1).upper(), k): v for k, v in parameters.items()}
+
+
+class FakeGeotabAPI(_APIBase):
+    """Serves a SyntheticFleet; every round trip costs `latency` seconds."""
+
+    def __init__(self, fleet: SyntheticFleet, latency: float = 0.0):
+        self.fleet = fleet
+        self.latency = latency
+        self.round_trips = 0
+
+    async def call_async(self, method, **parameters):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = _normalize(parameters)
+        if method == "ExecuteMultiCall":
+            result = [self._dispatch(c["method"], c.get("params", {})) for c in params["calls"]]
+        else:
+            result = self._dispatch(method, params)
+        # Same wire format as the real client: fresh objects, parsed datetimes
+        return json_deserialize(json_serialize(result))
+
+    def _dispatch(self, method: str, params: dict):
+        if method == "Get":
+            return self._get(params["typeName"], params.get("search") or {}, params.get("resultsLimit"))
+        if method == "GetFeed":
+            return self._feed(params["typeName"], params.get("fromVersion"), params.get("search") or {},
+                              params.get("resultsLimit") or 50000)
+        if method == "GetRoadMaxSpeeds":
+            return self.fleet.road_max_speeds(
+                params["deviceSearch"]["id"], _parse_date(params["fromDate"]), _parse_date(params["toDate"]))
+        if method == "GetAceResults":
+            return self._ace(params.get("functionName"))
+        raise ValueError(f"FakeGeotabAPI does not implement {method}")
+
+    def _get(self, type_name: str, search: dict, limit: int | None):
+        fleet = self.fleet
+        if type_name == "Device":
+            rows = fleet.devices
+        elif type_name == "User":
+            rows = fleet.users
+        elif type_name == "Rule":
+            rows = fleet.rules
+        elif type_name == "ExceptionEvent":
+            rows = fleet.events
+            if "fromDate" in search:
+                from_date = _parse_date(search["fromDate"])
+                rows = [e for e in rows if e["activeTo"] >= from_date]
+            if "toDate" in search:
+                to_date = _parse_date(search["toDate"])
+                rows = [e for e in rows if e["activeFrom"] <= to_date]
+            if "deviceSearch" in search:
+                rows = [e for e in rows if e["device"]["id"] == search["deviceSearch"]["id"]]
+            if "userSearch" in search:
+                uid = search["userSearch"]["id"]
+                rows = [e for e in rows if isinstance(e["driver"], dict) and e["driver"]["id"] == uid]
+        elif type_name == "LogRecord":
+            return fleet.log_records(
+                search["deviceSearch"]["id"], _parse_date(search["fromDate"]), _parse_date(search["toDate"]),
+                limit or 50000,
+            )
+        else:
+            raise ValueError(f"FakeGeotabAPI does not implement Get {type_name}")
+        if "id" in search:
+            rows = [r for r in rows if r["id"] == search["id"]]
+        return rows[:limit] if limit else rows
+
+    def _feed(self, type_name: str, from_version: str | None, search: dict, limit: int) -> dict:
+        """GetFeed over fleet.events, whose list order is upload order: an event's
+        version is its index + 1, so events appended later (late uploads) come next."""
+        if type_name != "ExceptionEvent":
+            raise ValueError(f"FakeGeotabAPI does not implement GetFeed {type_name}")
+        events = self.fleet.events
+        if from_version is not None:
+            start = int(from_version, 16)
+        else:  # seeding: start at the first event still active at fromDate
+            from_date = _parse_date(search["fromDate"]) if "fromDate" in search else None
+            start = next((i for i, e in enumerate(events) if from_date is None or e["activeTo"] >= from_date),
+                         len(events))
+        data = events[start:start + limit]
+        return {"data": data, "toVersion": f"{start + len(data):016X}"}
+
+    @staticmethod
+    def _ace(function_name: str):
+        if function_name == "create-chat":
+            return {"results": [{"chat_id": "chat-1"}]}
+        if function_name == "send-prompt":
+            return {"results": [{"message_group_id": "mg-1"}]}
+        return {"results": [{"message_group": {
+            "status": {"status": "DONE"},
+            "messages": {"m1": {"reasoning": "Synthetic fleet: no Ace analysis available offline."}},
+        }}]}
+
+
+def _fixture_key(method: str, params: dict, loose: bool = False) -> str:
+    def strip(obj):
+        if isinstance(obj, dict):
+            return {k: strip(v) for k, v in obj.items() if not (loose and k in ("fromDate", "toDate"))}
+        if isinstance(obj, list):
+            return [strip(v) for v in obj]
+        return obj
+    params = {k: v for k, v in _normalize(params).items() if k != "credentials"}
+    return json_serialize({"method": method, "params": strip(params)})
+
+
+class RecordingAPI(_APIBase):
+    """Wraps a live mygeotab.API and records each call for ReplayAPI."""
+
+    def __init__(self, api, path: str):
+        self.api = api
+        self.path = path
+        self.calls: list[dict] = []
+
+    def authenticate(self, is_global=True):
+        return self.api.authenticate()
+
+    async def call_async(self, method, **parameters):
+        result = await self.api.call_async(method, **parameters)
+        self.calls.append({"method": method, "params": _normalize(parameters), "result": result})
+        return result
+
+    def save(self):
+        with open(self.path, "w") as f:
+            f.write(json_serialize({"calls": self.calls}))
+
+
+class ReplayAPI(_APIBase):
+    """Serves calls recorded by RecordingAPI.
+
+    Calls are matched exactly first; otherwise with their date windows
+    ignored, so a fixture recorded yesterday still answers "last N days".
+    """
+
+    def __init__(self, path: str):
+        with open(path) as f:
+            calls = json_deserialize(f.read())["calls"]
+        self._exact: dict[str, str] = {}
+        self._loose: dict[str, str] = {}
+        for c in calls:
+            result = json_serialize(c["result"])
+            self._exact.setdefault(_fixture_key(c["method"], c["params"]), result)
+            self._loose.setdefault(_fixture_key(c["method"], c["params"], loose=True), result)
+
+    async def call_async(self, method, **parameters):
+        result = self._exact.get(_fixture_key(method, parameters))
+        if result is None:
+            result = self._loose.get(_fixture_key(method, parameters, loose=True))
+        if result is None:
+            raise KeyError(f"No recorded result for {method} {parameters}")
+        return json_deserialize(result)
+
+
+# ----------------------------------------------------------------------
+# OData Data Connector stand-in
+# ----------------------------------------------------------------------
+_COMPARISON = re.compile(r"^\s*(\w+)\s+(eq|ne|gt|ge|lt|le)\s+(.+?)\s*$")
+
+
+def _literal(raw: str):
+    raw = raw.strip()
+    if raw.startswith("'") and raw.endswith("'"):
+        return raw[1:-1].replace("''", "'")
+    try:
+        return float(raw) if "." in raw else int(raw)
+    except ValueError:
+        return raw  # unquoted dates compare as ISO strings
+
+
+def _split_top(expr: str, word: str) -> list[str]:
+    """Split on ` and ` / ` or ` outside parentheses and quotes."""
+    parts, depth, quoted, start = [], 0, False, 0
+    token = f" {word} "
+    i = 0
+    while i < len(expr):
+        ch = expr[i]
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and expr[i:i + len(token)].lower() == token:
+            parts.append(expr[start:i])
+            i += len(token)
+            start = i
+            continue
+        i += 1
+    parts.append(expr[start:])
+    return parts
+
+
+def _compile_filter(expr: str):
+    """Compile the OData $filter subset the client uses into a row predicate."""
+    expr = expr.strip()
+    ors = _split_top(expr, "or")
+    if len(ors) > 1:
+        preds = [_compile_filter(p) for p in ors]
+        return lambda row: any(p(row) for p in preds)
+    ands = _split_top(expr, "and")
+    if len(ands) > 1:
+        preds = [_compile_filter(p) for p in ands]
+        return lambda row: all(p(row) for p in preds)
+    if expr.startswith("(") and expr.endswith(")"):
+        return _compile_filter(expr[1:-1])
+    m = _COMPARISON.match(expr)
+    if not m:
+        raise ValueError(f"Unsupported $filter: {expr}")
+    field, op, value = m.group(1), m.group(2), _literal(m.group(3))
+    ops = {
+        "eq": lambda a, b: a == b, "ne": lambda a, b: a != b,
+        "gt": lambda a, b: a > b, "ge": lambda a, b: a >= b,
+        "lt": lambda a, b: a < b, "le": lambda a, b: a <= b,
+    }
+    compare = ops[op]
+
+    def predicate(row):
+        v = row.get(field)
+        return v is not None and compare(v, value)
+    return predicate
+
+
+_AGGREGATE = re.compile(r"^\s*(\w+) with (sum|max|min|average) as (\w+)\s*$")
+
+
+def _apply(rows: list[dict], expr: str) -> list[dict]:
+    """Evaluate `[filter(...)/]groupby((a,b),aggregate(x with op as y,...))` or a bare aggregate(...)."""
+    steps, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(expr):
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch in "()":
+            depth += 1 if ch == "(" else -1
+        elif not quoted and depth == 0 and ch == "/":
+            steps.append(expr[start:i])
+            start = i + 1
+    steps.append(expr[start:])
+    for step in (s.strip() for s in steps):
+        if step.startswith("filter(") and step.endswith(")"):
+            predicate = _compile_filter(step[7:-1])
+            rows = [r for r in rows if predicate(r)]
+            continue
+        m = re.fullmatch(r"groupby\(\(([\w,]*)\),aggregate\((.+)\)\)", step) or \
+            re.fullmatch(r"()aggregate\((.+)\)", step)
+        if not m:
+            raise ValueError(f"Unsupported $apply: {step}")
+        keys = [k for k in m.group(1).split(",") if k]
+        methods = []
+        for item in m.group(2).split(","):
+            am = _AGGREGATE.match(item)
+            if not am:
+                raise ValueError(f"Unsupported aggregate: {item}")
+            methods.append(am.groups())
+        groups: dict[tuple, list[dict]] = {}
+        for row in rows:
+            groups.setdefault(tuple(row.get(k) for k in keys), []).append(row)
+        out = []
+        for key, members in groups.items():
+            result = dict(zip(keys, key))
+            for field, op, alias in methods:
+                values = [r[field] for r in members if r.get(field) is not None]
+                if op == "sum":
+                    result[alias] = sum(values)
+                elif op == "average":
+                    result[alias] = sum(values) / len(values) if values else None
+                else:
+                    result[alias] = (max if op == "max" else min)(values) if values else None
+            out.append(result)
+        rows = out
+    return rows
+
+
+class ODataStub:
+    """Holds the tables and request counters behind serve_odata().
+
+    supports_apply=False answers `$apply` with 501, like a connector without
+    the aggregation extension. The first `failures` requests get 503 with
+    Retry-After: `retry_after` (None leaves the header out). Every response is Last-Modified `modified` (bump it after
+    changing the tables) and its ETag is a hash of the body.
+    """
+
+    def __init__(self, tables: dict[str, list[dict]], today: date | None = None, supports_apply: bool = True,
+                 failures: int = 0, retry_after: str | None = "0"):
+        self.tables = tables
+        self.today = today or datetime.now(timezone.utc).date()
+        self.supports_apply = supports_apply
+        self.failures = failures
+        self.retry_after = retry_after
+        self.modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.requests = 0
+        self.not_modified = 0
+
+    def select_rows(self, table: str, query) -> list[dict]:
+        rows = self.tables[table]
+        search = query.get("$search", "")
+        m = re.fullmatch(r"last_(\d+)_day", search)
+        if m:
+            since = (self.today - timedelta(days=int(m.group(1)))).isoformat()
+            rows = [r for r in rows if str(r.get("Local_Date", "")) >= since]
+        m = re.fullmatch(r"from_(\d{4}-\d{2}-\d{2})_to_(\d{4}-\d{2}-\d{2})", search)
+        if m:
+            rows = [r for r in rows if m.group(1) <= str(r.get("Local_Date", ""))[:10] <= m.group(2)]
+        if "$apply" in query:
+            rows = _apply(rows, query["$apply"])
+        if "$filter" in query:
+            predicate = _compile_filter(query["$filter"])
+            rows = [r for r in rows if predicate(r)]
+        if "$orderby" in query:
+            rows = list(rows)
+            for clause in reversed(query["$orderby"].split(",")):
+                field, _, direction = clause.strip().partition(" ")
+                rows.sort(key=lambda r: (r.get(field) is not None, r.get(field)), reverse=direction == "desc")
+        if "$top" in query:
+            rows = rows[:int(query["$top"])]
+        if "$select" in query:
+            fields = query["$select"].split(",")
+            rows = [{f: r.get(f) for f in fields} for r in rows]
+        return rows
+
+    def _not_modified(self, request: web.Request, etag: str) -> bool:
+        if "If-None-Match" in request.headers:
+            return etag in (tag.strip() for tag in request.headers["If-None-Match"].split(","))
+        try:
+            return parsedate_to_datetime(request.headers["If-Modified-Since"]) >= self.modified
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.failures > 0:
+            self.failures -= 1
+            headers = {"Retry-After": self.retry_after} if self.retry_after is not None else {}
+            return web.json_response({"error": {"message": "Service unavailable"}}, status=503, headers=headers)
+        table = request.match_info["table"]
+        if table not in self.tables:
+            return web.json_response({"error": {"message": f"Unknown table {table}"}}, status=404)
+        if "$apply" in request.query and not self.supports_apply:
+            return web.json_response({"error": {"message": "$apply is not supported"}}, status=501)
+        try:
+            rows = self.select_rows(table, request.query)
+        except ValueError as e:
+            return web.json_response({"error": {"message": str(e)}}, status=400)
+        skip = int(request.query.get("$skiptoken", "0"))
+        body = {"value": rows[skip:skip + ODATA_PAGE_SIZE]}
+        if skip + ODATA_PAGE_SIZE < len(rows):
+            body["@odata.nextLink"] = str(request.url.update_query({"$skiptoken": str(skip + ODATA_PAGE_SIZE)}))
+        text = json.dumps(body)
+        headers = {
+            "ETag": '"%s"' % hashlib.sha1(text.encode()).hexdigest()[:16],
+            "Last-Modified": format_datetime(self.modified, usegmt=True),
+        }
+        if self._not_modified(request, headers["ETag"]):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        resp = web.Response(text=text, content_type="application/json", headers=headers)
+        # gzip whenever it is accepted, else deflate or identity per Accept-Encoding
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            resp.enable_compression(web.ContentCoding.gzip)
+        else:
+            resp.enable_compression()
+        return resp
+
+
+@asynccontextmanager
+async def serve_odata(tables: dict[str, list[dict]] | ODataStub, host: str = "127.0.0.1", port: int = 0):
+    """Run an OData stub for the duration of the block; yields its base URL."""
+    stub = tables if isinstance(tables, ODataStub) else ODataStub(tables)
+    app = web.Application()
+    app.router.add_get("/odata/v4/svc/{table}", stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    try:
+        yield f"http://{host}:{bound_port}/odata/v4/svc"
+    finally:
+        await runner.cleanup()
+
+
+async def record_odata(client, path: str, tables=("VehicleKpi_Daily", "VehicleSafety_Daily", "DriverSafety_Daily"),
+                       search: str = "last_14_day"):
+    """Pull whole tables through a live ODataClient into a fixture for serve_odata()."""
+    save_odata_fixture({t: await client.query(t, search=search) for t in tables}, path)
+
+
+def save_odata_fixture(tables: dict[str, list[dict]], path: str):
+    with open(path, "w") as f:
+        json.dump(tables, f)
+
+
+def load_odata_fixture(path: str) -> dict[str, list[dict]]:
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,338 @@
+"""Rolling driver-risk features, maintained incrementally.
+
+A RiskEngine keeps each driver's last WINDOW_DAYS of:
+
+- exception events by category (Geotab ExceptionEvent, categorized as in
+  fetch_safety_events), weighted by CATEGORY_WEIGHTS;
+- distance driven (VehicleKpi_Daily Trip_Distance_Km). The OData tables have
+  no per-driver distance, so each vehicle-day is attributed: split between the
+  drivers with events on that vehicle that day (by event count), otherwise
+  given to the last driver seen on the vehicle. Distance nobody can be
+  attributed to is reported as unattributedKm.
+
+Each update (an event, a vehicle-day distance) and each day leaving the window
+adjusts running sums, so no history is rescanned: totals, per-category counts
+and the Σy / Σxy of daily weighted events behind a least-squares trend.
+refresh() pulls only what is new, at most every REFRESH_SECONDS; in between
+get_driver_risk answers from the accumulators:
+
+- events through an ExceptionEvent GetFeed, resumed from the feed version
+  (toVersion) of the last refresh. The feed follows upload order, so events
+  a device uploads hours late are still picked up; repeats are deduplicated
+  by id. The first refresh seeds the feed at the window start.
+- the last RESYNC_DAYS of distances.
+
+The whole state, feed version included, is carried across restarts by the
+warm-start snapshot.
+
+    risk score = weighted events per 100 km (distance floored at MIN_DISTANCE_KM)
+"""
+
+import asyncio
+import heapq
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import records
+import tracing
+from geotab_client import _category
+
+WINDOW_DAYS = int(os.getenv("MCP_RISK_WINDOW_DAYS", "14"))
+REFRESH_SECONDS = float(os.getenv("MCP_RISK_REFRESH_SECONDS", "300"))
+RESYNC_DAYS = 2  # the connector may still restate the most recent days
+FEED_RESULTS_LIMIT = 50000  # ExceptionEvent rows per GetFeed page (the server's maximum)
+FEED_MAX_PAGES = 10  # per refresh; a longer backlog carries on from the feed version next time
+MIN_DISTANCE_KM = 50.0
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()  # event day = epoch seconds // 86400 + this (UTC)
+
+CATEGORY_WEIGHTS = {
+    "hard_brake": 1.5,
+    "harsh_cornering": 1.2,
+    "hard_acceleration": 1.0,
+    "speeding": 1.0,
+    "seatbelt": 2.0,
+    "fatigue": 2.0,
+    "reverse": 0.3,
+    "after_hours": 0.3,
+    "excessive_idling": 0.2,
+}
+DEFAULT_WEIGHT = 0.5
+
+
+class DriverWindow:
+    """Running sums over one driver's days in the window."""
+
+    __slots__ = ("days", "_expiry", "events", "weighted", "distance", "categories", "sum_xy")
+
+    def __init__(self):
+        self.days: dict[int, list] = {}  # day ordinal -> [weighted events, km, {category: events}]
+        self._expiry: list[int] = []  # min-heap of the keys of `days`
+        self.events = 0
+        self.weighted = 0.0
+        self.distance = 0.0
+        self.categories: dict[str, int] = {}
+        self.sum_xy = 0.0  # Σ day ordinal × weighted events
+
+    def _bucket(self, day: int) -> list:
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = [0.0, 0.0, {}]
+            heapq.heappush(self._expiry, day)
+        return bucket
+
+    def add_event(self, day: int, category: str, weight: float):
+        bucket = self._bucket(day)
+        bucket[0] += weight
+        bucket[2][category] = bucket[2].get(category, 0) + 1
+        self.events += 1
+        self.weighted += weight
+        self.categories[category] = self.categories.get(category, 0) + 1
+        self.sum_xy += day * weight
+
+    def add_distance(self, day: int, km: float):
+        """km may be negative when a vehicle-day is re-attributed."""
+        self._bucket(day)[1] += km
+        self.distance += km
+
+    def expire(self, cutoff: int):
+        """Drop days before `cutoff` (a day ordinal)."""
+        while self._expiry and self._expiry[0] < cutoff:
+            day = heapq.heappop(self._expiry)
+            weighted, km, categories = self.days.pop(day)
+            self.weighted -= weighted
+            self.distance -= km
+            self.sum_xy -= day * weighted
+            for category, n in categories.items():
+                self.events -= n
+                left = self.categories[category] - n
+                if left:
+                    self.categories[category] = left
+                else:
+                    del self.categories[category]
+
+    def trend(self, start: int, days: int) -> float:
+        """Least-squares slope of daily weighted events over the window starting at `start`.
+
+        Days without events count as zeros, so Σx and Σx² are fixed by the
+        window length; Σxy is shifted from ordinals to window offsets.
+        """
+        if days < 2:
+            return 0.0
+        sum_x = days * (days - 1) / 2
+        sum_xx = (days - 1) * days * (2 * days - 1) / 6
+        sum_xy = self.sum_xy - start * self.weighted
+        return (days * sum_xy - sum_x * self.weighted) / (days * sum_xx - sum_x * sum_x)
+
+
+class RiskEngine:
+    """Per-database risk accumulators; see the module docstring."""
+
+    def __init__(self, window_days: int = WINDOW_DAYS):
+        self.window_days = window_days
+        self.drivers: dict[str, DriverWindow] = {}
+        self.names: dict[str, str] = {}  # driver id -> display name
+        self.end = datetime.now(timezone.utc).date().toordinal()
+        self.feed_version: str | None = None  # ExceptionEvent GetFeed toVersion ingested through
+        self.distances_through: date | None = None
+        self.refreshed_at: datetime | None = None
+        self.unattributed_km = 0.0
+        self._refreshed = 0.0  # monotonic
+        self._lock = asyncio.Lock()
+        self._seen: dict[str, int] = {}  # event id -> day
+        self._device_drivers: dict[tuple[str, int], dict[str, int]] = {}  # (device, day) -> {driver: events}
+        self._device_km: dict[tuple[str, int], float] = {}
+        self._attributed: dict[tuple[str, int], dict[str, float]] = {}
+        self._unattributed: dict[tuple[str, int], float] = {}
+        self._last_driver: dict[str, tuple[int, str]] = {}  # device -> (day, driver)
+
+    @property
+    def start(self) -> int:
+        return self.end - self.window_days + 1
+
+    def _window(self, driver: str) -> DriverWindow:
+        window = self.drivers.get(driver)
+        if window is None:
+            window = self.drivers[driver] = DriverWindow()
+        return window
+
+    # -- updates ----------------------------------------------------------
+
+    def add_event(self, event_id: str | None, driver: str, device: str, day: int, category: str):
+        if day < self.start or (event_id and event_id in self._seen):
+            return
+        if event_id:
+            self._seen[event_id] = day
+        self._window(driver).add_event(day, category, CATEGORY_WEIGHTS.get(category, DEFAULT_WEIGHT))
+        drivers = self._device_drivers.setdefault((device, day), {})
+        drivers[driver] = drivers.get(driver, 0) + 1
+        if day >= self._last_driver.get(device, (0, ""))[0]:
+            self._last_driver[device] = (day, driver)
+        self._attribute(device, day)
+
+    def set_distance(self, device: str, day: int, km: float):
+        if day < self.start:
+            return
+        self._device_km[(device, day)] = km
+        self._attribute(device, day)
+
+    def _attribute(self, device: str, day: int):
+        key = (device, day)
+        km = self._device_km.get(key, 0.0)
+        drivers = self._device_drivers.get(key)
+        if drivers:
+            total = sum(drivers.values())
+            shares = {driver: km * n / total for driver, n in drivers.items()}
+        elif device in self._last_driver:
+            shares = {self._last_driver[device][1]: km}
+        else:
+            shares = {}
+        old = self._attributed.get(key, {})
+        for driver in old.keys() | shares.keys():
+            delta = shares.get(driver, 0.0) - old.get(driver, 0.0)
+            if delta:
+                self._window(driver).add_distance(day, delta)
+        self._attributed[key] = shares
+        self.unattributed_km -= self._unattributed.pop(key, 0.0)
+        if not shares and km:
+            self._unattributed[key] = km
+            self.unattributed_km += km
+
+    def advance(self, today: date):
+        """Move the window end to `today`, forgetting per-vehicle state for days that left it."""
+        end = today.toordinal()
+        if end <= self.end:
+            return
+        self.end = end
+        cutoff = self.start
+        self._seen = {k: d for k, d in self._seen.items() if d >= cutoff}
+        for table in (self._device_drivers, self._device_km, self._attributed):
+            for key in [k for k in table if k[1] < cutoff]:
+                del table[key]
+        for key in [k for k in self._unattributed if k[1] < cutoff]:
+            self.unattributed_km -= self._unattributed.pop(key)
+
+    # -- refresh ----------------------------------------------------------
+
+    async def refresh(self, geotab, odata):
+        """Ingest new events and recent distances, unless refreshed within REFRESH_SECONDS."""
+        async with self._lock:
+            today = datetime.now(timezone.utc).date()
+            self.advance(today)
+            fresh = self.refreshed_at is not None and time.monotonic() - self._refreshed < REFRESH_SECONDS
+            tracing.cache("risk", hit=fresh)
+            if fresh:
+                return
+            window_start = date.fromordinal(self.start)
+            distance_from = window_start
+            if self.distances_through:
+                distance_from = max(window_start, self.distances_through - timedelta(days=RESYNC_DAYS))
+
+            async def distances(day: date) -> list[dict]:
+                return await odata.query(
+                    "VehicleKpi_Daily",
+                    select="Device_Name,Local_Date,Trip_Distance_Km",
+                    search=f"from_{day.isoformat()}_to_{day.isoformat()}",
+                )
+
+            days = [distance_from + timedelta(days=i) for i in range((today - distance_from).days + 1)]
+            (events, version), ref, *kpi_days = await asyncio.gather(
+                self._read_feed(geotab, window_start),
+                geotab.reference(),
+                *(distances(day) for day in days),
+            )
+
+            with tracing.phase("risk_update"):
+                self._ingest(records.convert(records.Event, events), ref, kpi_days)
+            # Only advanced once the events are ingested, so a failed refresh re-reads them
+            self.feed_version = version
+            self.distances_through = today
+            self.refreshed_at = datetime.now(timezone.utc)
+            self._refreshed = time.monotonic()
+
+    async def _read_feed(self, geotab, window_start: date) -> tuple[list[dict], str | None]:
+        """New ExceptionEvents since the stored feed version, and the version they run to."""
+        version = self.feed_version
+        events = []
+        for _ in range(FEED_MAX_PAGES):
+            params = {"typeName": "ExceptionEvent", "resultsLimit": FEED_RESULTS_LIMIT}
+            if version:
+                params["fromVersion"] = version
+            else:
+                params["search"] = {"fromDate": datetime.combine(window_start, datetime.min.time(),
+                                                                 timezone.utc).isoformat()}
+            page = await geotab.api_call("GetFeed", params)
+            data = page.get("data") or []
+            events.extend(data)
+            version = page.get("toVersion") or version
+            if len(data) < FEED_RESULTS_LIMIT:
+                break
+        return events, version
+
+    def _ingest(self, events: list[records.Event], ref: records.Reference, kpi_days: list[list[dict]]):
+        for u in ref.users:
+            self.names[u.id] = u.name or u.login or u.id
+        for event in events:
+            if not event.driver_id or not event.device_id:
+                continue
+            day = event.start // 86400 + _EPOCH_ORDINAL
+            self.add_event(event.id, event.driver_id, event.device_id, day, _category(event, ref.rule_names))
+
+        device_ids = {d.name: d.id for d in ref.devices}
+        for rows in kpi_days:
+            for row in rows:
+                device = device_ids.get(row.get("Device_Name"))
+                local_date = (row.get("Local_Date") or "")[:10]
+                if device and local_date:
+                    self.set_distance(device, date.fromisoformat(local_date).toordinal(),
+                                      row.get("Trip_Distance_Km") or 0.0)
+
+    # -- warm start (see warmstart.py) ------------------------------------
+
+    def export_state(self) -> dict:
+        return {k: v for k, v in self.__dict__.items() if k not in ("_lock", "_refreshed")}
+
+    def restore_state(self, state: dict):
+        self.__dict__.update(state)
+        if self.refreshed_at is not None:
+            # Carry the refresh age over to this process's monotonic clock
+            age = (datetime.now(timezone.utc) - self.refreshed_at).total_seconds()
+            self._refreshed = time.monotonic() - max(age, 0.0)
+
+    # -- read -------------------------------------------------------------
+
+    def top(self, limit: int = 10) -> dict:
+        """Highest-risk drivers from the accumulators (no upstream calls)."""
+        start = self.start
+        scored = []
+        for driver, window in self.drivers.items():
+            window.expire(start)
+            if window.events or window.distance > 0.5:
+                scored.append((window.weighted * 100 / max(window.distance, MIN_DISTANCE_KM), driver, window))
+        top = heapq.nlargest(max(limit, 0), scored, key=lambda s: s[0])
+        return {
+            "window": {
+                "start": date.fromordinal(start).isoformat(),
+                "end": date.fromordinal(self.end).isoformat(),
+                "days": self.window_days,
+            },
+            "refreshedAt": self.refreshed_at.isoformat() if self.refreshed_at else None,
+            "driversScored": len(scored),
+            "unattributedKm": round(self.unattributed_km),
+            "drivers": [
+                {
+                    "name": self.names.get(driver, driver),
+                    "driverId": driver,
+                    "riskScore": round(score, 2),
+                    "events": window.events,
+                    "distanceKm": round(window.distance, 1),
+                    "eventsPer100Km": round(window.events * 100 / window.distance, 2) if window.distance >= 1 else None,
+                    "categoryMix": {
+                        category: round(n / window.events, 3)
+                        for category, n in sorted(window.categories.items(), key=lambda c: -c[1])
+                    },
+                    "trend": round(window.trend(start, self.window_days), 3),
+                }
+                for score, driver, window in top
+            ],
+        }
@@ -16,67 +16,86 @@ load_dotenv(_this_dir.parent / "functions" / ".env")
 load_dotenv()
 
 from fastmcp import FastMCP
-from geotab_client import GeotabClient, BUILTIN_RULES, RULE_CATEGORIES, _get_id
-from odata_client import ODataClient
+from geotab_client import BUILTIN_RULES, RULE_CATEGORIES
+import records
+from snapshots import parse_range
+from tenants import TenantPool
+from warmstart import WARM_START_FILE, WarmStart
+import tracing
 
 INSTRUCTIONS = """\
 You are a fleet safety assistant with access to Geotab telematics data. Use these tools to answer questions about fleet operations:
 
-- **get_safety_events**: For questions about recent safety incidents, harsh braking, speeding, seatbelt violations. Supports filtering by driver name and event type.
-- **get_fleet_kpis**: For fleet-wide overview questions — total distance, drive hours, idle percentage, safety score, trip counts over 14 days.
+- **get_safety_events**: For questions about recent safety incidents, harsh braking, speeding, seatbelt violations. Supports filtering by driver name and event type; pass enrich='profile' when coaching on specific events (speed trace, time over the limit, braking rate).
+- **get_fleet_kpis**: For fleet-wide overview questions — total distance, drive hours, idle percentage, safety score, trip counts over 14 days, or any date range via start_date/end_date (month-over-month, quarterly).
 - **get_driver_rankings**: For comparing drivers — who has the most/fewest events, best/worst safety scores. Sortable by total_events or safety_score.
 - **get_vehicle_details**: For questions about a specific vehicle — its info, recent events, and KPIs.
-- **get_driver_history**: For questions about a specific driver — their event patterns and safety trend over time.
+- **get_driver_history**: For questions about a specific driver — their event patterns and safety trend over time; pass start_date/end_date for long ranges.
+- **compare_vehicles** / **compare_drivers**: The same details for several vehicles or drivers in one call. Use these whenever more than one is involved.
+- **get_driver_risk**: For "who are our riskiest drivers" — severity-weighted events per 100 km driven, event category mix and trend over the last 14 days.
+- **sync_snapshots**: Pre-load local history so long date ranges answer quickly. Rarely needed: ranged queries sync missing days themselves.
 - **ask_ace**: For complex analytical questions that need Geotab's Ace AI — pattern analysis, predictions, deep insights. This tool is slower (up to 60s) but handles nuanced questions.
+- **get_server_diagnostics**: Only when asked why the tools are slow — per-tool latency and upstream call accounting for recent calls.
 
 Always prefer structured tools (get_safety_events, get_fleet_kpis, etc.) for straightforward queries. Use ask_ace for open-ended or analytical questions.
+
+Every data tool takes an optional `database` argument for servers that host several Geotab databases; leave it out to use the default fleet.
 """
 
 mcp = FastMCP("Geoff Fleet Data", instructions=INSTRUCTIONS)
 
-# Shared clients (created lazily per-event-loop)
-_geotab: GeotabClient | None = None
-_odata: ODataClient | None = None
-
-
-def _get_geotab() -> GeotabClient:
-    global _geotab
-    if _geotab is None:
-        _geotab = GeotabClient()
-    return _geotab
+# Authenticated clients per Geotab database (created lazily, evicted when idle),
+# with their caches carried across restarts
+_pool = TenantPool(warm_start=WarmStart(WARM_START_FILE) if WARM_START_FILE else None)
 
 
-def _get_odata() -> ODataClient:
-    global _odata
-    if _odata is None:
-        _odata = ODataClient()
-    return _odata
+def _json(obj) -> str:
+    with tracing.phase("serialize"):
+        text = json.dumps(obj, indent=2, default=str)
+    tracing.output(len(text))
+    return text
 
 
-def _json(obj) -> str:
-    return json.dumps(obj, indent=2, default=str)
+def _error(e: Exception) -> str:
+    tracing.error(str(e))
+    return _json({"error": str(e)})
 
 
 # ------------------------------------------------------------------
 # Tool 1: Safety Events
 # ------------------------------------------------------------------
 @mcp.tool()
+@tracing.traced
+@_pool.holding
 async def get_safety_events(
     days: int = 1,
     driver_name: str | None = None,
     event_type: str | None = None,
+    database: str | None = None,
+    group_episodes: bool = True,
+    enrich: str = "point",
 ) -> str:
     """Fetch enriched safety events (harsh braking, speeding, seatbelt, etc.) with GPS locations and speed data.
 
+    Repeated events of the same kind on the same vehicle a few minutes apart are returned once, with an
+    `episode` block (event count, start/end, total duration, member ids).
+
+    With enrich='profile' each event also gets a `profile` block from the GPS fixes around it: speed samples
+    (seconds from the event start, km/h), peak/average speed, peak km/h over the posted limit, seconds over it,
+    and peak deceleration/acceleration (m/s²). Use it for coaching conversations about specific events.
+
     Args:
         days: Number of days to look back (default 1, max 7)
         driver_name: Optional filter — only events for this driver (partial match)
         event_type: Optional filter — event category like 'speeding', 'hard_brake', 'seatbelt', 'harsh_cornering'
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
+        group_episodes: Set false to list every event individually
+        enrich: 'point' (closest GPS fix, default) or 'profile' (speed profile per event)
     """
     try:
         days = min(max(days, 1), 7)
-        client = _get_geotab()
-        events = await client.fetch_safety_events(days=days)
+        client = (await _pool.get(database)).geotab
+        events = await client.fetch_safety_events(days=days, group_episodes=group_episodes, enrich=enrich)
 
         if driver_name:
             needle = driver_name.lower()
@@ -88,80 +107,74 @@ async def get_safety_events(
 
         return _json({
             "count": len(events),
+            "eventCount": sum(e.get("episode", {}).get("events", 1) for e in events),
             "period": f"last {days} day(s)",
             "filters": {"driver_name": driver_name, "event_type": event_type},
             "events": events,
         })
     except Exception as e:
-        return _json({"error": str(e)})
+        return _error(e)
 
 
 # ------------------------------------------------------------------
 # Tool 2: Fleet KPIs
 # ------------------------------------------------------------------
 @mcp.tool()
-async def get_fleet_kpis() -> str:
-    """Get fleet-wide KPIs for the last 14 days: total distance, drive hours, idle percentage, safety score, trip counts, and daily trends."""
+@tracing.traced
+@_pool.holding
+async def get_fleet_kpis(
+    database: str | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+) -> str:
+    """Get fleet-wide KPIs: total distance, drive hours, idle percentage, safety score, trip counts, and daily trends. Last 14 days unless a date range is given.
+
+    Args:
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
+        start_date: Optional start of a custom range, YYYY-MM-DD (answered from local snapshots, up to 2 years)
+        end_date: Optional end of the range, YYYY-MM-DD (default today)
+    """
     try:
-        client = _get_odata()
-        analytics = await client.fetch_fleet_analytics()
+        tenant = await _pool.get(database)
+        if start_date or end_date:
+            start, end = parse_range(start_date, end_date)
+            analytics = await tenant.snapshots.fleet_analytics(tenant.odata, start, end)
+            return _json({"period": {"start": start.isoformat(), "end": end.isoformat()}, **analytics["summary"],
+                          **_pending_note(analytics["pendingDays"], start)})
+        analytics = await tenant.odata.fetch_fleet_analytics()
         return _json(analytics["summary"])
     except Exception as e:
-        return _json({"error": str(e)})
+        return _error(e)
 
 
 # ------------------------------------------------------------------
 # Tool 3: Driver Rankings
 # ------------------------------------------------------------------
 @mcp.tool()
+@tracing.traced
+@_pool.holding
 async def get_driver_rankings(
     sort_by: str = "total_events",
     limit: int = 20,
+    database: str | None = None,
 ) -> str:
     """Rank drivers by safety performance over the last 14 days.
 
     Args:
         sort_by: 'total_events' (most events first) or 'safety_score' (lowest score first)
         limit: Max number of drivers to return (default 20)
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
     """
     try:
-        client = _get_odata()
-        rows = await client.fetch_driver_safety()
-
-        # Aggregate per driver
-        driver_scores: dict[str, dict] = {}
-        for row in rows:
-            name = row.get("Driver_Name", "")
-            if not name:
-                continue
-            if name not in driver_scores:
-                driver_scores[name] = {
-                    "name": name,
-                    "totalEvents": 0,
-                    "harshBraking": 0,
-                    "harshCornering": 0,
-                    "speeding": 0,
-                    "latestScore": None,
-                    "latestDate": None,
-                }
-            ds = driver_scores[name]
-            brakes = row.get("HarshBraking_Count", 0)
-            corners = row.get("HarshCornering_Count", 0)
-            speeding = row.get("Speeding_Count", 0)
-            ds["totalEvents"] += brakes + corners + speeding
-            ds["harshBraking"] += brakes
-            ds["harshCornering"] += corners
-            ds["speeding"] += speeding
-            if not ds["latestDate"] or row.get("Local_Date", "") > ds["latestDate"]:
-                ds["latestScore"] = row.get("Safety_Score")
-                ds["latestDate"] = row.get("Local_Date")
-
-        rankings = list(driver_scores.values())
+        client = (await _pool.get(database)).odata
 
+        # Totals are grouped by the connector; latest scores are only looked up
+        # for the drivers that can make the cut
         if sort_by == "safety_score":
+            rankings = await client.fetch_driver_rankings()
             rankings.sort(key=lambda d: d.get("latestScore") or 999)
         else:
-            rankings.sort(key=lambda d: d["totalEvents"], reverse=True)
+            rankings = await client.fetch_driver_rankings(limit=limit)
 
         rankings = rankings[:limit]
 
@@ -171,183 +184,436 @@ async def get_driver_rankings(
             "drivers": rankings,
         })
     except Exception as e:
-        return _json({"error": str(e)})
+        return _error(e)
 
 
 # ------------------------------------------------------------------
 # Tool 4: Vehicle Details
 # ------------------------------------------------------------------
+MAX_BATCH_ENTITIES = 25
+
+
+def _find_device(devices: list[records.Device], vehicle_name: str) -> records.Device | None:
+    needle = vehicle_name.lower()
+    for d in devices:
+        if needle in d.name.lower():
+            return d
+    return None
+
+
+def _find_driver(users: list[records.User], driver_name: str) -> records.User | None:
+    needle = driver_name.lower()
+    for u in users:
+        if needle in u.name.lower():
+            return u
+    return None
+
+
+async def _lookup(geotab, kind: str, names: list[str], find) -> dict:
+    """Resolve names against the cached reference entities ("devices" or "users");
+    refetch once if any is missing, in case it was added since they were cached."""
+    entities = getattr(await geotab.reference(), kind)
+    matched = {name: find(entities, name) for name in names}
+    if not all(matched.values()):
+        entities = getattr(await geotab.reference(refresh=True), kind)
+        matched = {name: find(entities, name) for name in names}
+    return matched
+
+
+def _batch_names(names: list[str]) -> list[str]:
+    names = list(dict.fromkeys(n.strip() for n in names if n and n.strip()))
+    if not names:
+        raise ValueError("No names given")
+    if len(names) > MAX_BATCH_ENTITIES:
+        raise ValueError(f"At most {MAX_BATCH_ENTITIES} names per call")
+    return names
+
+
+def _vehicle_events_call(device_id: str) -> tuple:
+    from_date = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+    return ("Get", {
+        "typeName": "ExceptionEvent",
+        "search": {
+            "deviceSearch": {"id": device_id},
+            "fromDate": from_date,
+        },
+        "resultsLimit": 50,
+    })
+
+
+def _vehicle_summary(device: records.Device, events_raw: list | None, vehicle_kpis: dict) -> dict:
+    # Summarize events by rule
+    events = records.convert(records.Event, events_raw)
+    rule_counts: dict[str, int] = {}
+    for e in events:
+        name = BUILTIN_RULES.get(e.rule_id, e.rule_id)
+        rule_counts[name] = rule_counts.get(name, 0) + 1
+
+    return {
+        "vehicle": {
+            "id": device.id,
+            "name": device.name,
+            "serialNumber": device.serial_number,
+            "vehicleIdentificationNumber": device.vin,
+            "licensePlate": device.license_plate,
+            "comment": device.comment,
+        },
+        "recentEvents": {
+            "period": "last 7 days",
+            "totalCount": len(events),
+            "byType": dict(sorted(rule_counts.items(), key=lambda x: x[1], reverse=True)),
+        },
+        "kpis": vehicle_kpis,
+    }
+
+
 @mcp.tool()
-async def get_vehicle_details(vehicle_name: str) -> str:
+@tracing.traced
+@_pool.holding
+async def get_vehicle_details(vehicle_name: str, database: str | None = None) -> str:
     """Get details for a specific vehicle: device info, recent safety events, and 14-day KPIs.
 
     Args:
         vehicle_name: The vehicle/device name to look up (e.g. 'Truck 101')
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
     """
     try:
-        geotab = _get_geotab()
-        odata = _get_odata()
+        tenant = await _pool.get(database)
+        geotab, odata = tenant.geotab, tenant.odata
 
         # Fetch device info
-        devices = await geotab.api_call("Get", {"typeName": "Device"})
-        device = None
-        needle = vehicle_name.lower()
-        for d in (devices or []):
-            if needle in d.get("name", "").lower():
-                device = d
-                break
+        device = (await _lookup(geotab, "devices", [vehicle_name], _find_device))[vehicle_name]
 
         if not device:
             return _json({"error": f"Vehicle '{vehicle_name}' not found"})
 
         # Fetch recent events for this device + OData KPIs in parallel
-        from_date = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-
-        events_task = geotab.api_call("Get", {
-            "typeName": "ExceptionEvent",
-            "search": {
-                "deviceSearch": {"id": device["id"]},
-                "fromDate": from_date,
-            },
-            "resultsLimit": 50,
-        })
-        kpis_task = odata.fetch_vehicle_kpis(device["name"])
+        method, params = _vehicle_events_call(device.id)
+        events_task = geotab.api_call(method, params)
+        kpis_task = odata.fetch_vehicle_kpis(device.name)
 
         events_raw, vehicle_kpis = await asyncio.gather(events_task, kpis_task)
 
-        # Summarize events by rule
-        rule_counts: dict[str, int] = {}
-        for e in (events_raw or []):
-            rule_id = _get_id(e.get("rule")) or ""
-            name = BUILTIN_RULES.get(rule_id, rule_id)
-            rule_counts[name] = rule_counts.get(name, 0) + 1
+        return _json(_vehicle_summary(device, events_raw, vehicle_kpis))
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@tracing.traced
+@_pool.holding
+async def compare_vehicles(vehicle_names: list[str], database: str | None = None) -> str:
+    """Get details for several vehicles at once (same fields as get_vehicle_details) — use this instead of repeated get_vehicle_details calls when comparing vehicles.
+
+    Args:
+        vehicle_names: Vehicle/device names to look up (partial match, up to 25)
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
+    """
+    try:
+        names = _batch_names(vehicle_names)
+        tenant = await _pool.get(database)
+        geotab, odata = tenant.geotab, tenant.odata
+
+        # One Device Get (usually cached) resolves every name
+        matched = await _lookup(geotab, "devices", names, _find_device)
+        found = list({d.id: d for d in matched.values() if d}.values())
+
+        # One multi-call for all events + one OData query per table, in parallel
+        events_by_device, kpis_by_name = [], {}
+        if found:
+            events_by_device, kpis_by_name = await asyncio.gather(
+                geotab.multi_call([_vehicle_events_call(d.id) for d in found], "ExceptionEvent"),
+                odata.fetch_vehicles_kpis([d.name for d in found]),
+            )
 
         return _json({
-            "vehicle": {
-                "id": device["id"],
-                "name": device.get("name"),
-                "serialNumber": device.get("serialNumber"),
-                "vehicleIdentificationNumber": device.get("vehicleIdentificationNumber"),
-                "licensePlate": device.get("licensePlate"),
-                "comment": device.get("comment"),
-            },
-            "recentEvents": {
-                "period": "last 7 days",
-                "totalCount": len(events_raw or []),
-                "byType": dict(sorted(rule_counts.items(), key=lambda x: x[1], reverse=True)),
-            },
-            "kpis": vehicle_kpis,
+            "count": len(found),
+            "vehicles": [
+                _vehicle_summary(d, events, kpis_by_name.get(d.name, {"kpis": [], "safety": []}))
+                for d, events in zip(found, events_by_device)
+            ],
+            "notFound": [name for name, d in matched.items() if not d],
         })
     except Exception as e:
-        return _json({"error": str(e)})
+        return _error(e)
 
 
 # ------------------------------------------------------------------
 # Tool 5: Driver History
 # ------------------------------------------------------------------
+def _driver_events_call(driver_id: str, days: int, date_range: tuple | None) -> tuple:
+    search = {"userSearch": {"id": driver_id}}
+    if date_range:
+        start, end = date_range
+        search["fromDate"] = datetime.combine(start, datetime.min.time(), timezone.utc).isoformat()
+        search["toDate"] = datetime.combine(end + timedelta(days=1), datetime.min.time(), timezone.utc).isoformat()
+    else:
+        search["fromDate"] = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    return ("Get", {
+        "typeName": "ExceptionEvent",
+        "search": search,
+        "resultsLimit": 100,
+    })
+
+
+def _driver_summary(driver: records.User, period: str, events_raw: list | None, driver_kpis: list[dict]) -> dict:
+    # Summarize events by rule and by (UTC) day
+    events = records.convert(records.Event, events_raw)
+    rule_counts: dict[str, int] = {}
+    daily_counts: dict[str, int] = {}
+    for e in events:
+        name = BUILTIN_RULES.get(e.rule_id, e.rule_id)
+        rule_counts[name] = rule_counts.get(name, 0) + 1
+
+        date = datetime.fromtimestamp(e.start, timezone.utc).date().isoformat()
+        daily_counts[date] = daily_counts.get(date, 0) + 1
+
+    # Safety score trend from OData
+    score_trend = []
+    for row in sorted(driver_kpis, key=lambda r: r.get("Local_Date", "")):
+        score_trend.append({
+            "date": (row.get("Local_Date") or "")[:10],
+            "safetyScore": row.get("Safety_Score"),
+            "harshBraking": row.get("HarshBraking_Count", 0),
+            "harshCornering": row.get("HarshCornering_Count", 0),
+            "speeding": row.get("Speeding_Count", 0),
+        })
+
+    return {
+        "driver": {
+            "id": driver.id,
+            "name": driver.name,
+        },
+        "period": period,
+        "events": {
+            "totalCount": len(events),
+            "byType": dict(sorted(rule_counts.items(), key=lambda x: x[1], reverse=True)),
+            "byDay": dict(sorted(daily_counts.items())),
+        },
+        "safetyTrend": score_trend,
+    }
+
+
+def _period(days: int, date_range: tuple | None) -> str:
+    if date_range:
+        return f"{date_range[0].isoformat()} to {date_range[1].isoformat()}"
+    return f"last {days} day(s)"
+
+
 @mcp.tool()
-async def get_driver_history(driver_name: str, days: int = 7) -> str:
+@tracing.traced
+@_pool.holding
+async def get_driver_history(
+    driver_name: str,
+    days: int = 7,
+    database: str | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+) -> str:
     """Get a driver's safety event history and trend over time.
 
     Args:
         driver_name: The driver's name (partial match supported)
         days: Number of days to look back (default 7, max 30)
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
+        start_date: Optional start of a custom range, YYYY-MM-DD (answered from local snapshots, up to 2 years)
+        end_date: Optional end of the range, YYYY-MM-DD (default today)
     """
     try:
         days = min(max(days, 1), 30)
-        geotab = _get_geotab()
-        odata = _get_odata()
+        date_range = parse_range(start_date, end_date) if (start_date or end_date) else None
+        tenant = await _pool.get(database)
+        geotab, odata = tenant.geotab, tenant.odata
 
         # Find the driver (User with isDriver)
-        users = await geotab.api_call("Get", {"typeName": "User"})
-        driver = None
-        needle = driver_name.lower()
-        for u in (users or []):
-            full_name = f"{u.get('firstName', '')} {u.get('lastName', '')}".strip().lower()
-            if needle in full_name:
-                driver = u
-                break
+        driver = (await _lookup(geotab, "users", [driver_name], _find_driver))[driver_name]
 
         if not driver:
             return _json({"error": f"Driver '{driver_name}' not found"})
 
-        full_name = f"{driver.get('firstName', '')} {driver.get('lastName', '')}".strip()
+        full_name = driver.name
 
         # Fetch events for driver's devices + OData safety in parallel
-        from_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-
-        events_task = geotab.api_call("Get", {
-            "typeName": "ExceptionEvent",
-            "search": {
-                "userSearch": {"id": driver["id"]},
-                "fromDate": from_date,
-            },
-            "resultsLimit": 100,
-        })
-        odata_task = odata.fetch_driver_kpis(full_name)
+        if date_range:
+            odata_task = tenant.snapshots.load(odata, "DriverSafety_Daily", *date_range, name=full_name)
+        else:
+            odata_task = odata.fetch_driver_kpis(full_name)
+        method, params = _driver_events_call(driver.id, days, date_range)
+        events_task = geotab.api_call(method, params)
 
         events_raw, driver_kpis = await asyncio.gather(events_task, odata_task)
 
-        # Summarize events by rule and by day
-        rule_counts: dict[str, int] = {}
-        daily_counts: dict[str, int] = {}
-        for e in (events_raw or []):
-            rule_id = _get_id(e.get("rule")) or ""
-            name = BUILTIN_RULES.get(rule_id, rule_id)
-            rule_counts[name] = rule_counts.get(name, 0) + 1
-
-            date = (e.get("activeFrom") or "")[:10]
-            if date:
-                daily_counts[date] = daily_counts.get(date, 0) + 1
-
-        # Safety score trend from OData
-        score_trend = []
-        for row in sorted(driver_kpis, key=lambda r: r.get("Local_Date", "")):
-            score_trend.append({
-                "date": (row.get("Local_Date") or "")[:10],
-                "safetyScore": row.get("Safety_Score"),
-                "harshBraking": row.get("HarshBraking_Count", 0),
-                "harshCornering": row.get("HarshCornering_Count", 0),
-                "speeding": row.get("Speeding_Count", 0),
-            })
+        summary = _driver_summary(driver, _period(days, date_range), events_raw, driver_kpis)
+        if date_range:
+            summary.update(_pending_note(tenant.snapshots.missing_days("DriverSafety_Daily", *date_range),
+                                         date_range[0]))
+        return _json(summary)
+    except Exception as e:
+        return _error(e)
 
-        return _json({
-            "driver": {
-                "id": driver["id"],
-                "name": full_name,
-            },
-            "period": f"last {days} day(s)",
-            "events": {
-                "totalCount": len(events_raw or []),
-                "byType": dict(sorted(rule_counts.items(), key=lambda x: x[1], reverse=True)),
-                "byDay": dict(sorted(daily_counts.items())),
-            },
-            "safetyTrend": score_trend,
-        })
+
+@mcp.tool()
+@tracing.traced
+@_pool.holding
+async def compare_drivers(
+    driver_names: list[str],
+    days: int = 7,
+    database: str | None = None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+) -> str:
+    """Get safety history for several drivers at once (same fields as get_driver_history) — use this instead of repeated get_driver_history calls when comparing drivers.
+
+    Args:
+        driver_names: Driver names (partial match, up to 25)
+        days: Number of days to look back (default 7, max 30)
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
+        start_date: Optional start of a custom range, YYYY-MM-DD (answered from local snapshots, up to 2 years)
+        end_date: Optional end of the range, YYYY-MM-DD (default today)
+    """
+    try:
+        names = _batch_names(driver_names)
+        days = min(max(days, 1), 30)
+        date_range = parse_range(start_date, end_date) if (start_date or end_date) else None
+        tenant = await _pool.get(database)
+        geotab, odata = tenant.geotab, tenant.odata
+
+        # One User Get (usually cached) resolves every name
+        matched = await _lookup(geotab, "users", names, _find_driver)
+        found = list({u.id: u for u in matched.values() if u}.values())
+        full_names = [u.name for u in found]
+
+        # One multi-call for all events + one OData query (or one snapshot scan), in parallel
+        events_by_driver, kpis_by_name = [], {}
+        if found:
+            if date_range:
+                odata_task = _snapshot_rows_by_driver(tenant, date_range, full_names)
+            else:
+                odata_task = odata.fetch_drivers_kpis(full_names)
+            events_by_driver, kpis_by_name = await asyncio.gather(
+                geotab.multi_call([_driver_events_call(u.id, days, date_range) for u in found], "ExceptionEvent"),
+                odata_task,
+            )
+
+        period = _period(days, date_range)
+        result = {
+            "count": len(found),
+            "drivers": [
+                _driver_summary(u, period, events, kpis_by_name.get(name, []))
+                for u, name, events in zip(found, full_names, events_by_driver)
+            ],
+            "notFound": [name for name, u in matched.items() if not u],
+        }
+        if date_range and found:
+            result.update(_pending_note(tenant.snapshots.missing_days("DriverSafety_Daily", *date_range),
+                                        date_range[0]))
+        return _json(result)
     except Exception as e:
-        return _json({"error": str(e)})
+        return _error(e)
+
+
+def _pending_note(pending_days: int, start) -> dict:
+    """Flags a snapshot range answered only in part (see snapshots.ON_DEMAND_SYNC_DAYS)."""
+    if not pending_days:
+        return {}
+    days = (datetime.now(timezone.utc).date() - start).days + 1
+    return {"partial": {
+        "pendingDays": pending_days,
+        "hint": f"{pending_days} older day(s) of this range are not in local snapshots yet and were left out; "
+                f"run sync_snapshots(days={days}) to backfill them",
+    }}
+
+
+async def _snapshot_rows_by_driver(tenant, date_range: tuple, full_names: list[str]) -> dict[str, list[dict]]:
+    rows = await tenant.snapshots.load(tenant.odata, "DriverSafety_Daily", *date_range, name=full_names)
+    grouped: dict[str, list[dict]] = {}
+    for row in rows:
+        grouped.setdefault(row["Driver_Name"], []).append(row)
+    return grouped
 
 
 # ------------------------------------------------------------------
 # Tool 6: Ask Ace AI
 # ------------------------------------------------------------------
 @mcp.tool()
-async def ask_ace(question: str, vehicle_name: str | None = None) -> str:
+@tracing.traced
+@_pool.holding
+async def ask_ace(question: str, vehicle_name: str | None = None, database: str | None = None) -> str:
     """Query Geotab's Ace AI with a natural language question about fleet data. This is slower (up to 60s) but handles complex analytical questions.
 
     Args:
         question: The natural language question to ask Ace AI
         vehicle_name: Optional vehicle name to scope the question to
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
     """
     try:
-        client = _get_geotab()
+        client = (await _pool.get(database)).geotab
         result = await client.query_ace_ai(question, vehicle_name=vehicle_name)
         if result:
             return _json({"status": "success", "insight": result})
         else:
             return _json({"status": "no_result", "message": "Ace AI did not return a result. Try rephrasing your question or using other tools for structured data."})
     except Exception as e:
-        return _json({"error": str(e)})
+        return _error(e)
+
+
+# ------------------------------------------------------------------
+# Tool 7: Snapshot sync
+# ------------------------------------------------------------------
+@mcp.tool()
+@tracing.traced
+@_pool.holding
+async def sync_snapshots(days: int = 90, database: str | None = None) -> str:
+    """Copy the daily OData KPI and safety tables into local snapshots so long date ranges answer from disk. Only days not yet stored are fetched.
+
+    Args:
+        days: How many days back from today to make sure are stored (default 90, max 731)
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
+    """
+    try:
+        end = datetime.now(timezone.utc).date()
+        start, end = parse_range((end - timedelta(days=min(max(days, 1), 731) - 1)).isoformat(), end.isoformat())
+        tenant = await _pool.get(database)
+        report = await tenant.snapshots.sync(tenant.odata, start, end)
+        return _json({"period": {"start": start.isoformat(), "end": end.isoformat()}, "tables": report})
+    except Exception as e:
+        return _error(e)
+
+
+# ------------------------------------------------------------------
+# Tool 8: Driver risk
+# ------------------------------------------------------------------
+@mcp.tool()
+@tracing.traced
+@_pool.holding
+async def get_driver_risk(limit: int = 10, database: str | None = None) -> str:
+    """Top-risk drivers over the last 14 days: severity-weighted safety events per 100 km driven, event category mix, and trend (change in weighted events per day, per day; positive is getting worse).
+
+    Answered from rolling per-driver totals that are topped up with new data at most every few minutes.
+
+    Args:
+        limit: Max number of drivers to return (default 10)
+        database: Optional Geotab database to query (defaults to the server's GEOTAB_DATABASE)
+    """
+    try:
+        tenant = await _pool.get(database)
+        await tenant.risk.refresh(tenant.geotab, tenant.odata)
+        return _json(tenant.risk.top(limit))
+    except Exception as e:
+        return _error(e)
+
+
+# ------------------------------------------------------------------
+# Diagnostics
+# ------------------------------------------------------------------
+@mcp.tool()
+async def get_server_diagnostics(limit: int = 10) -> str:
+    """Show where recent tool calls spent their time: per-tool latency, phases, upstream calls, bytes, retries and cache hits.
+
+    Args:
+        limit: Number of most recent tool calls to include (default 10)
+    """
+    return _json({**tracing.snapshot(limit=max(limit, 0)), "openDatabases": _pool.databases()})
 
 
 # ------------------------------------------------------------------
@@ -374,17 +640,17 @@ async def _run_test():
     print("\nAll tests complete.")
 
     # Clean up
-    if _geotab:
-        await _geotab.close()
-    if _odata:
-        await _odata.close()
+    await _pool.close()
 
 
 def main():
     if "--test" in sys.argv:
         asyncio.run(_run_test())
     else:
-        mcp.run()
+        try:
+            mcp.run()
+        finally:
+            _pool.save_now()
 
 
 if __name__ == "__main__":
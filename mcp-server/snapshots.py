@@ -0,0 +1,231 @@
+"""Local Parquet snapshots of the OData daily tables, for date ranges beyond 14 days.
+
+The Data Connector tools only ever see `last_14_day` (and at most 5000 rows).
+A SnapshotStore copies VehicleKpi_Daily, VehicleSafety_Daily and
+DriverSafety_Daily into day partitions on local disk:
+
+    {MCP_SNAPSHOT_DIR}/{database}/{table}/date=2026-03-14/part.parquet
+
+A day is fetched once (`$search=from_<day>_to_<day>`) and kept; only the most
+recent RESYNC_DAYS are re-fetched (at most every RESYNC_INTERVAL_SECONDS)
+because the connector may still be settling them. Each day is paged in full,
+however many rows it has, since a settled day is never fetched again. Queries
+open the partitions as one pyarrow dataset and push the date range (partition
+pruning) and name equality (row-group statistics) down into the scan, so
+reading a quarter for one driver touches only their rows.
+
+Tool calls sync missing days on demand, but only the most recent
+ON_DEMAND_SYNC_DAYS per table; the rest of a longer range is reported as
+pending and left to sync_snapshots.
+
+pyarrow is optional: install with `pip install geoff-mcp-server[snapshots]`.
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import tracing
+from odata_client import _aggregate_analytics
+
+SNAPSHOT_DIR = os.getenv("MCP_SNAPSHOT_DIR", os.path.expanduser("~/.cache/geoff-mcp/snapshots"))
+RESYNC_DAYS = 2
+RESYNC_INTERVAL_SECONDS = 3600
+SYNC_CONCURRENCY = 4
+# Most days a tool call fetches per table before answering from what is on disk
+ON_DEMAND_SYNC_DAYS = int(os.getenv("MCP_SNAPSHOT_ON_DEMAND_DAYS", "92"))
+MAX_RANGE_DAYS = 731
+
+# Columns kept per table, with their Arrow types ("name" is the per-row entity column)
+TABLES = {
+    "VehicleKpi_Daily": {
+        "name": "Device_Name",
+        "columns": {
+            "Device_Name": "string", "Device_SerialNo": "string", "Local_Date": "string",
+            "Trip_Distance_Km": "float64", "Total_Driving_Duration_Seconds": "float64",
+            "Total_Idling_Duration_Seconds": "float64", "Trip_Count": "int64", "Stop_Count": "int64",
+        },
+    },
+    "VehicleSafety_Daily": {
+        "name": "Device_Name",
+        "columns": {
+            "Device_Name": "string", "Local_Date": "string", "Safety_Score": "float64",
+            "HarshBraking_Count": "int64", "HarshCornering_Count": "int64", "Speeding_Count": "int64",
+            "Speeding_Duration_Seconds": "float64", "SeatbeltOff_Count": "int64",
+        },
+    },
+    "DriverSafety_Daily": {
+        "name": "Driver_Name",
+        "columns": {
+            "Driver_Name": "string", "Local_Date": "string", "Safety_Score": "float64",
+            "HarshBraking_Count": "int64", "HarshCornering_Count": "int64", "Speeding_Count": "int64",
+        },
+    },
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(
+            "Historical date ranges need pyarrow: pip install 'geoff-mcp-server[snapshots]'"
+        ) from e
+
+
+def parse_range(start_date: str | None, end_date: str | None) -> tuple[date, date]:
+    """Validate an inclusive YYYY-MM-DD range; a missing end means today (UTC)."""
+    today = datetime.now(timezone.utc).date()
+    end = date.fromisoformat(end_date) if end_date else today
+    start = date.fromisoformat(start_date) if start_date else end - timedelta(days=13)
+    if start > end:
+        raise ValueError(f"start_date {start} is after end_date {end}")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"Date range is limited to {MAX_RANGE_DAYS} days")
+    return start, min(end, today)
+
+
+def _days(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+class SnapshotStore:
+    """Day-partitioned Parquet copies of the OData tables for one database."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._refreshed: dict[tuple[str, date], float] = {}  # unsettled days -> last fetch (monotonic)
+
+    def _partition(self, table: str, day: date) -> str:
+        return os.path.join(self.root, table, f"date={day.isoformat()}")
+
+    def synced_days(self, table: str) -> set[date]:
+        path = os.path.join(self.root, table)
+        if not os.path.isdir(path):
+            return set()
+        return {date.fromisoformat(d[5:]) for d in os.listdir(path) if d.startswith("date=")}
+
+    # -- sync -----------------------------------------------------------
+
+    def missing_days(self, table: str, start: date, end: date) -> int:
+        """Days of [start, end] with no partition on disk."""
+        have = self.synced_days(table)
+        return sum(d not in have for d in _days(start, end))
+
+    async def sync(self, odata, start: date, end: date, tables=tuple(TABLES), max_days: int | None = None) -> dict:
+        """Fetch every day in [start, end] not already on disk, for all tables at once.
+
+        With max_days, only that many days per table are fetched, most recent
+        first. Returns days fetched, rows written and days still pending per table.
+        """
+        _require_pyarrow()
+        today = datetime.now(timezone.utc).date()
+        settled = today - timedelta(days=RESYNC_DAYS)
+        stale = time.monotonic() - RESYNC_INTERVAL_SECONDS
+        slots = asyncio.Semaphore(SYNC_CONCURRENCY)
+        report = {}
+
+        async def fetch_day(table: str, day: date) -> int:
+            async with slots:
+                rows = await odata.query(
+                    table,
+                    select=",".join(TABLES[table]["columns"]),
+                    search=f"from_{day.isoformat()}_to_{day.isoformat()}",
+                    max_rows=None,  # a truncated day would be kept as if complete
+                )
+            await asyncio.to_thread(self._write_day, table, day, rows)
+            if day > settled:
+                self._refreshed[(table, day)] = time.monotonic()
+            return len(rows)
+
+        plan = {}
+        for table in tables:
+            have = self.synced_days(table)
+            missing = [
+                d for d in reversed(_days(start, end))
+                if d not in have or (d > settled and self._refreshed.get((table, d), 0.0) < stale)
+            ]
+            tracing.cache(f"snapshot.{table}", hit=not missing)
+            plan[table] = missing[:max_days] if max_days is not None else missing
+            report[table] = {"daysFetched": len(plan[table]), "daysPending": len(missing) - len(plan[table])}
+
+        # One pool of SYNC_CONCURRENCY requests across every table
+        counts = await asyncio.gather(*(
+            asyncio.gather(*(fetch_day(table, d) for d in days)) for table, days in plan.items()
+        ))
+        for (table, _), table_counts in zip(plan.items(), counts):
+            report[table]["rowsWritten"] = sum(table_counts)
+        return report
+
+    def _write_day(self, table: str, day: date, rows: list[dict]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = TABLES[table]["columns"]
+        schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in columns.items()])
+        arrow_table = pa.Table.from_pylist([{k: r.get(k) for k in columns} for r in rows], schema=schema)
+        arrow_table = arrow_table.sort_by(TABLES[table]["name"])  # tight row-group stats for name filters
+
+        # Write beside the partition and swap in, so readers never see a half-written day
+        partition = self._partition(table, day)
+        os.makedirs(os.path.dirname(partition), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=os.path.dirname(partition), prefix=".staging-")
+        try:
+            pq.write_table(arrow_table, os.path.join(staging, "part.parquet"))
+            if os.path.isdir(partition):
+                shutil.rmtree(partition)
+            try:
+                os.replace(staging, partition)
+            except OSError:
+                if not os.path.isdir(partition):
+                    raise  # otherwise a concurrent sync of the same day got there first
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    # -- query ----------------------------------------------------------
+
+    def query(self, table: str, start: date, end: date, name: str | list[str] | None = None,
+              columns: list[str] | None = None) -> list[dict]:
+        """Rows for [start, end], optionally only some devices/drivers, as dicts."""
+        _require_pyarrow()
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        path = os.path.join(self.root, table)
+        if not os.path.isdir(path):
+            return []
+        dataset = ds.dataset(
+            path, format="parquet",
+            partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"),
+        )
+        predicate = (ds.field("date") >= start.isoformat()) & (ds.field("date") <= end.isoformat())
+        if isinstance(name, list):
+            predicate &= ds.field(TABLES[table]["name"]).isin(name)
+        elif name is not None:
+            predicate &= ds.field(TABLES[table]["name"]) == name
+        with tracing.phase("snapshot_scan"):
+            return dataset.to_table(columns=columns or list(TABLES[table]["columns"]), filter=predicate).to_pylist()
+
+    async def load(self, odata, table: str, start: date, end: date,
+                   name: str | list[str] | None = None) -> list[dict]:
+        """Sync missing days of the range (up to ON_DEMAND_SYNC_DAYS), then read it from disk."""
+        await self.sync(odata, start, end, tables=(table,), max_days=ON_DEMAND_SYNC_DAYS)
+        return await asyncio.to_thread(self.query, table, start, end, name)
+
+    async def fleet_analytics(self, odata, start: date, end: date) -> dict:
+        """Same shape as ODataClient.fetch_fleet_analytics, for any date range, plus
+        pendingDays: how many days of the range were left for sync_snapshots."""
+        report = await self.sync(odata, start, end, max_days=ON_DEMAND_SYNC_DAYS)
+        vehicle_kpis, vehicle_safety, driver_safety = await asyncio.gather(*(
+            asyncio.to_thread(self.query, table, start, end)
+            for table in ("VehicleKpi_Daily", "VehicleSafety_Daily", "DriverSafety_Daily")
+        ))
+        results = {"vehicleKpis": vehicle_kpis, "vehicleSafety": vehicle_safety, "driverSafety": driver_safety}
+        return {
+            "raw": results,
+            "summary": _aggregate_analytics(results),
+            "pendingDays": max(r["daysPending"] for r in report.values()),
+        }
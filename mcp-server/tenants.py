@@ -0,0 +1,227 @@
+"""Per-database client pool: one MCP server process, many fleets.
+
+Every tool takes an optional `database`. The pool keeps one authenticated
+GeotabClient + ODataClient pair per database, so each tenant has its own
+session, connection limit, caches, snapshot directory and risk accumulators, and nothing leaks
+between fleets.
+Tenants idle for MCP_TENANT_IDLE_SECONDS are closed, and at most
+MCP_MAX_TENANTS stay open (least recently used goes first). Tools wrapped in
+TenantPool.holding keep every tenant they get in use until they return, and a
+tenant in use is never closed.
+
+With a warm_start (warmstart.WarmStart), a tenant opened for the first time
+picks up the caches a previous process saved, and open tenants are saved
+back periodically and on close.
+
+Credentials: the default tenant comes from GEOTAB_DATABASE / GEOTAB_USERNAME /
+GEOTAB_PASSWORD / GEOTAB_SERVER as before. Others come from the JSON file
+named by GEOTAB_TENANTS_FILE:
+
+    {"acme_fleet": {"username": "...", "password": "...", "server": "my.geotab.com",
+                    "odataServer": "odata-connector-1"}}
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import tracing
+from geotab_client import GeotabClient
+from odata_client import ODATA_SERVER, ODataClient
+from risk import RiskEngine
+from snapshots import SNAPSHOT_DIR, SnapshotStore
+from warmstart import WarmStart
+
+MAX_TENANTS = int(os.getenv("MCP_MAX_TENANTS", "16"))
+TENANT_IDLE_SECONDS = float(os.getenv("MCP_TENANT_IDLE_SECONDS", "900"))
+TENANT_MAX_CONNECTIONS = int(os.getenv("MCP_TENANT_MAX_CONNECTIONS", "8"))
+TENANTS_FILE = os.getenv("GEOTAB_TENANTS_FILE", "")
+
+# Tenants the current tool call got from the pool (see TenantPool.holding)
+_held: contextvars.ContextVar[list | None] = contextvars.ContextVar("mcp_held_tenants", default=None)
+
+
+class Credentials(NamedTuple):
+    database: str
+    username: str
+    password: str
+    server: str = "my.geotab.com"
+    odata_server: str = ODATA_SERVER
+
+
+def default_database() -> str:
+    return os.getenv("GEOTAB_DATABASE", "")
+
+
+def load_credentials(database: str | None = None) -> Credentials:
+    """Credentials for a database; ValueError if it is not configured."""
+    default = default_database()
+    if not database or database == default:
+        return Credentials(
+            database=default,
+            username=os.getenv("GEOTAB_USERNAME", ""),
+            password=os.getenv("GEOTAB_PASSWORD", ""),
+            server=os.getenv("GEOTAB_SERVER", "my.geotab.com"),
+        )
+    if TENANTS_FILE:
+        with open(TENANTS_FILE) as f:
+            entry = json.load(f).get(database)
+        if entry:
+            return Credentials(
+                database=database,
+                username=entry["username"],
+                password=entry["password"],
+                server=entry.get("server", "my.geotab.com"),
+                odata_server=entry.get("odataServer", ODATA_SERVER),
+            )
+    raise ValueError(f"Unknown database '{database}'")
+
+
+class Tenant:
+    __slots__ = ("database", "geotab", "odata", "snapshots", "risk", "last_used", "pinned", "in_use")
+
+    def __init__(self, database: str, geotab: GeotabClient, odata: ODataClient, pinned: bool = False):
+        self.database = database
+        self.geotab = geotab
+        self.odata = odata
+        self.snapshots = SnapshotStore(os.path.join(SNAPSHOT_DIR, re.sub(r"[^\w.-]", "_", database) or "default"))
+        self.risk = RiskEngine()
+        self.last_used = time.monotonic()
+        self.pinned = pinned  # registered clients are never evicted
+        self.in_use = 0  # running tool calls holding this tenant
+
+    def export_state(self) -> dict:
+        return {
+            "geotab": self.geotab.export_state(),
+            "odata": self.odata.export_state(),
+            "risk": self.risk.export_state(),
+        }
+
+    def restore_state(self, state: dict):
+        self.geotab.restore_state(state.get("geotab", {}))
+        self.odata.restore_state(state.get("odata", {}))
+        if "risk" in state:
+            self.risk.restore_state(state["risk"])
+
+    async def close(self):
+        await self.geotab.close()
+        await self.odata.close()
+
+
+class TenantPool:
+    def __init__(self, max_tenants: int = MAX_TENANTS, idle_seconds: float = TENANT_IDLE_SECONDS,
+                 max_connections: int = TENANT_MAX_CONNECTIONS, warm_start: WarmStart | None = None):
+        self.max_tenants = max_tenants
+        self.idle_seconds = idle_seconds
+        self.max_connections = max_connections
+        self.warm_start = warm_start
+        self._tenants: OrderedDict[str, Tenant] = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._saving: asyncio.Task | None = None
+
+    def holding(self, fn):
+        """Wrap an async tool so the tenants it gets stay in use (unevictable) until it returns."""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            held = []
+            token = _held.set(held)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _held.reset(token)
+                now = time.monotonic()
+                for tenant in held:
+                    tenant.in_use -= 1
+                    tenant.last_used = now
+        return wrapper
+
+    def register(self, database: str, geotab: GeotabClient, odata: ODataClient) -> Tenant:
+        """Serve `database` from pre-built clients (tests, replay fixtures)."""
+        tenant = self._tenants[database] = Tenant(database, geotab, odata, pinned=True)
+        return tenant
+
+    async def get(self, database: str | None = None) -> Tenant:
+        database = database or default_database()
+        async with self._lock:
+            await self._evict_idle()
+            tenant = self._tenants.get(database)
+            tracing.cache("tenant", hit=tenant is not None)
+            if tenant is None:
+                creds = load_credentials(database)
+                tenant = Tenant(
+                    database,
+                    GeotabClient(credentials=creds, max_connections=self.max_connections),
+                    ODataClient(credentials=creds, max_connections=self.max_connections),
+                )
+                state = self.warm_start.restore(database) if self.warm_start else None
+                tracing.cache("warm_start", hit=state is not None)
+                if state:
+                    tenant.restore_state(state)
+                self._tenants[database] = tenant
+                await self._evict_overflow(keep=database)
+            self._tenants.move_to_end(database)
+            tenant.last_used = time.monotonic()
+            held = _held.get()
+            if held is not None:
+                tenant.in_use += 1
+                held.append(tenant)
+            if self.warm_start and self.warm_start.due() and not (self._saving and not self._saving.done()):
+                self._saving = asyncio.create_task(self._save())
+            return tenant
+
+    def _states(self) -> dict[str, dict]:
+        # Registered clients (benchmarks, replay fixtures) are not real sessions: never persist them
+        return {database: t.export_state() for database, t in self._tenants.items() if not t.pinned}
+
+    async def _save(self):
+        try:
+            blob = self.warm_start.dump(self._states())
+            await asyncio.to_thread(self.warm_start.write, blob)
+        except Exception as e:
+            print(f"[warm-start] save failed: {e}", file=sys.stderr)
+
+    def save_now(self):
+        """Write the warm-start snapshot synchronously (at shutdown)."""
+        if self.warm_start:
+            self.warm_start.write(self.warm_start.dump(self._states()))
+
+    async def _retire(self, database: str, tenant: Tenant):
+        del self._tenants[database]
+        if self.warm_start and not tenant.pinned:
+            self.warm_start.stash(database, tenant.export_state())
+        await tenant.close()
+
+    async def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for database, tenant in list(self._tenants.items()):
+            if not tenant.pinned and not tenant.in_use and tenant.last_used < cutoff:
+                await self._retire(database, tenant)
+
+    async def _evict_overflow(self, keep: str):
+        # Tenants in use (and the one being handed out) stay even past max_tenants
+        for database, tenant in list(self._tenants.items()):
+            if len(self._tenants) <= self.max_tenants:
+                break
+            if not tenant.pinned and not tenant.in_use and database != keep:
+                await self._retire(database, tenant)
+
+    def databases(self) -> list[str]:
+        return list(self._tenants)
+
+    async def close(self):
+        async with self._lock:
+            if self._saving:
+                await self._saving
+            if self.warm_start:
+                await self._save()
+            tenants = list(self._tenants.values())
+            self._tenants.clear()
+        for tenant in tenants:
+            await tenant.close()
@@ -0,0 +1,34 @@
+"""Shared fixtures: a small synthetic fleet and an ODataClient against a local stub.
+
+The tests are plain functions that drive asyncio themselves (asyncio.run), so
+they need nothing beyond pytest.
+"""
+
+from contextlib import asynccontextmanager
+
+import pytest
+
+import odata_client
+import replay
+
+
+@pytest.fixture(scope="session")
+def fleet():
+    return replay.SyntheticFleet(devices=12, drivers=15, events_per_day=40, seed=3)
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """serve(stub) -> async context yielding an ODataClient pointed at the running stub."""
+
+    @asynccontextmanager
+    async def run(stub: replay.ODataStub):
+        async with replay.serve_odata(stub) as base_url:
+            monkeypatch.setattr(odata_client, "ODATA_BASE_URL", base_url)
+            client = odata_client.ODataClient()
+            try:
+                yield client
+            finally:
+                await client.close()
+
+    return run
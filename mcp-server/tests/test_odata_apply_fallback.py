@@ -0,0 +1,45 @@
+"""Connectors without the $apply extension: aggregate() groups locally instead."""
+
+import asyncio
+
+import replay
+
+
+def _fetch(serve, stub):
+    async def scenario():
+        async with serve(stub) as client:
+            analytics = await client.fetch_fleet_analytics()
+            rankings = await client.fetch_driver_rankings(limit=5)
+            return analytics, rankings, set(client._no_apply)
+
+    return asyncio.run(scenario())
+
+
+def test_local_grouping_matches_apply(fleet, serve):
+    tables = fleet.odata_tables()
+    with_apply, with_apply_top, no_apply = _fetch(serve, replay.ODataStub(tables))
+    assert not no_apply
+    assert with_apply["raw"]["dailyKpis"] and with_apply["raw"]["driverRankings"]
+
+    fallback, fallback_top, no_apply = _fetch(serve, replay.ODataStub(tables, supports_apply=False))
+    assert no_apply == {"VehicleKpi_Daily", "VehicleSafety_Daily", "DriverSafety_Daily"}
+
+    assert fallback["summary"] == with_apply["summary"]
+    assert fallback["raw"] == with_apply["raw"]
+    assert fallback_top == with_apply_top
+
+
+def test_rejected_apply_is_not_retried(fleet, serve):
+    stub = replay.ODataStub(fleet.odata_tables(), supports_apply=False)
+
+    async def scenario():
+        async with serve(stub) as client:
+            await client.fetch_driver_rankings()
+            first = stub.requests
+            client._cache.clear()
+            await client.fetch_driver_rankings()
+            return first, stub.requests - first
+
+    first, second = asyncio.run(scenario())
+    # The first call pays for the 501 once; afterwards the table goes straight to local grouping
+    assert second == first - 1
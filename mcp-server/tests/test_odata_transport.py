@@ -0,0 +1,110 @@
+"""ODataClient transport: retries and Retry-After, 304 revalidation, and bytes on the wire."""
+
+import asyncio
+import json
+import time
+
+import aiohttp
+import pytest
+
+import odata_client
+import replay
+import tracing
+
+TABLE = "VehicleKpi_Daily"
+
+
+def _run(serve, stub, *queries):
+    """Run the queries in one traced call; returns their rows and the span's dict."""
+
+    @tracing.traced
+    async def scenario():
+        async with serve(stub) as client:
+            rows = []
+            for query in queries:
+                rows.append(await query(client))
+            return rows, tracing.current()
+
+    rows, span = asyncio.run(scenario())
+    return rows, span.to_dict()
+
+
+def _all(client):
+    return client.query(TABLE, search="last_14_day")
+
+
+def test_retries_honour_retry_after(fleet, serve, monkeypatch):
+    # Backing off by ODATA_RETRY_BACKOFF_SECONDS would take minutes; Retry-After: 0 says go now
+    monkeypatch.setattr(odata_client, "ODATA_RETRY_BACKOFF_SECONDS", 60.0)
+    stub = replay.ODataStub(fleet.odata_tables(), failures=odata_client.ODATA_RETRIES)
+    t0 = time.perf_counter()
+    (rows,), span = _run(serve, stub, _all)
+    assert time.perf_counter() - t0 < 5
+    assert rows
+    assert stub.requests == odata_client.ODATA_RETRIES + 1
+    up = span["upstream"][f"odata.{TABLE}"]
+    assert up["calls"] == 1 and up["retries"] == odata_client.ODATA_RETRIES and up["errors"] == 0
+
+
+def test_retries_back_off_without_retry_after(fleet, serve, monkeypatch):
+    monkeypatch.setattr(odata_client, "ODATA_RETRY_BACKOFF_SECONDS", 0.2)
+    stub = replay.ODataStub(fleet.odata_tables(), failures=1, retry_after=None)
+    t0 = time.perf_counter()
+    _, span = _run(serve, stub, _all)
+    assert time.perf_counter() - t0 >= 0.1  # 0.2 s scaled by jitter in [0.5, 1)
+    assert span["upstream"][f"odata.{TABLE}"]["retries"] == 1
+
+
+def test_retries_give_up_with_the_last_answer(fleet, serve):
+    stub = replay.ODataStub(fleet.odata_tables(), failures=odata_client.ODATA_RETRIES + 1)
+    with pytest.raises(odata_client.ODataError) as info:
+        _run(serve, stub, _all)
+    assert info.value.status == 503
+    assert stub.requests == odata_client.ODATA_RETRIES + 1
+
+
+def test_expired_result_is_revalidated(fleet, serve, monkeypatch):
+    monkeypatch.setattr(odata_client, "ODATA_CACHE_SECONDS", 0.0)
+    stub = replay.ODataStub(fleet.odata_tables())
+    (first, second), span = _run(serve, stub, _all, _all)
+    assert second == first
+    assert stub.requests == 2 and stub.not_modified == 1
+    assert span["cache"]["odata"] == {"hit": 0, "miss": 2}
+    assert span["cache"]["odata.revalidate"] == {"hit": 1, "miss": 0}
+
+
+def test_changed_result_is_refetched(fleet, serve, monkeypatch):
+    monkeypatch.setattr(odata_client, "ODATA_CACHE_SECONDS", 0.0)
+    tables = fleet.odata_tables()
+    stub = replay.ODataStub({TABLE: list(tables[TABLE])})
+
+    async def drop_a_row(client):
+        stub.tables[TABLE].pop()
+        return await _all(client)
+
+    (first, second), span = _run(serve, stub, _all, drop_a_row)
+    assert len(second) == len(first) - 1
+    assert stub.not_modified == 0
+    assert span["cache"]["odata.revalidate"] == {"hit": 0, "miss": 1}
+
+
+def test_upstream_bytes_count_the_compressed_body(fleet, serve):
+    stub = replay.ODataStub(fleet.odata_tables())
+
+    async def wire_sizes(client):
+        url = f"{odata_client.ODATA_BASE_URL}/{TABLE}"
+        params = {"$search": "last_14_day"}
+        async with aiohttp.ClientSession(auto_decompress=False) as session:
+            sizes = {}
+            for encoding in ("gzip", "identity"):
+                async with session.get(url, params=params, headers={"Accept-Encoding": encoding}) as resp:
+                    assert resp.headers.get("Content-Encoding", "identity") == encoding
+                    body = await resp.read()
+                    sizes[encoding] = len(body)
+        sizes["rows"] = json.loads(body)["value"]
+        return sizes
+
+    (rows, sizes), span = _run(serve, stub, _all, wire_sizes)
+    assert rows == sizes["rows"]
+    up = span["upstream"][f"odata.{TABLE}"]
+    assert up["bytes"] == sizes["gzip"] < sizes["identity"]
@@ -0,0 +1,44 @@
+"""Profile-mode LogRecord windows: merged per device, but never past the record cap."""
+
+from datetime import datetime, timedelta, timezone
+
+import kinematics
+import records
+from geotab_client import _closest, _profile_windows
+
+T0 = datetime(2026, 10, 1, 8, tzinfo=timezone.utc)
+
+
+def _event(i, device, start_s, length_s=30):
+    start = T0 + timedelta(seconds=start_s)
+    return records.Event({"id": f"a{i}", "device": {"id": device}, "rule": {"id": "RuleHarshBrakingId"},
+                          "activeFrom": start, "activeTo": start + timedelta(seconds=length_s)})
+
+
+def test_overlapping_events_share_a_window():
+    events = [_event(0, "b1", 0), _event(1, "b1", 90), _event(2, "b2", 0)]
+    windows, window_of = _profile_windows(events)
+    assert len(windows) == 2
+    assert window_of[0] == window_of[1] != window_of[2]
+
+
+def test_chained_events_split_at_the_window_cap():
+    # An event every 100 s for three hours: every padded span overlaps the next
+    events = [_event(i, "b1", i * 100) for i in range(108)]
+    windows, window_of = _profile_windows(events)
+    pad = kinematics.PROFILE_PADDING_SECONDS
+    assert len(windows) > 1
+    for _, t0, t1 in windows:
+        assert t1 - t0 <= kinematics.PROFILE_MAX_WINDOW_SECONDS
+    for event, w in zip(events, window_of):
+        _, t0, t1 = windows[w]
+        assert t0 <= event.start - pad and event.end + pad <= t1
+    assert windows[0][1] == events[0].start - pad and windows[-1][2] == events[-1].end + pad
+
+
+def test_closest_fix_stays_in_span():
+    fixes = [records.LogPoint({"dateTime": T0 + timedelta(seconds=s), "speed": s}) for s in (0, 500)]
+    event = _event(0, "b1", 420)
+    pad = kinematics.PROFILE_PADDING_SECONDS
+    assert _closest(fixes, event.start, event.start - pad, event.end + pad).speed == 500
+    assert _closest(fixes, event.start, event.start - pad, event.start) is None
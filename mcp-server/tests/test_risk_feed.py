@@ -0,0 +1,79 @@
+"""RiskEngine.refresh reads ExceptionEvents through GetFeed and resumes from the stored version."""
+
+import asyncio
+import copy
+from datetime import datetime, timedelta, timezone
+
+import replay
+import risk
+from geotab_client import GeotabClient
+
+
+def _attributed(events):
+    return [e for e in events if isinstance(e.get("driver"), dict) and e.get("device")]
+
+
+def _refresh(engine, fleet, serve):
+    async def scenario():
+        async with serve(replay.ODataStub(fleet.odata_tables())) as odata:
+            engine._refreshed = 0
+            engine.refreshed_at = None
+            await engine.refresh(GeotabClient(api=replay.FakeGeotabAPI(fleet)), odata)
+
+    asyncio.run(scenario())
+
+
+def test_late_upload_is_counted(fleet, serve):
+    fleet = copy.copy(fleet)
+    fleet.events = list(fleet.events)
+    engine = risk.RiskEngine()
+    _refresh(engine, fleet, serve)
+    before = sum(w.events for w in engine.drivers.values())
+    assert engine.feed_version
+
+    # Uploaded now, but recorded three days ago: far behind any activeFrom already seen
+    late = copy.deepcopy(_attributed(fleet.events)[-1])
+    late["id"] = "aLATE"
+    late["activeFrom"] = datetime.now(timezone.utc) - timedelta(days=3)
+    late["activeTo"] = late["activeFrom"] + timedelta(minutes=1)
+    fleet.events.append(late)
+    _refresh(engine, fleet, serve)
+    assert sum(w.events for w in engine.drivers.values()) == before + 1
+    assert engine.drivers[late["driver"]["id"]].events
+
+    # Nothing new: the feed resumes past everything and re-reading adds nothing
+    _refresh(engine, fleet, serve)
+    assert sum(w.events for w in engine.drivers.values()) == before + 1
+
+
+def test_feed_pages_until_a_short_page(fleet, serve, monkeypatch):
+    monkeypatch.setattr(risk, "FEED_RESULTS_LIMIT", 50)
+    monkeypatch.setattr(risk, "FEED_MAX_PAGES", 100)
+    paged = risk.RiskEngine()
+    _refresh(paged, fleet, serve)
+
+    monkeypatch.setattr(risk, "FEED_RESULTS_LIMIT", 50000)
+    whole = risk.RiskEngine()
+    _refresh(whole, fleet, serve)
+
+    assert paged.feed_version == whole.feed_version
+    assert {d: w.events for d, w in paged.drivers.items()} == {d: w.events for d, w in whole.drivers.items()}
+
+
+def test_backlog_beyond_max_pages_carries_over(fleet, serve, monkeypatch):
+    monkeypatch.setattr(risk, "FEED_RESULTS_LIMIT", 50)
+    monkeypatch.setattr(risk, "FEED_MAX_PAGES", 2)
+    engine = risk.RiskEngine()
+    refreshes = 0
+    while True:
+        version = engine.feed_version
+        _refresh(engine, fleet, serve)
+        refreshes += 1
+        if engine.feed_version == version:
+            break
+
+    whole = risk.RiskEngine()
+    monkeypatch.setattr(risk, "FEED_RESULTS_LIMIT", 50000)
+    _refresh(whole, fleet, serve)
+    assert refreshes > 2
+    assert {d: w.events for d, w in engine.drivers.items()} == {d: w.events for d, w in whole.drivers.items()}
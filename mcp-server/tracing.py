@@ -0,0 +1,212 @@
+"""Per-tool-call tracing: where a slow tool call actually spent its time.
+
+Each MCP tool call opens a span (the @traced decorator in server.py). While it
+runs, the Geotab and OData clients report into the current span through a
+contextvar:
+
+- phase(name)      wall time of a step (auth, gps, road_speed, serialize, ...)
+- upstream(...)    one upstream request: round trips, batched sub-calls, seconds,
+                   rows, bytes, errors
+- retry(op)        a retried upstream request
+- cache(name, hit) a cache lookup
+
+Finished spans are kept in a small ring buffer with per-tool aggregates (see
+the get_server_diagnostics tool) and, if MCP_TRACE_LOG is set, written as one
+JSON line each to stderr or to that file path. Never stdout: that is the MCP
+stdio transport.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+TRACE_HISTORY = int(os.getenv("MCP_TRACE_HISTORY", "50"))
+TRACE_LOG = os.getenv("MCP_TRACE_LOG", "")  # "", "stderr", or a file path
+
+
+class Upstream:
+    """Accounting for one upstream operation within a span (e.g. geotab.Get:LogRecord)."""
+
+    __slots__ = ("calls", "batched", "seconds", "rows", "bytes", "errors", "retries")
+
+    def __init__(self):
+        self.calls = 0  # HTTP round trips
+        self.batched = 0  # sub-calls carried by multi_call round trips
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.errors = 0
+        self.retries = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "batched": self.batched,
+            "seconds": round(self.seconds, 4),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "retries": self.retries,
+        }
+
+
+class Span:
+    def __init__(self, tool: str):
+        self.tool = tool
+        self.started = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self.seconds: float | None = None
+        self.error: str | None = None
+        self.phases: dict[str, float] = {}
+        self.upstream: dict[str, Upstream] = {}
+        self.cache: dict[str, dict[str, int]] = {}
+        self.output_bytes = 0
+
+    def op(self, name: str) -> Upstream:
+        up = self.upstream.get(name)
+        if up is None:
+            up = self.upstream[name] = Upstream()
+        return up
+
+    def to_dict(self) -> dict:
+        return {
+            "tool": self.tool,
+            "started": self.started.isoformat(),
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "error": self.error,
+            "phases": {k: round(v, 4) for k, v in self.phases.items()},
+            "upstream": {k: v.to_dict() for k, v in self.upstream.items()},
+            "cache": self.cache,
+            "outputBytes": self.output_bytes,
+        }
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("mcp_span", default=None)
+_recent: deque = deque(maxlen=TRACE_HISTORY)
+_totals: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def current() -> Span | None:
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str):
+    """Time a step of the current tool call; a no-op outside one."""
+    span = _current.get()
+    if span is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        span.phases[name] = span.phases.get(name, 0.0) + time.perf_counter() - t0
+
+
+@contextmanager
+def upstream(op: str, batched: int = 0):
+    """Account one upstream request. Set `.rows` / `.bytes` on the yielded record."""
+    span = _current.get()
+    up = span.op(op) if span is not None else Upstream()
+    t0 = time.perf_counter()
+    up.calls += 1
+    up.batched += batched
+    try:
+        yield up
+    except BaseException:
+        up.errors += 1
+        raise
+    finally:
+        up.seconds += time.perf_counter() - t0
+
+
+def retry(op: str):
+    span = _current.get()
+    if span is not None:
+        span.op(op).retries += 1
+
+
+def cache(name: str, hit: bool):
+    span = _current.get()
+    if span is not None:
+        counts = span.cache.setdefault(name, {"hit": 0, "miss": 0})
+        counts["hit" if hit else "miss"] += 1
+
+
+def error(message: str):
+    """Mark the current tool call as failed (tools return errors rather than raising)."""
+    span = _current.get()
+    if span is not None:
+        span.error = message
+
+
+def output(nbytes: int):
+    span = _current.get()
+    if span is not None:
+        span.output_bytes += nbytes
+
+
+def _finish(span: Span):
+    span.seconds = time.perf_counter() - span._t0
+    with _lock:
+        _recent.append(span)
+        totals = _totals.setdefault(span.tool, {
+            "calls": 0, "errors": 0, "seconds": 0.0, "maxSeconds": 0.0, "upstreamCalls": 0,
+        })
+        totals["calls"] += 1
+        totals["errors"] += span.error is not None
+        totals["seconds"] += span.seconds
+        totals["maxSeconds"] = max(totals["maxSeconds"], span.seconds)
+        totals["upstreamCalls"] += sum(up.calls for up in span.upstream.values())
+    if TRACE_LOG:
+        _log(span)
+
+
+def _log(span: Span):
+    line = json.dumps(span.to_dict(), default=str)
+    try:
+        if TRACE_LOG == "stderr":
+            print(line, file=sys.stderr, flush=True)
+        else:
+            with open(TRACE_LOG, "a") as f:
+                f.write(line + "\n")
+    except OSError:
+        pass  # tracing must never break a tool call
+
+
+def traced(fn):
+    """Run an async MCP tool inside its own span."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        span = Span(fn.__name__)
+        token = _current.set(span)
+        try:
+            return await fn(*args, **kwargs)
+        except BaseException as e:
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            _finish(span)
+    return wrapper
+
+
+def snapshot(limit: int = 10) -> dict:
+    """Per-tool aggregates plus the most recent spans, newest first."""
+    with _lock:
+        tools = {
+            name: {**t, "meanSeconds": round(t["seconds"] / t["calls"], 4), "seconds": round(t["seconds"], 4),
+                   "maxSeconds": round(t["maxSeconds"], 4)}
+            for name, t in _totals.items()
+        }
+        recent = [s.to_dict() for s in list(_recent)[::-1][:limit]]
+    return {"tools": tools, "recent": recent}
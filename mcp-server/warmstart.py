@@ -0,0 +1,100 @@
+"""Warm-start snapshot: carry each database's caches across server restarts.
+
+Claude Desktop starts a fresh stdio server for many sessions, and without this
+every first call pays for authentication, the Device/User/Rule fetch and the
+OData downloads again. The snapshot holds, per database:
+
+- the Geotab session (user, database, session id, server; never the password)
+- the cached reference entities and their expiry
+- ODataClient query results that are unexpired, or that carry an ETag/Last-Modified
+  to revalidate them with
+- the RiskEngine accumulators, including its ExceptionEvent feed version
+
+The file (MCP_WARM_START_FILE, default ~/.cache/geoff-mcp/warm-start.pickle;
+set it empty to disable) is a pickle of {database: bytes}. Each database's
+bytes are only unpickled when that database is first used. It is rewritten
+atomically (temp file + os.replace, mode 0600) at most every
+WARM_START_INTERVAL_SECONDS while serving, and on shutdown. An unreadable or
+outdated file is ignored. The session id is a credential, so the file must
+stay private to the user running the server.
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import tracing
+
+WARM_START_FILE = os.getenv("MCP_WARM_START_FILE", os.path.expanduser("~/.cache/geoff-mcp/warm-start.pickle"))
+WARM_START_INTERVAL_SECONDS = float(os.getenv("MCP_WARM_START_INTERVAL_SECONDS", "60"))
+FORMAT_VERSION = 4  # 3: OData cache entries carry validators; 4: RiskEngine feed version
+
+
+class WarmStart:
+    def __init__(self, path: str = WARM_START_FILE, interval: float = WARM_START_INTERVAL_SECONDS):
+        self.path = path
+        self.interval = interval
+        self._sections: dict[str, bytes] | None = None  # database -> pickled state, read on first use
+        self._saved = time.monotonic()
+
+    def _load(self) -> dict[str, bytes]:
+        if self._sections is None:
+            self._sections = {}
+            try:
+                with open(self.path, "rb") as f:
+                    data = pickle.load(f)
+                if data.get("version") == FORMAT_VERSION:
+                    self._sections = data["tenants"]
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"[warm-start] ignoring {self.path}: {e}", file=sys.stderr)
+        return self._sections
+
+    def restore(self, database: str) -> dict | None:
+        """The saved state for `database`, or None."""
+        blob = self._load().get(database)
+        if blob is None:
+            return None
+        with tracing.phase("warm_start"):
+            try:
+                return pickle.loads(blob)
+            except Exception as e:
+                print(f"[warm-start] ignoring saved state for {database}: {e}", file=sys.stderr)
+                return None
+
+    def stash(self, database: str, state: dict):
+        """Keep a closed tenant's state for the next save."""
+        self._load()[database] = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def due(self) -> bool:
+        return time.monotonic() - self._saved >= self.interval
+
+    def dump(self, states: dict[str, dict]) -> bytes:
+        """Serialize open tenants' states (on the event loop, so nothing mutates them meanwhile);
+        databases not open in this process keep their saved sections."""
+        for database, state in states.items():
+            self.stash(database, state)
+        self._saved = time.monotonic()
+        return pickle.dumps({"version": FORMAT_VERSION, "saved": time.time(), "tenants": dict(self._load())},
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    def write(self, blob: bytes):
+        """Atomically replace the snapshot file (safe to run in a thread)."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".warm-start-")  # created 0600
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise